@@ -0,0 +1,34 @@
+class Breakpoint:
+    """A breakpoint on a 1-based line, with an optional condition and hit count.
+
+    The condition is compiled once and raises SyntaxError if it is not a valid expression.
+    With a hit count the breakpoint only fires from the hit_count-th time its condition holds.
+    """
+
+    def __init__(self, lineno, condition=None, hit_count=None):
+        self.lineno = lineno
+        self.condition = condition or None
+        self.code = compile(condition, "<breakpoint>", "eval") if condition else None
+        self.hit_count = hit_count
+        self.hits = 0
+
+    def should_stop(self, frame):
+        """Counts a hit of the breakpoint's line in `frame` and tells whether the run should stop there."""
+        if self.code is not None:
+            try:
+                if not eval(self.code, frame.f_globals, frame.f_locals):
+                    return False
+            except Exception:
+                # Like pdb, stop when the condition cannot be evaluated so the user can see why
+                pass
+        self.hits += 1
+        return self.hit_count is None or self.hits >= self.hit_count
+
+    @property
+    def description(self):
+        parts = []
+        if self.condition:
+            parts.append(f"when {self.condition}")
+        if self.hit_count is not None:
+            parts.append(f"from hit {self.hit_count}")
+        return ", ".join(parts)
@@ -0,0 +1,159 @@
+# This Python file uses the following encoding: utf-8
+import os
+
+from PySide6 import QtGui
+from PySide6.QtCore import Qt
+from PySide6.QtWidgets import (QApplication, QWidget, QGroupBox, QVBoxLayout, QHBoxLayout, QPlainTextEdit,
+                               QTreeWidget, QTreeWidgetItem, QPushButton, QLabel, QSplitter, QTextEdit, QCheckBox)
+
+import syntax
+from steptrace import TraceCursor
+from tracediff import TraceDiff
+
+
+class DiffPane(QGroupBox):
+    """The code, variables and output of one of the compared runs at a step."""
+
+    def __init__(self, trace, parent=None):
+        super().__init__(os.path.basename(trace.file_name), parent)
+        self.cursor = TraceCursor(trace)
+        self.lineColor = QApplication.palette().color(QtGui.QPalette.Active, QtGui.QPalette.Highlight)
+        self.lineColor.setAlpha(75)
+        self.differColor = QtGui.QColor(200, 30, 30, 60)
+
+        self.code = QPlainTextEdit(self)
+        self.code.setReadOnly(True)
+        self.code.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.code.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        self.code.setPlainText("".join(trace.source))
+        syntax.PythonHighlighter(self.code.document(),
+                                 QApplication.palette().color(QtGui.QPalette.Active, QtGui.QPalette.Text))
+        self.variables = QTreeWidget(self)
+        self.variables.setHeaderLabels(["Variable", "Value"])
+        self.variables.setRootIsDecorated(False)
+        self.output = QPlainTextEdit(self)
+        self.output.setReadOnly(True)
+        self.output.setFont(self.code.font())
+
+        splitter = QSplitter(Qt.Vertical, self)
+        splitter.addWidget(self.code)
+        splitter.addWidget(self.variables)
+        splitter.addWidget(self.output)
+        splitter.setSizes([400, 150, 120])
+        layout = QVBoxLayout(self)
+        layout.addWidget(splitter)
+
+    def show_step(self, step, differs, other_variables):
+        self.cursor.seek(step)
+        line = self.cursor.current_line
+        selections = []
+        if line >= 0:
+            selection = QTextEdit.ExtraSelection()
+            selection.format.setBackground(self.differColor if differs else self.lineColor)
+            selection.format.setProperty(QtGui.QTextFormat.FullWidthSelection, True)
+            selection.cursor = QtGui.QTextCursor(self.code.document().findBlockByNumber(line))
+            selections.append(selection)
+            self.code.setTextCursor(selection.cursor)
+            self.code.centerCursor()
+        self.code.setExtraSelections(selections)
+
+        self.variables.clear()
+        items = []
+        for name, value in self.cursor.variables.items():
+            item = QTreeWidgetItem([name, value])
+            if other_variables.get(name) != value:
+                for column in range(2):
+                    item.setBackground(column, self.differColor)
+            items.append(item)
+        self.variables.addTopLevelItems(items)
+        self.output.setPlainText("".join(self.cursor.output))
+        self.output.moveCursor(QtGui.QTextCursor.End)
+
+
+class DiffWindow(QWidget):
+    """Two runs side by side, opened at the step where they first diverge.
+
+    The left run is stepped; the right one follows to the step aligned with it.
+    """
+
+    def __init__(self, trace_diff, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Compare Runs - Beginner Python Visualizer")
+        self.resize(1100, 750)
+        self.set_diff(trace_diff)
+        self.step = 0
+
+        self.pane_a = DiffPane(trace_diff.a.trace, self)
+        self.pane_b = DiffPane(trace_diff.b.trace, self)
+        panes = QHBoxLayout()
+        panes.addWidget(self.pane_a)
+        panes.addWidget(self.pane_b)
+
+        self.first_button = QPushButton("First Divergence", self)
+        self.first_button.clicked.connect(self.go_to_divergence)
+        self.back_button = QPushButton("◀ Step", self)
+        self.back_button.setShortcut(Qt.Key_Left)
+        self.back_button.clicked.connect(lambda: self.show_step(self.step - 1))
+        self.forward_button = QPushButton("Step ▶", self)
+        self.forward_button.setShortcut(Qt.Key_Right)
+        self.forward_button.clicked.connect(lambda: self.show_step(self.step + 1))
+        self.next_button = QPushButton("Next Difference", self)
+        self.next_button.clicked.connect(self.next_difference)
+        self.ignore_lines = QCheckBox("Ignore Line Numbers", self)
+        self.ignore_lines.setToolTip("Only compare variables and output, for two different scripts")
+        self.ignore_lines.setChecked(not trace_diff.a.compare_lines)
+        self.ignore_lines.toggled.connect(self.compare_lines)
+        self.position = QLabel(self)
+        controls = QHBoxLayout()
+        for widget in (self.first_button, self.back_button, self.forward_button, self.next_button, self.ignore_lines):
+            controls.addWidget(widget)
+        controls.addWidget(self.position, 1)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(panes)
+        layout.addLayout(controls)
+        self.go_to_divergence()
+
+    def set_diff(self, trace_diff):
+        self.diff = trace_diff
+        self.segments = trace_diff.step_alignment()
+        self.step_count = len(trace_diff.a.step_ends)
+
+    def compare_lines(self, ignore):
+        self.set_diff(TraceDiff(self.diff.a.trace, self.diff.b.trace, compare_lines=not ignore))
+        self.go_to_divergence()
+
+    def segment_of(self, step):
+        for segment in self.segments:
+            if segment[1] <= step < segment[2]:
+                return segment
+        return None
+
+    def go_to_divergence(self):
+        divergence = self.diff.first_divergence()
+        self.show_step(divergence[0] if divergence is not None else 0)
+
+    def next_difference(self):
+        for tag, a_start, a_end, b_start, b_end in self.segments:
+            if tag == "differ" and a_start > self.step:
+                self.show_step(a_start)
+                return
+
+    def show_step(self, step):
+        if not self.step_count:
+            self.position.setText("The first run has no steps")
+            return
+        self.step = max(0, min(step, self.step_count - 1))
+        segment = self.segment_of(self.step)
+        differs = segment is None or segment[0] == "differ"
+        step_b = self.diff.aligned_step(self.step)
+        self.pane_a.cursor.seek(self.step)
+        self.pane_b.cursor.seek(step_b)
+        self.pane_a.show_step(self.step, differs, self.pane_b.cursor.variables)
+        self.pane_b.show_step(step_b, differs, self.pane_a.cursor.variables)
+        self.back_button.setEnabled(self.step > 0)
+        self.forward_button.setEnabled(self.step < self.step_count - 1)
+        self.next_button.setEnabled(any(tag == "differ" and a_start > self.step
+                                        for tag, a_start, *_ in self.segments))
+        state = "differ" if differs else "are equal"
+        self.position.setText(f"Step {self.step + 1} of {self.step_count} (right: step {step_b + 1}) - the runs {state}")
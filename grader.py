@@ -0,0 +1,273 @@
+# This Python file uses the following encoding: utf-8
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from multiprocessing.connection import wait
+
+from objectgraph import shown_names
+from steplogger import StepLoggerThread, RunLimits, StopRun, record_run
+from steptrace import OUTPUT
+from watches import format_value
+
+DEFAULT_LIMITS = RunLimits(max_steps=1_000_000, max_wall_time=5, max_memory=256 * 2 ** 20)
+# How long a submission may run past its time limit before its worker process is killed, in seconds.
+# The limit normally stops it, but not while it is blocked in C code, such as a long time.sleep().
+KILL_GRACE_TIME = 5
+
+
+class OutputDiverged(StopRun):
+    pass
+
+
+class OutputChecker:
+    """A stdout replacement that compares everything written with the expected output as it is written.
+
+    At the first character that differs, it records where the run was and ends the run with
+    OutputDiverged, so a wrong submission only runs up to its first wrong output.
+    """
+
+    def __init__(self, expected, thread):
+        self.expected = expected
+        self.thread = thread
+        self.position = 0
+        # The output written so far on the current line
+        self.line = ""
+        self.divergence = None
+
+    def write(self, text):
+        text = str(text)
+        # Only the output of the program is compared, not the message of a limit written after the run
+        if self.divergence is not None or sys.gettrace() is None:
+            return
+        end = self.position + len(text)
+        if self.expected.startswith(text, self.position):
+            self.position = end
+            self.line = (self.line + text).rsplit("\n", 1)[-1]
+            return
+        common = 0
+        while self.expected[self.position + common:self.position + common + 1] == text[common]:
+            common += 1
+        actual = (self.line + text).split("\n")[text.count("\n", 0, common)]
+        self.record(self.position + common, actual)
+        raise OutputDiverged(f"Stopped: output differs from the expected output at line {self.divergence['output_line']}")
+
+    def flush(self):
+        pass
+
+    def finish(self):
+        """Checks that nothing but whitespace of the expected output is missing once the run is over."""
+        if self.divergence is None and self.expected[self.position:].strip():
+            self.record(self.position, self.line)
+
+    def record(self, position, actual):
+        thread = self.thread
+        trace = thread.trace
+        step_logger = thread.step_logger
+        step = trace.step_count
+        frame = sys._getframe(1)
+        while frame is not None and not step_logger.is_visualized(frame):
+            frame = frame.f_back
+        if frame is not None:
+            # The live variables of the program: the trace shows them out of scope while print() runs
+            variables = {name: format_value(value) for name, value in shown_names(frame.f_locals).items()}
+            # The line that printed, not the last line of a function it called first
+            lineno = frame.f_lineno
+        else:
+            history = trace.history
+            variables = {name: history.value_at(name, step) for name in history.names()}
+            # The last line of the thread that wrote the output
+            state = step_logger.thread_state()
+            lineno = state.last_line if state.last_line is not None else state.heatmap.current_line
+        output_line = self.expected.count("\n", 0, position)
+        expected_lines = self.expected.split("\n")
+        self.divergence = {
+            "output_line": output_line + 1,
+            "expected": expected_lines[output_line] if output_line < len(expected_lines) else "",
+            "actual": actual,
+            "step": step,
+            "line": lineno,
+            "code": trace.source[lineno - 1].strip() if 0 < lineno <= len(trace.source) else "",
+            "variables": {name: value for name, value in variables.items() if value is not None},
+        }
+
+
+def expected_output(reference, inputs=(), limits=DEFAULT_LIMITS):
+    """The output of a reference script, or the contents of an expected-output file."""
+    if not reference.endswith(".py"):
+        with open(reference, encoding="utf-8") as f:
+            return f.read()
+    trace = record_run(reference, inputs, limits)
+    if trace.error_message:
+        raise RuntimeError(f"The reference {reference} failed: {trace.error_message.strip().splitlines()[-1]}")
+    kinds, first, strings = trace.events.kinds, trace.events.first, trace.events.strings
+    return "".join(strings[first[index]] for index in range(len(kinds)) if kinds[index] == OUTPUT)
+
+
+def grade(path, expected, inputs=(), limits=DEFAULT_LIMITS) -> dict:
+    """Runs one submission and compares its output with the expected output while it runs."""
+    thread = StepLoggerThread(None)
+    thread.set_test_file(path)
+    thread.set_inputs(inputs)
+    thread.limits = limits
+    thread.free_run = True
+    checker = OutputChecker(expected, thread)
+    thread.stream_out = checker
+    try:
+        thread.run()
+    except OutputDiverged:
+        pass
+    trace = thread.trace
+    error = trace.error_message
+    if checker.divergence is None and not error:
+        checker.finish()
+    if checker.divergence is not None:
+        status = "wrong output"
+    elif error:
+        status = "limit" if error.startswith("Stopped: ") else "error"
+    else:
+        status = "pass"
+    return {
+        "submission": path,
+        "status": status,
+        "steps": trace.step_count,
+        "error": None if status == "wrong output" or not error else error.strip().splitlines()[-1],
+        "divergence": checker.divergence,
+    }
+
+
+def grade_worker(connection, expected, inputs, limits):
+    """A worker process of grade_all: grades the submissions it is sent, one at a time, until it is killed."""
+    # Ready for the first one
+    connection.send(None)
+    while True:
+        connection.send(grade(connection.recv(), expected, inputs, limits))
+
+
+class GradingWorker:
+    """A worker process of grade_all, and the submission it is grading."""
+
+    def __init__(self, context, expected, inputs, limits):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=grade_worker, args=(child, expected, inputs, limits), daemon=True)
+        self.process.start()
+        child.close()
+        # The submission it is grading and when it is killed, None while it is starting or idle
+        self.path = None
+        self.deadline = None
+
+    def submit(self, path, timeout):
+        self.connection.send(path)
+        self.path = path
+        self.deadline = time.monotonic() + timeout
+
+    def close(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+def grade_all(expected, paths, inputs=(), limits=DEFAULT_LIMITS, workers=None, timeout=None):
+    """Grades every submission, in parallel across the CPU cores, yielding the results as they finish.
+
+    Each submission runs in a worker process, which is killed and replaced if the submission is still
+    running `timeout` seconds after it started, by default KILL_GRACE_TIME after its time limit.
+    """
+    if timeout is None:
+        timeout = limits.max_wall_time + KILL_GRACE_TIME
+    context = multiprocessing.get_context("spawn")
+    pending = list(reversed(paths))
+    workers = [GradingWorker(context, expected, inputs, limits)
+               for _ in range(min(workers or os.cpu_count() or 1, len(paths)))]
+
+    def replace(worker):
+        worker.close()
+        workers[workers.index(worker)] = GradingWorker(context, expected, inputs, limits)
+
+    try:
+        while pending or any(worker.path is not None for worker in workers):
+            # Infinite without a time limit
+            deadline = min((worker.deadline for worker in workers if worker.path is not None), default=float("inf"))
+            ready = wait([worker.connection for worker in workers],
+                         max(0.0, deadline - time.monotonic()) if deadline != float("inf") else None)
+            for worker in list(workers):
+                if worker.connection in ready:
+                    try:
+                        # None once a new worker is ready
+                        result = worker.connection.recv()
+                    except EOFError:
+                        if worker.path is None:
+                            raise RuntimeError(f"A worker process of the grader ended with exit code "
+                                               f"{worker.process.exitcode} before it started grading")
+                        # For example killed by the system when it ran out of memory
+                        result = failed(worker.path, "error",
+                                        f"The worker process ended with exit code {worker.process.exitcode}")
+                        replace(worker)
+                    else:
+                        worker.path = worker.deadline = None
+                        if pending:
+                            worker.submit(pending.pop(), timeout)
+                    if result is not None:
+                        yield result
+                elif worker.path is not None and time.monotonic() >= worker.deadline:
+                    yield failed(worker.path, "limit", f"Stopped: still running {timeout:g}s after it started")
+                    replace(worker)
+    finally:
+        for worker in workers:
+            worker.close()
+
+
+def failed(path, status, error) -> dict:
+    """The result of a submission whose worker process had to be killed or died, so its run is lost."""
+    return {"submission": path, "status": status, "steps": None, "error": error, "divergence": None}
+
+
+def describe(result) -> str:
+    name = os.path.basename(result["submission"])
+    if result["status"] == "pass":
+        return f"{name}: pass ({result['steps']} steps)"
+    if result["status"] != "wrong output":
+        return f"{name}: {result['status']}: {result['error']}"
+    divergence = result["divergence"]
+    variables = ", ".join(f"{name} = {value}" for name, value in divergence["variables"].items())
+    return (f"{name}: wrong output at output line {divergence['output_line']}\n"
+            f"    expected: {divergence['expected']!r}\n"
+            f"    actual:   {divergence['actual']!r}\n"
+            f"    at step {divergence['step']}, line {divergence['line']}: {divergence['code']}\n"
+            f"    variables: {variables or 'none'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grade a folder of submissions against a reference script or its expected output")
+    parser.add_argument('reference', help="Reference solution (.py), or a text file with the expected output")
+    parser.add_argument('submissions', help="Folder of submitted .py files")
+    parser.add_argument('-i', '--input', action='store', help="Answers for input() of every run, one per line")
+    parser.add_argument('-w', '--workers', action='store', type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument('--max-steps', action='store', type=int, default=DEFAULT_LIMITS.max_steps,
+                        help=f"Stop a submission after this many steps (default: {DEFAULT_LIMITS.max_steps})")
+    parser.add_argument('--max-time', action='store', type=float, default=DEFAULT_LIMITS.max_wall_time,
+                        help=f"Stop a submission after this many seconds (default: {DEFAULT_LIMITS.max_wall_time:g})")
+    parser.add_argument('--json', action='store', metavar='FILE', help="Also write the results to FILE as JSON")
+    args = parser.parse_args()
+
+    inputs = []
+    if args.input:
+        with open(args.input) as f:
+            inputs = [line.rstrip("\r\n") for line in f]
+    limits = RunLimits(args.max_steps, args.max_time, max_memory=DEFAULT_LIMITS.max_memory)
+    expected = expected_output(args.reference, inputs, limits)
+    paths = sorted(glob.glob(os.path.join(args.submissions, "*.py")))
+    results = []
+    for result in grade_all(expected, paths, inputs, limits, args.workers):
+        print(describe(result), flush=True)
+        results.append(result)
+    results.sort(key=lambda result: result["submission"])
+    passed = sum(result["status"] == "pass" for result in results)
+    print(f"{passed} of {len(results)} submissions passed")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
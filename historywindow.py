@@ -0,0 +1,78 @@
+# This Python file uses the following encoding: utf-8
+from PySide6 import QtCore
+from PySide6.QtCore import Qt
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QTreeWidget, QTreeWidgetItem, QPushButton, QLabel
+
+
+class HistoryWindow(QWidget):
+    """Every change of one variable in a run, with the step and line that made it.
+
+    Rows are only appended while the run goes on, read from the trace's VariableHistory.
+    """
+    stepSelected = QtCore.Signal(int, int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent, Qt.Tool)
+        self.resize(420, 320)
+        self.trace = None
+        self.name = None
+        self.shown = 0
+
+        self.changes = QTreeWidget(self)
+        self.changes.setHeaderLabels(["Step", "Line", "Value"])
+        self.changes.setRootIsDecorated(False)
+        self.changes.setColumnWidth(0, 70)
+        self.changes.setColumnWidth(1, 50)
+        self.changes.itemDoubleClicked.connect(lambda item: self.select_step(item.data(0, Qt.UserRole)))
+        self.summary = QLabel(self)
+        self.last_button = QPushButton("Go to Last Change", self)
+        self.last_button.clicked.connect(self.go_to_last_change)
+        controls = QHBoxLayout()
+        controls.addWidget(self.summary, 1)
+        controls.addWidget(self.last_button)
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.changes)
+        layout.addLayout(controls)
+
+    def show_variable(self, trace, name):
+        self.trace = trace
+        self.name = name
+        self.shown = 0
+        self.changes.clear()
+        self.setWindowTitle(f"History of {name}")
+        self.refresh()
+        self.show()
+        self.raise_()
+
+    def refresh(self):
+        """Adds the changes made since the last refresh."""
+        if self.trace is None:
+            return
+        history = self.trace.history
+        changes = history.changes(self.name)
+        items = []
+        for step, value in changes[self.shown:]:
+            # A change made before the current step ended has no line yet
+            line = str(self.trace.line_of(step) + 1) if step < len(self.trace.step_ends) else ""
+            item = QTreeWidgetItem([str(step + 1), line, "(out of scope)" if value is None else value])
+            item.setData(0, Qt.UserRole, step)
+            items.append(item)
+        self.changes.addTopLevelItems(items)
+        self.shown = len(changes)
+        last = history.last_change(self.name, len(self.trace.step_ends))
+        self.summary.setText(f"{len(changes)} changes" + (f", last at step {last + 1}" if last is not None else ""))
+        self.last_button.setEnabled(self.last_finished_change() is not None)
+
+    def last_finished_change(self):
+        """The last change made by a step that ended, so that it has a line to go to."""
+        return self.trace.history.last_change(self.name, len(self.trace.step_ends) - 1)
+
+    def go_to_last_change(self):
+        last = self.last_finished_change()
+        if last is not None:
+            self.select_step(last)
+
+    def select_step(self, step):
+        if step < len(self.trace.step_ends):
+            self.changes.setCurrentItem(self.changes.topLevelItem(self.trace.history.change_index(self.name, step)))
+            self.stepSelected.emit(step, self.trace.line_of(step))
@@ -0,0 +1,233 @@
+# This Python file uses the following encoding: utf-8
+import argparse
+import html
+import sys
+
+from steptrace import Trace
+
+# The page is written in three parts so the trace can be streamed into the middle of it:
+# _HEAD, then the trace as JSON, then _TAIL with the player.
+_HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title} - Beginner Python Visualizer</title>
+<style>
+body {{ font-family: sans-serif; margin: 12px; background: #fff; color: #080808; }}
+.panes {{ display: flex; gap: 12px; }}
+fieldset {{ flex: 1; min-width: 0; border: 1px solid #ccc; }}
+.code {{ height: 50vh; overflow: auto; font-family: "Courier New", monospace; }}
+.code table {{ border-collapse: collapse; width: 100%; }}
+.code td {{ white-space: pre; padding: 0 6px; }}
+.code td.lineno {{ text-align: right; color: #888; width: 40px; user-select: none; }}
+.code tr.current {{ background: rgba(38, 117, 191, 0.3); }}
+.replaced {{ color: #c83232; background: rgba(200, 50, 50, 0.12); font-weight: bold; }}
+.controls {{ display: flex; gap: 6px; align-items: center; justify-content: center; margin: 10px 0; }}
+.controls input[type=range] {{ width: 40%; }}
+#console {{ height: 160px; overflow: auto; margin: 0; font-family: "Courier New", monospace; }}
+#variables {{ width: 280px; flex: none; }}
+#variables table {{ width: 100%; border-collapse: collapse; }}
+#variables td, #variables th {{ text-align: left; padding: 0 4px; }}
+</style>
+</head>
+<body>
+<div class="panes">
+<fieldset><legend>Interpreted Code</legend><div class="code" id="interpreted"></div></fieldset>
+<fieldset><legend>Original Code</legend><div class="code" id="actual"></div></fieldset>
+</div>
+<div class="controls">
+<button id="first" title="First step (Home)">&#x23EE;</button>
+<button id="back" title="Previous step (Left)">&#x23F4;</button>
+<input type="range" id="scrubber" min="0" value="0">
+<button id="forward" title="Next step (Right)">&#x23F5;</button>
+<button id="last" title="Last step (End)">&#x23ED;</button>
+<span id="position"></span>
+</div>
+<div class="panes">
+<fieldset><legend>Output</legend><pre id="console"></pre></fieldset>
+<fieldset id="variables"><legend>Variables in Scope</legend>
+<table><thead><tr><th>Variable</th><th>Value</th></tr></thead><tbody></tbody></table></fieldset>
+</div>
+<script type="application/json" id="trace">
+"""
+
+_TAIL = r"""</script>
+<script>
+"use strict";
+const LINE = 0, UPDATE = 1, VARIABLE = 2, OUTPUT = 3, GO_TO = 4;
+const KEYFRAME_INTERVAL = 256;
+const trace = JSON.parse(document.getElementById("trace").textContent);
+const events = trace.events;
+const stepEnds = [];
+for (let i = 0; i < events.length; i++) {
+  if (events[i][0] === LINE) stepEnds.push(i);
+}
+
+function escapeCode(text) {
+  const escaped = text.replace(/\n$/, "").replace(/&/g, "&amp;").replace(/</g, "&lt;").replace(/>/g, "&gt;");
+  return escaped.replace(/\u200A(.*?)\u200A/g, '<span class="replaced">$1</span>');
+}
+
+function buildPane(id) {
+  const table = document.createElement("table");
+  trace.source.forEach((line, i) => {
+    const row = table.insertRow();
+    row.insertCell().textContent = i + 1;
+    row.cells[0].className = "lineno";
+    row.insertCell().innerHTML = escapeCode(line.replace(/\t/g, "  "));
+  });
+  document.getElementById(id).appendChild(table);
+  return table;
+}
+
+const interpretedPane = buildPane("interpreted");
+const actualPane = buildPane("actual");
+const consoleView = document.getElementById("console");
+const variablesView = document.querySelector("#variables tbody");
+const scrubber = document.getElementById("scrubber");
+const position = document.getElementById("position");
+scrubber.max = Math.max(0, stepEnds.length - 1);
+
+// State after applying events[0..applied]. Keyframes are snapshots taken every KEYFRAME_INTERVAL
+// steps so that stepping back only replays a bounded number of events.
+const output = [];
+let state = {lines: trace.source.slice(), vars: new Map(), outputLength: 0, current: -1, step: -1, applied: -1};
+const keyframes = [];
+const rendered = trace.source.slice();
+let renderedCurrent = -1;
+
+function snapshot(s) {
+  return {lines: s.lines.slice(), vars: new Map(s.vars), outputLength: s.outputLength,
+          current: s.current, step: s.step, applied: s.applied};
+}
+
+function applyUntil(target) {
+  while (state.applied < target) {
+    const event = events[++state.applied];
+    switch (event[0]) {
+      case LINE:
+        state.current = event[1];
+        state.step++;
+        if (state.step % KEYFRAME_INTERVAL === 0 && keyframes.length === state.step / KEYFRAME_INTERVAL) {
+          keyframes.push(snapshot(state));
+        }
+        break;
+      case GO_TO:
+        state.current = event[1];
+        break;
+      case UPDATE:
+        state.lines[event[1]] = event[2];
+        break;
+      case VARIABLE:
+        if (event[2] === null) state.vars.delete(event[1]); else state.vars.set(event[1], event[2]);
+        break;
+      case OUTPUT:
+        output.length = state.outputLength;
+        output.push(event[1]);
+        state.outputLength++;
+        break;
+    }
+  }
+}
+
+function seek(step) {
+  if (stepEnds.length === 0) return;
+  step = Math.max(0, Math.min(step, stepEnds.length - 1));
+  const target = stepEnds[step];
+  if (target < state.applied) {
+    state = snapshot(keyframes[Math.floor(step / KEYFRAME_INTERVAL)]);
+  }
+  applyUntil(target);
+  render();
+}
+
+function setCurrent(table, line) {
+  if (renderedCurrent >= 0 && renderedCurrent < table.rows.length) table.rows[renderedCurrent].className = "";
+  if (line >= 0 && line < table.rows.length) {
+    table.rows[line].className = "current";
+    table.rows[line].scrollIntoView({block: "nearest"});
+  }
+}
+
+function render() {
+  for (let i = 0; i < state.lines.length; i++) {
+    if (rendered[i] !== state.lines[i]) {
+      rendered[i] = state.lines[i];
+      interpretedPane.rows[i].cells[1].innerHTML = escapeCode(rendered[i].replace(/\t/g, "  "));
+    }
+  }
+  setCurrent(interpretedPane, state.current);
+  setCurrent(actualPane, state.current);
+  renderedCurrent = state.current;
+  variablesView.replaceChildren();
+  for (const [name, value] of state.vars) {
+    const row = variablesView.insertRow();
+    row.insertCell().textContent = name;
+    row.insertCell().textContent = value;
+  }
+  consoleView.textContent = output.slice(0, state.outputLength).filter(text => text.trim() !== "").join("\n");
+  consoleView.scrollTop = consoleView.scrollHeight;
+  scrubber.value = state.step;
+  position.textContent = `Step ${state.step + 1} / ${stepEnds.length}`;
+}
+
+document.getElementById("first").onclick = () => seek(0);
+document.getElementById("back").onclick = () => seek(state.step - 1);
+document.getElementById("forward").onclick = () => seek(state.step + 1);
+document.getElementById("last").onclick = () => seek(stepEnds.length - 1);
+scrubber.oninput = () => seek(Number(scrubber.value));
+document.addEventListener("keydown", event => {
+  if (event.key === "ArrowLeft") seek(state.step - 1);
+  else if (event.key === "ArrowRight") seek(state.step + 1);
+  else if (event.key === "Home") seek(0);
+  else if (event.key === "End") seek(stepEnds.length - 1);
+  else return;
+  event.preventDefault();
+});
+seek(0);
+</script>
+</body>
+</html>
+"""
+
+
+class _ScriptSafeWriter:
+    """Escapes `</` so the embedded JSON cannot close its <script> element early."""
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, text):
+        self.f.write(text.replace("</", "<\\/"))
+
+
+def export_html(trace, path):
+    """Writes a recorded run as a single self-contained HTML page with a step-by-step player."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(_HEAD.format(title=html.escape(trace.file_name.split('/')[-1])))
+        trace.write_json(_ScriptSafeWriter(f))
+        f.write(_TAIL)
+
+
+if __name__ == "__main__":
+    from steplogger import record_run
+
+    parser = argparse.ArgumentParser(description="Export a run of a Python script as a static HTML player")
+    parser.add_argument('file', help="Python script to run, or a trace (.json) saved from a previous run")
+    parser.add_argument('-o', '--output', action='store', help="HTML file to write (default: FILE with .html)")
+    parser.add_argument('-i', '--input', action='store', help="Answers for input(), one per line")
+    args = parser.parse_args()
+
+    if args.file.endswith(".json"):
+        run_trace = Trace.load(args.file)
+    else:
+        inputs = []
+        if args.input:
+            with open(args.input) as f:
+                inputs = [line.rstrip("\r\n") for line in f]
+        run_trace = record_run(args.file, inputs)
+        if run_trace.error_message:
+            print(run_trace.error_message, file=sys.stderr)
+    output_path = args.output or args.file.rsplit('.', 1)[0] + ".html"
+    export_html(run_trace, output_path)
+    print(f"Exported {run_trace.step_count} steps to {output_path}", file=sys.stderr)
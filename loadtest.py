@@ -0,0 +1,113 @@
+# This Python file uses the following encoding: utf-8
+import argparse
+import asyncio
+import json
+import time
+
+from server import STREAM_LIMIT, VisualizerServer
+
+
+class Client:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.request_ids = 0
+
+    @classmethod
+    async def connect(cls, host, port):
+        return cls(*await asyncio.open_connection(host, port, limit=STREAM_LIMIT))
+
+    async def request(self, op, **kwargs):
+        """Sends a request and returns its final response, skipping streamed partial ones."""
+        self.request_ids += 1
+        self.writer.write(json.dumps({"id": self.request_ids, "op": op, **kwargs}).encode() + b"\n")
+        await self.writer.drain()
+        while True:
+            response = json.loads(await self.reader.readline())
+            if response.get("error") is not None:
+                raise RuntimeError(response["error"])
+            if op != "continue" or response.get("done"):
+                return response
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def run_session(args, index, source, latencies):
+    """One client, from connecting to stopping its session.
+
+    Unless the recording is shared, every session uploads its own copy of the script, so the server records
+    a run for each one as it would for the code of different users.
+    """
+    session_start = time.perf_counter()
+    client = await Client.connect(args.host, args.port)
+    try:
+        if args.shared_recording:
+            session = (await client.request("start", file=args.file))["session"]
+        else:
+            session = (await client.request("start", source=f"{source}\n# session {index}\n"))["session"]
+        for step in range(args.steps):
+            start = time.perf_counter()
+            await client.request("step", session=session)
+            latencies["step"].append(time.perf_counter() - start)
+            if step == 0:
+                # Includes waiting for a worker and recording the run
+                latencies["first step"].append(start - session_start + latencies["step"][-1])
+        await client.request("seek", session=session, step=0)
+        await client.request("continue", session=session)
+        await client.request("stop", session=session)
+    finally:
+        await client.close()
+    latencies["session"].append(time.perf_counter() - session_start)
+
+
+def percentile(sorted_values, percent):
+    return sorted_values[min(len(sorted_values) - 1, len(sorted_values) * percent // 100)]
+
+
+async def main(args):
+    server = None
+    listener = None
+    if args.start_server:
+        server = VisualizerServer(args.workers)
+        listener = await server.serve(args.host, args.port)
+    try:
+        with open(args.file, encoding="utf-8") as f:
+            source = f.read()
+        latencies = {"first step": [], "step": [], "session": []}
+        start = time.perf_counter()
+        results = await asyncio.gather(*(run_session(args, index, source, latencies) for index in range(args.sessions)),
+                                       return_exceptions=True)
+        elapsed = time.perf_counter() - start
+        failures = [result for result in results if isinstance(result, Exception)]
+        print(f"{args.sessions} sessions, {len(latencies['step'])} steps in {elapsed:.2f}s, "
+              f"{len(failures)} failed sessions")
+        for name, values in latencies.items():
+            if values:
+                values.sort()
+                print(f"{name} latency: p50={percentile(values, 50) * 1000:.2f}ms "
+                      f"p99={percentile(values, 99) * 1000:.2f}ms max={values[-1] * 1000:.2f}ms")
+        for failure in failures[:5]:
+            print(f"  {failure!r}")
+    finally:
+        if listener is not None:
+            listener.close()
+            await listener.wait_closed()
+            server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate many concurrent sessions against the visualizer server")
+    parser.add_argument('file', help="Python script every session runs")
+    parser.add_argument('--host', action='store', default="127.0.0.1", help="Server address")
+    parser.add_argument('--port', action='store', type=int, default=8765, help="Server port")
+    parser.add_argument('-n', '--sessions', action='store', type=int, default=200, help="Concurrent sessions")
+    parser.add_argument('-s', '--steps', action='store', type=int, default=50, help="Steps per session")
+    parser.add_argument('--shared-recording', action='store_true',
+                        help="Start every session from the same file, so the server records it only once")
+    parser.add_argument('--start-server', action='store_true', help="Start a server in this process first")
+    parser.add_argument('-w', '--workers', action='store', type=int, help="Worker processes of the started server")
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
@@ -1,15 +1,25 @@
 # This Python file uses the following encoding: utf-8
+import os
 import sys
+import time
 import logging
 import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 from PySide6 import QtGui, QtCore
 from PySide6.QtCore import Qt, QSize
-from PySide6.QtGui import QPalette, QIcon
-from PySide6.QtWidgets import QApplication, QMainWindow, QTreeWidgetItem, QTextBrowser, QSizePolicy, QFileDialog
+from PySide6.QtGui import QPalette, QIcon, QAction, QActionGroup, QKeySequence, QShortcut
+from PySide6.QtWidgets import (QApplication, QMainWindow, QTreeWidgetItem, QTextBrowser, QSizePolicy, QFileDialog,
+                               QInputDialog, QLineEdit, QTreeWidget, QMenu, QComboBox)
 
 import syntax
-from steplogger import StepLoggerThread
+from profiler import profiler, process_uptime
+from objectgraph import ObjectGraph, variable_of
+from sourcefile import load_source
+from steplogger import StepLoggerThread, RunLimits, GRANULARITIES, LINE
+from steptrace import TraceCursor, OUTPUT, MAIN_THREAD
+from timeline import TimelineScrubber
 
 # Important:
 # You need to run the following command to generate the ui_form.py file
@@ -17,6 +27,18 @@ from steplogger import StepLoggerThread
 #     pyside2-uic form.ui -o ui_form.py
 from ui_mainwindow import Ui_MainWindow
 
+# Rows of the code panes are added in chunks of at most this many seconds between events
+LOAD_CHUNK_SECONDS = 0.01
+LOAD_CHUNK_ROWS = 256
+# Code widgets of lines further down are only created once they are scrolled into view
+PRELOADED_CODE_LINES = 2000
+# Steps replayed at a time to build the keyframes of a finished run while the GUI is idle
+KEYFRAME_STEPS_PER_EVENT = 1024
+# The Run > Step By menu, in the order of GRANULARITIES
+GRANULARITY_NAMES = ("Expression", "Statement", "Line", "Loop Iteration", "Function Call")
+# File > Compare Run With... runs the other script in a worker process, stopped at these limits
+COMPARE_LIMITS = RunLimits(max_steps=1_000_000, max_wall_time=10, max_memory=512 * 2 ** 20)
+
 
 class MainWindow(QMainWindow):
     lineUpdated = QtCore.Signal(int, str)
@@ -24,82 +46,376 @@ class MainWindow(QMainWindow):
     stdout = QtCore.Signal(str)
     updateVariable = QtCore.Signal(tuple)
     goToLine = QtCore.Signal(int)
+    watchUpdated = QtCore.Signal(int, str)
+    objectGraphUpdated = QtCore.Signal(object)
+    startupFinished = QtCore.Signal()
+    comparisonRecorded = QtCore.Signal(object)
 
     def __init__(self, file_to_visualize=None, parent=None):
         super().__init__(parent)
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
+        # Seconds since process start at which the window first painted and the file became runnable
+        self.first_paint = None
+        self.file_interactive = None
 
         self.run_icon = QIcon()
         self.continue_icon = QIcon()
         self.stop_icon = QIcon()
-        # Check if light or dark mode
-        if QApplication.instance().palette().color(QPalette.Window).lightness() < 128:
-            self.run_icon.addFile(u":/res/icons/play_dark.png", QSize(), QIcon.Normal, QIcon.Off)
-            self.run_icon.addFile(u":/res/icons/play_dark_disabled.png", QSize(), QIcon.Disabled, QIcon.Off)
-            self.continue_icon.addFile(u":/res/icons/continue_dark.png", QSize(), QIcon.Normal, QIcon.Off)
-            self.continue_icon.addFile(u":/res/icons/continue_dark_disabled.png", QSize(), QIcon.Disabled, QIcon.Off)
-            self.stop_icon.addFile(u":/res/icons/stop_dark.png", QSize(), QIcon.Normal, QIcon.Off)
-            self.stop_icon.addFile(u":/res/icons/stop_dark_disabled.png", QSize(), QIcon.Disabled, QIcon.Off)
-        else:
-            self.run_icon.addFile(u":/res/icons/play_light.png", QSize(), QIcon.Normal, QIcon.Off)
-            self.run_icon.addFile(u":/res/icons/play_light_disabled.png", QSize(), QIcon.Disabled, QIcon.Off)
-            self.continue_icon.addFile(u":/res/icons/continue_light.png", QSize(), QIcon.Normal, QIcon.Off)
-            self.continue_icon.addFile(u":/res/icons/continue_light_disabled.png", QSize(), QIcon.Disabled, QIcon.Off)
-            self.stop_icon.addFile(u":/res/icons/stop_light.png", QSize(), QIcon.Normal, QIcon.Off)
-            self.stop_icon.addFile(u":/res/icons/stop_light_disabled.png", QSize(), QIcon.Disabled, QIcon.Off)
-        self.ui.button_start.setIcon(self.run_icon)
-        self.ui.button_stop.setIcon(self.stop_icon)
 
         self.ui.statusbar.showMessage("No file loaded")
         self.ui.button_start.setEnabled(False)
         self.file_to_visualize = file_to_visualize
-        self.load_file()
+        if file_to_visualize:
+            self.ui.statusbar.showMessage(f"Loading file: {file_to_visualize}")
+        self.source = None
+        # Rows of the code panes created so far; code widgets are only created for rows that are shown
+        self.rows_loaded = 0
+        self.browsers_preloaded = 0
+        self.row_loader = QtCore.QTimer(self)
+        self.row_loader.timeout.connect(self.load_rows_chunk)
+        # Lines of the interpreted code rewritten during the current run, and the code they show
+        self.changed_lines = {}
+        # Measured once the window painted, from a code widget like those of the rows
+        self.code_row_height = None
+        for tree in (self.ui.interpretedCode, self.ui.actualCode):
+            tree.setUniformRowHeights(True)
+            tree.verticalScrollBar().valueChanged.connect(lambda _, tree=tree: self.create_visible_code_browsers(tree))
         self.ui.interpretedCode.setColumnWidth(0, 40)
         self.ui.actualCode.setColumnWidth(0, 40)
         self.ui.variables.setColumnWidth(0, 150)
         self.lineColor = QApplication.palette().color(QtGui.QPalette.Active, QtGui.QPalette.Base)
         self.selectedColor = QApplication.palette().color(QtGui.QPalette.Active, QtGui.QPalette.Highlight)
         self.selectedColor.setAlpha(75)
-        self.set_current_line(-1)
+        self.heatColor = QtGui.QColor(255, 80, 0)
+        self.breakpointColor = QtGui.QColor(200, 30, 30)
+        self.heat_colors = []
+        self.current_line = -1
+        self.setup_export_menu()
+        self.setup_run_menu()
         self.lineUpdated.connect(self.update_line)
         self.goToLine.connect(self.set_current_line)
         self.lineFinished.connect(self.line_finished)
         self.stdout.connect(self.print_to_console)
         self.updateVariable.connect(self.update_variable)
+        self.watchUpdated.connect(self.update_watch)
         self.step_logger = StepLoggerThread(self)
+        self.setup_watches()
+        # The tool windows are created when they are first opened
+        self.history_window = None
+        self.memory_window = None
+        # Started by the first comparison
+        self.compare_pool = None
+        self.comparisonRecorded.connect(self.show_comparison)
+        self.ui.variables.itemClicked.connect(self.show_variable_history)
+        self.ui.variables.setToolTip("Click a variable to see its history")
+        self.setup_timeline()
+        self.setup_thread_selector()
         self.step_logger.error.connect(self.print_error)
+        self.step_logger.inputRequested.connect(self.request_input)
+        self.step_logger.breakpointHit.connect(self.breakpoint_hit)
+        self.ui.actualCode.itemClicked.connect(self.gutter_clicked)
+        self.ui.actualCode.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.ui.actualCode.customContextMenuRequested.connect(self.show_gutter_menu)
         self.ui.interpretedCode.verticalScrollBar().valueChanged.connect(
             self.ui.actualCode.verticalScrollBar().setValue)
         self.code_started = False
         self.enable_close_button(True)
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.first_paint is None:
+            self.first_paint = process_uptime()
+            # Everything not needed for the first frame is done once the empty window is on screen
+            QtCore.QTimer.singleShot(0, self.finish_startup)
+
+    def finish_startup(self):
+        sample = self.create_code_browser("")
+        self.code_row_height = sample.height()
+        sample.deleteLater()
+        self.setup_icons()
+        self.load_file()
+        self.file_interactive = process_uptime()
+        self.startupFinished.emit()
+
+    def setup_icons(self):
+        # Check if light or dark mode
+        if QApplication.instance().palette().color(QPalette.Window).lightness() < 128:
+            self.run_icon.addFile(u":/res/icons/play_dark.png", QSize(), QIcon.Normal, QIcon.Off)
+            self.run_icon.addFile(u":/res/icons/play_dark_disabled.png", QSize(), QIcon.Disabled, QIcon.Off)
+            self.continue_icon.addFile(u":/res/icons/continue_dark.png", QSize(), QIcon.Normal, QIcon.Off)
+            self.continue_icon.addFile(u":/res/icons/continue_dark_disabled.png", QSize(), QIcon.Disabled, QIcon.Off)
+            self.stop_icon.addFile(u":/res/icons/stop_dark.png", QSize(), QIcon.Normal, QIcon.Off)
+            self.stop_icon.addFile(u":/res/icons/stop_dark_disabled.png", QSize(), QIcon.Disabled, QIcon.Off)
+        else:
+            self.run_icon.addFile(u":/res/icons/play_light.png", QSize(), QIcon.Normal, QIcon.Off)
+            self.run_icon.addFile(u":/res/icons/play_light_disabled.png", QSize(), QIcon.Disabled, QIcon.Off)
+            self.continue_icon.addFile(u":/res/icons/continue_light.png", QSize(), QIcon.Normal, QIcon.Off)
+            self.continue_icon.addFile(u":/res/icons/continue_light_disabled.png", QSize(), QIcon.Disabled, QIcon.Off)
+            self.stop_icon.addFile(u":/res/icons/stop_light.png", QSize(), QIcon.Normal, QIcon.Off)
+            self.stop_icon.addFile(u":/res/icons/stop_light_disabled.png", QSize(), QIcon.Disabled, QIcon.Off)
+        self.ui.button_start.setIcon(self.continue_icon if self.code_started else self.run_icon)
+        self.ui.button_stop.setIcon(self.stop_icon)
+
+    def setup_watches(self):
+        self.watch_input = QLineEdit(self.ui.groupBox_4)
+        self.watch_input.setPlaceholderText("Add watch, e.g. len(nums)")
+        self.watch_input.returnPressed.connect(self.add_watch)
+        self.ui.gridLayout.addWidget(self.watch_input, 1, 0, 1, 1)
+        self.watch_list = QTreeWidget(self.ui.groupBox_4)
+        self.watch_list.setHeaderLabels(["Watch", "Value"])
+        self.watch_list.setRootIsDecorated(False)
+        self.watch_list.setColumnWidth(0, 150)
+        self.watch_list.setToolTip("Press Delete to remove the selected watch")
+        self.watch_list.verticalScrollBar().valueChanged.connect(self.update_watch_visibility)
+        self.ui.gridLayout.addWidget(self.watch_list, 2, 0, 1, 1)
+        QShortcut(QKeySequence.Delete, self.watch_list, self.remove_watch)
+
+    def add_watch(self):
+        expression = self.watch_input.text().strip()
+        if not expression:
+            return
+        try:
+            watch = self.step_logger.add_watch(expression)
+        except SyntaxError as e:
+            self.ui.statusbar.showMessage(f"Invalid watch expression: {e.msg}", 5000)
+            return
+        item = QTreeWidgetItem()
+        item.setText(0, expression)
+        item.setData(0, Qt.UserRole, watch.watch_id)
+        self.watch_list.addTopLevelItem(item)
+        self.watch_input.clear()
+        self.update_watch_visibility()
+
+    def remove_watch(self):
+        for item in self.watch_list.selectedItems():
+            self.step_logger.remove_watch(item.data(0, Qt.UserRole))
+            self.watch_list.takeTopLevelItem(self.watch_list.indexOfTopLevelItem(item))
+
+    def update_watch_visibility(self):
+        """Only watches scrolled into view are evaluated by the engine."""
+        viewport = self.watch_list.viewport().rect()
+        rows = {}
+        for i in range(self.watch_list.topLevelItemCount()):
+            item = self.watch_list.topLevelItem(i)
+            rows[item.data(0, Qt.UserRole)] = self.watch_list.visualItemRect(item).intersects(viewport)
+        for watch in self.step_logger.watches:
+            watch.visible = rows.get(watch.watch_id, False)
+
+    def update_watch(self, watch_id, value):
+        for i in range(self.watch_list.topLevelItemCount()):
+            item = self.watch_list.topLevelItem(i)
+            if item.data(0, Qt.UserRole) == watch_id:
+                item.setText(1, value)
+                return
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if hasattr(self, "watch_list"):
+            self.update_watch_visibility()
+
+    def setup_timeline(self):
+        self.timeline = TimelineScrubber(self.ui.centralwidget)
+        self.timeline.setEnabled(False)
+        self.timeline.stepSelected.connect(self.request_seek)
+        self.ui.verticalLayout_4.insertWidget(1, self.timeline)
+        # Replays the last run once it finished, to show any step of it
+        self.trace_cursor = None
+        # Output chunks of the trace shown in the console after seeking
+        self.console_chunks = 0
+        # Steps selected while dragging are coalesced: only the last one is shown once events are handled
+        self.pending_seek = None
+        self.seek_timer = QtCore.QTimer(self)
+        self.seek_timer.setSingleShot(True)
+        self.seek_timer.timeout.connect(lambda: self.seek_step(self.pending_seek))
+        # Replays the run in the background, so seeking anywhere only replays up to a keyframe
+        self.keyframe_timer = QtCore.QTimer(self)
+        self.keyframe_timer.timeout.connect(self.build_keyframes)
+
+    def setup_thread_selector(self):
+        self.thread_selector = QComboBox(self.ui.centralwidget)
+        self.thread_selector.setToolTip("The thread Next Step goes through, and whose variables are shown")
+        self.thread_selector.currentIndexChanged.connect(self.follow_thread)
+        # After the Stop button; only shown once the program starts a second thread
+        self.ui.horizontalLayout_2.insertWidget(4, self.thread_selector)
+        self.step_logger.threadStarted.connect(self.add_thread)
+        self.reset_threads()
+
+    def reset_threads(self):
+        self.thread_selector.blockSignals(True)
+        self.thread_selector.clear()
+        self.thread_selector.addItem("All Threads", None)
+        self.thread_selector.addItem("Main Thread", MAIN_THREAD)
+        self.thread_selector.blockSignals(False)
+        self.thread_selector.hide()
+        self.step_logger.followed_thread = None
+
+    def add_thread(self, name):
+        self.thread_selector.addItem(name, name)
+        self.thread_selector.show()
+
+    def follow_thread(self, index):
+        """Only steps through one thread of the program, or through all of them, and shows its variables."""
+        name = self.thread_selector.itemData(index)
+        self.step_logger.followed_thread = name
+        for i in range(self.ui.variables.topLevelItemCount()):
+            item = self.ui.variables.topLevelItem(i)
+            item.setHidden(not self.shows_variable(item.text(0)))
+        if self.step_logger.isRunning():
+            self.ui.statusbar.showMessage("Stepping through every thread" if name is None
+                                          else f"Stepping through {self.thread_selector.itemText(index)}", 5000)
+
+    def shows_variable(self, name):
+        """Variables of threads other than the main one are named with their thread, like "i (Thread-1)"."""
+        followed = self.step_logger.followed_thread
+        if followed is None:
+            return True
+        if followed == MAIN_THREAD:
+            return " (" not in name
+        return name.endswith(f" ({followed})")
+
+    def build_keyframes(self):
+        cursor = self.trace_cursor
+        last_keyframe = (len(cursor.step_ends) - 1) // TraceCursor.KEYFRAME_INTERVAL if cursor is not None else -1
+        if cursor is None or len(cursor.keyframes) > last_keyframe:
+            self.keyframe_timer.stop()
+            return
+        with profiler.span("keyframes"):
+            cursor.seek(len(cursor.keyframes) * TraceCursor.KEYFRAME_INTERVAL + KEYFRAME_STEPS_PER_EVENT)
+
+    def setup_export_menu(self):
+        self.actionExport_Html = QAction("Export Run as HTML...", self)
+        self.actionExport_Html.setEnabled(False)
+        self.actionExport_Html.triggered.connect(self.export_html)
+        self.ui.menuFile.addAction(self.actionExport_Html)
+        self.actionCompare = QAction("Compare Run With...", self)
+        self.actionCompare.setEnabled(False)
+        self.actionCompare.triggered.connect(self.compare_run)
+        self.ui.menuFile.addAction(self.actionCompare)
+
+    def setup_run_menu(self):
+        self.menuRun = self.ui.menubar.addMenu("Run")
+        self.actionRun_To_End = QAction("Run to End", self)
+        self.actionRun_To_End.setShortcut(QKeySequence("Ctrl+R"))
+        self.actionRun_To_End.triggered.connect(self.run_to_end)
+        self.menuRun.addAction(self.actionRun_To_End)
+        self.actionContinue = QAction("Continue to Breakpoint", self)
+        self.actionContinue.setShortcut(QKeySequence("F5"))
+        self.actionContinue.triggered.connect(self.continue_to_breakpoint)
+        self.menuRun.addAction(self.actionContinue)
+        self.actionLoad_Inputs = QAction("Load Input Script...", self)
+        self.actionLoad_Inputs.triggered.connect(self.load_inputs)
+        self.menuRun.addAction(self.actionLoad_Inputs)
+        self.menuStep_By = self.menuRun.addMenu("Step By")
+        self.granularity_actions = {}
+        group = QActionGroup(self)
+        for granularity, name in zip(GRANULARITIES, GRANULARITY_NAMES):
+            action = QAction(name, self)
+            action.setCheckable(True)
+            action.triggered.connect(lambda checked, granularity=granularity: self.set_granularity(granularity))
+            group.addAction(action)
+            self.menuStep_By.addAction(action)
+            self.granularity_actions[granularity] = action
+        self.granularity_actions[LINE].setChecked(True)
+        self.menuRun.addSeparator()
+        self.actionShow_Heatmap = QAction("Show Heatmap", self)
+        self.actionShow_Heatmap.setShortcut(QKeySequence("Ctrl+H"))
+        self.actionShow_Heatmap.setCheckable(True)
+        self.actionShow_Heatmap.toggled.connect(self.update_heatmap)
+        self.menuRun.addAction(self.actionShow_Heatmap)
+        self.actionShow_Memory = QAction("Show Memory", self)
+        self.actionShow_Memory.setShortcut(QKeySequence("Ctrl+M"))
+        self.actionShow_Memory.setCheckable(True)
+        self.actionShow_Memory.toggled.connect(self.show_memory)
+        self.menuRun.addAction(self.actionShow_Memory)
+
+    def gutter_clicked(self, item, column):
+        if column == 0:
+            lineno = self.ui.actualCode.indexOfTopLevelItem(item)
+            if lineno + 1 in self.step_logger.breakpoints:
+                self.step_logger.clear_breakpoint(lineno)
+            else:
+                self.step_logger.set_breakpoint(lineno)
+            self.show_breakpoint(lineno)
+
+    def show_gutter_menu(self, position):
+        item = self.ui.actualCode.itemAt(position)
+        if item is None:
+            return
+        lineno = self.ui.actualCode.indexOfTopLevelItem(item)
+        menu = QMenu(self)
+        menu.addAction("Add Conditional Breakpoint...", lambda: self.edit_breakpoint(lineno, hit_count=False))
+        menu.addAction("Add Hit-Count Breakpoint...", lambda: self.edit_breakpoint(lineno, condition=False))
+        if lineno + 1 in self.step_logger.breakpoints:
+            menu.addAction("Remove Breakpoint", lambda: self.gutter_clicked(item, 0))
+        menu.exec(self.ui.actualCode.viewport().mapToGlobal(position))
+
+    def edit_breakpoint(self, lineno, condition=True, hit_count=True):
+        existing = self.step_logger.breakpoints.get(lineno + 1)
+        if condition:
+            condition, ok = QInputDialog.getText(self, "Conditional Breakpoint", f"Stop on line {lineno + 1} when:",
+                                                 text=(existing.condition or "") if existing else "")
+            if not ok:
+                return
+        else:
+            condition = existing.condition if existing else None
+        if hit_count:
+            hit_count, ok = QInputDialog.getInt(self, "Hit-Count Breakpoint", f"Stop on line {lineno + 1} from hit:",
+                                                (existing.hit_count or 1) if existing else 1, 1)
+            if not ok:
+                return
+        else:
+            hit_count = existing.hit_count if existing else None
+        try:
+            self.step_logger.set_breakpoint(lineno, condition.strip() if condition else None, hit_count)
+        except SyntaxError as e:
+            self.ui.statusbar.showMessage(f"Invalid breakpoint condition: {e.msg}", 5000)
+            return
+        self.show_breakpoint(lineno)
+
+    def show_breakpoint(self, lineno):
+        """Marks a breakpoint in the line number gutter of the original code."""
+        if lineno >= self.rows_loaded:
+            # Marked once the row is loaded
+            return
+        item = self.ui.actualCode.topLevelItem(lineno)
+        breakpoint = self.step_logger.breakpoints.get(lineno + 1)
+        if breakpoint is None:
+            item.setText(0, str(lineno + 1))
+            item.setForeground(0, QApplication.palette().color(QtGui.QPalette.Active, QtGui.QPalette.Text))
+        else:
+            # A hollow marker for breakpoints with a condition or hit count
+            marker = "○" if breakpoint.description else "●"
+            item.setText(0, f"{marker} {lineno + 1}")
+            item.setForeground(0, self.breakpointColor)
+
+    def breakpoint_hit(self, lineno, description):
+        if not self.code_started:
+            self.show_code_started()
+        message = f"Stopped at breakpoint on line {lineno + 1}"
+        self.ui.statusbar.showMessage(f"{message} ({description})" if description else message)
+
     def open_file(self):
         home_dir = QtCore.QStandardPaths.writableLocation(QtCore.QStandardPaths.HomeLocation)
         self.file_to_visualize = QFileDialog.getOpenFileName(self, "Open File", home_dir, "Python Files (*.py)")[0]
         if self.file_to_visualize:
+            self.step_logger.breakpoints = {}
             self.load_file()
 
     def load_file(self):
         if self.file_to_visualize is None:
             return
+        self.row_loader.stop()
         self.ui.interpretedCode.clear()
         self.ui.actualCode.clear()
+        self.rows_loaded = 0
+        self.browsers_preloaded = 0
+        self.changed_lines.clear()
         try:
-            with open(self.file_to_visualize) as f:
-                for i, line in enumerate(f):
-                    # Add line as QTreeWidgetItem to interpretedCode and actualCode
-                    line = line.replace('\t', '  ')
-                    item = QTreeWidgetItem()
-                    item.setText(0, str(i + 1))
-                    item.setTextAlignment(0, Qt.AlignRight)
-                    item.setFlags(Qt.ItemIsEnabled)
-                    item.setData(1, Qt.UserRole, line)
-                    self.ui.interpretedCode.addTopLevelItem(item)
-                    self.ui.interpretedCode.setItemWidget(item, 1, self.create_code_browser(line))
-                    item = item.clone()
-                    self.ui.actualCode.addTopLevelItem(item)
-                    self.ui.actualCode.setItemWidget(item, 1, self.create_code_browser(line))
+            self.source = load_source(self.file_to_visualize)
+            # The first screenful now, the rest from the event loop. The code can be run in the meantime.
+            self.add_rows(self.ui.actualCode.viewport().height() // self.code_row_height + 1)
+            self.row_loader.start()
             self.ui.statusbar.showMessage(f"Loaded file: {self.file_to_visualize}")
             self.setWindowFilePath(self.file_to_visualize)
             self.setWindowTitle(f"{self.file_to_visualize.split('/')[-1]} - Beginner Python Visualizer")
@@ -109,26 +425,145 @@ class MainWindow(QMainWindow):
             self.setWindowFilePath("")
             self.setWindowTitle("Beginner Python Visualizer")
             self.ui.button_start.setEnabled(False)
-            self.ui.interpretedCode.clear()
-            self.ui.actualCode.clear()
+            self.source = None
         except Exception as e:
             self.ui.statusbar.showMessage(f"Error loading file: {self.file_to_visualize}")
             self.setWindowFilePath("")
             self.setWindowTitle("Beginner Python Visualizer")
             self.ui.button_start.setEnabled(False)
+            self.source = None
             self.ui.interpretedCode.clear()
             self.ui.actualCode.clear()
+            self.rows_loaded = 0
             print(e)
 
+    def add_rows(self, count):
+        """Adds the next `count` lines of the source to both code panes."""
+        end = min(self.rows_loaded + count, len(self.source))
+        items = []
+        for i in range(self.rows_loaded, end):
+            # Add line as QTreeWidgetItem to interpretedCode and actualCode
+            item = QTreeWidgetItem()
+            item.setText(0, str(i + 1))
+            item.setTextAlignment(0, Qt.AlignRight)
+            item.setFlags(Qt.ItemIsEnabled)
+            item.setData(1, Qt.UserRole, self.source[i].replace('\t', '  '))
+            item.setSizeHint(1, QSize(0, self.code_row_height))
+            items.append(item)
+        start = self.rows_loaded
+        self.ui.interpretedCode.addTopLevelItems(items)
+        self.ui.actualCode.addTopLevelItems([item.clone() for item in items])
+        self.rows_loaded = end
+        for i in range(start, end):
+            self.paint_row(i)
+            if i + 1 in self.step_logger.breakpoints:
+                self.show_breakpoint(i)
+        self.create_visible_code_browsers(self.ui.interpretedCode)
+        self.create_visible_code_browsers(self.ui.actualCode)
+
+    def load_rows_chunk(self):
+        """Adds the remaining rows, then creates the code widgets of the first lines ahead of time."""
+        deadline = time.perf_counter() + LOAD_CHUNK_SECONDS
+        while self.rows_loaded < len(self.source) and time.perf_counter() < deadline:
+            self.add_rows(LOAD_CHUNK_ROWS)
+        # Stepping needs the event loop more than widgets it creates on demand anyway
+        preload = 0 if self.step_logger.isRunning() else min(self.rows_loaded, PRELOADED_CODE_LINES)
+        while self.browsers_preloaded < preload and time.perf_counter() < deadline:
+            self.code_browser(self.ui.interpretedCode, self.browsers_preloaded)
+            self.code_browser(self.ui.actualCode, self.browsers_preloaded)
+            self.browsers_preloaded += 1
+        if self.rows_loaded == len(self.source) and self.browsers_preloaded >= preload:
+            self.row_loader.stop()
+
+    def ensure_rows(self, count):
+        """Makes sure the first `count` rows exist, for lines the program reaches before they were loaded."""
+        if self.source is not None and self.rows_loaded < count:
+            self.add_rows(count - self.rows_loaded)
+
+    def code_browser(self, tree, line):
+        """The code widget of a row, created when the row is first shown or changed."""
+        item = tree.topLevelItem(line)
+        browser = tree.itemWidget(item, 1)
+        if browser is None:
+            browser = self.create_code_browser(item.data(1, Qt.UserRole))
+            tree.setItemWidget(item, 1, browser)
+        return browser
+
+    def create_visible_code_browsers(self, tree):
+        first = tree.itemAt(0, 0)
+        if first is None:
+            return
+        start = tree.indexOfTopLevelItem(first)
+        end = min(start + tree.viewport().height() // self.code_row_height + 2, tree.topLevelItemCount())
+        for line in range(start, end):
+            self.code_browser(tree, line)
+
+    def load_inputs(self):
+        home_dir = QtCore.QStandardPaths.writableLocation(QtCore.QStandardPaths.HomeLocation)
+        input_file = QFileDialog.getOpenFileName(self, "Load Input Script", home_dir, "Text Files (*.txt);;All Files (*)")[0]
+        if input_file:
+            self.step_logger.load_inputs(input_file)
+            self.ui.statusbar.showMessage(f"Loaded {len(self.step_logger.inputs)} inputs from {input_file}", 5000)
+
+    def request_input(self, prompt):
+        answer, ok = QInputDialog.getText(self, "Input", prompt or "Input:")
+        self.step_logger.answer_input(answer if ok else None)
+
+    def export_html(self):
+        trace = self.step_logger.trace
+        if trace is None or self.step_logger.isRunning():
+            return
+        default_path = trace.file_name.rsplit('.', 1)[0] + ".html"
+        path = QFileDialog.getSaveFileName(self, "Export Run as HTML", default_path, "HTML Files (*.html)")[0]
+        if path:
+            import htmlexport
+            htmlexport.export_html(trace, path)
+            self.ui.statusbar.showMessage(f"Exported {trace.step_count} steps to {path}", 5000)
+
+    def compare_run(self):
+        """Runs another script, or loads a saved trace, and shows where it diverges from the last run."""
+        trace = self.step_logger.trace
+        if trace is None or self.step_logger.isRunning():
+            return
+        path = QFileDialog.getOpenFileName(self, "Compare Run With", os.path.dirname(trace.file_name),
+                                           "Python Files or Traces (*.py *.json)")[0]
+        if not path:
+            return
+        if self.compare_pool is None:
+            # Not in the GUI process, which the run would block, and whose stdout and input() it would replace
+            self.compare_pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        self.actionCompare.setEnabled(False)
+        self.ui.statusbar.showMessage(f"Running {os.path.basename(path)}...")
+        from tracediff import load_trace
+        future = self.compare_pool.submit(load_trace, path, trace.inputs, COMPARE_LIMITS)
+        # Called in a thread of the pool
+        future.add_done_callback(lambda future: self.comparisonRecorded.emit((trace, future)))
+
+    def show_comparison(self, comparison):
+        trace, future = comparison
+        self.actionCompare.setEnabled(self.step_logger.trace is not None and not self.step_logger.isRunning())
+        try:
+            other = future.result()
+        except Exception as e:
+            self.ui.statusbar.showMessage(f"Could not compare: {e}", 5000)
+            return
+        if other.error_message:
+            self.ui.statusbar.showMessage(f"{os.path.basename(other.file_name)} ended with an error: "
+                                          f"{other.error_message.strip().splitlines()[-1]}", 5000)
+        else:
+            self.ui.statusbar.clearMessage()
+        from diffwindow import DiffWindow
+        from tracediff import TraceDiff
+        # Two different scripts are compared by their variables and output only
+        self.diff_window = DiffWindow(TraceDiff(trace, other, compare_lines=other.source == trace.source))
+        self.diff_window.show()
+
     def reset_code(self):
-        self.ui.interpretedCode.clear()
-        for i in range(self.ui.actualCode.topLevelItemCount()):
-            item = self.ui.actualCode.topLevelItem(i).clone()
-            self.ui.interpretedCode.addTopLevelItem(item)
-            line = item.data(1, Qt.UserRole)
-            self.ui.interpretedCode.setItemWidget(
-                item, 1, self.create_code_browser(line)
-            )
+        # Only lines rewritten by the previous run differ from the original code
+        for line in self.changed_lines:
+            item = self.ui.interpretedCode.topLevelItem(line)
+            self.ui.interpretedCode.itemWidget(item, 1).setMarkdown(f"```python\n{item.data(1, Qt.UserRole)}```")
+        self.changed_lines.clear()
 
     def create_code_browser(self, line):
         tb = QTextBrowser(self)
@@ -147,45 +582,227 @@ class MainWindow(QMainWindow):
         syntax.PythonHighlighter(tb.document(), tb.textColor())
         return tb
 
-    def set_current_line(self, line):
-        for i in range(self.ui.interpretedCode.topLevelItemCount()):
-            for column in range(2):
-                if i == line:
-                    self.ui.interpretedCode.topLevelItem(i).setBackground(column, self.selectedColor)
-                    self.ui.actualCode.topLevelItem(i).setBackground(column, self.selectedColor)
-                else:
-                    self.ui.interpretedCode.topLevelItem(i).setBackground(column, self.lineColor)
-                    self.ui.actualCode.topLevelItem(i).setBackground(column, self.lineColor)
+    def set_current_line(self, line, repaint_all=False):
+        with profiler.span("paint"):
+            self._set_current_line(line, repaint_all)
+
+    def _set_current_line(self, line, repaint_all=False):
+        previous = self.current_line
+        self.current_line = line
+        self.ensure_rows(line + 2)
+        if repaint_all:
+            for i in range(self.rows_loaded):
+                self.paint_row(i)
+        else:
+            for i in (previous, line):
+                if 0 <= i < self.rows_loaded:
+                    self.paint_row(i)
         # Scroll to the current line
         if line != -1:
             scroll_line = max(0, line - 1)
-            if line > self.ui.interpretedCode.topLevelItemCount() / 2:
+            if line > len(self.source) / 2:
                 scroll_line = min(line + 1, self.ui.interpretedCode.topLevelItemCount() - 1)
             self.ui.interpretedCode.scrollToItem(self.ui.interpretedCode.topLevelItem(scroll_line))
             self.ui.actualCode.scrollToItem(self.ui.actualCode.topLevelItem(scroll_line))
 
+    def paint_row(self, i):
+        for column in range(2):
+            if i == self.current_line:
+                self.ui.interpretedCode.topLevelItem(i).setBackground(column, self.selectedColor)
+                self.ui.actualCode.topLevelItem(i).setBackground(column, self.selectedColor)
+            else:
+                self.ui.interpretedCode.topLevelItem(i).setBackground(column, self.lineColor)
+                if column == 0 and self.heat_colors:
+                    self.ui.actualCode.topLevelItem(i).setBackground(column, self.heat_colors[i])
+                else:
+                    self.ui.actualCode.topLevelItem(i).setBackground(column, self.lineColor)
+
+    def update_heatmap(self):
+        """Shades the line number gutter of the original code by the time spent on each line."""
+        step_logger = self.step_logger.step_logger
+        self.heat_colors = []
+        if (self.actionShow_Heatmap.isChecked() and step_logger is not None and self.source is not None
+                and len(step_logger.heatmap.hits) == len(self.source) + 1):
+            heatmap = step_logger.heatmap
+            hottest = max(heatmap.wall_time[1:], default=0.0)
+            for i in range(len(self.source)):
+                color = QtGui.QColor(self.heatColor)
+                color.setAlpha(int(200 * heatmap.wall_time[i + 1] / hottest) if hottest > 0 else 0)
+                self.heat_colors.append(color)
+            for i in range(self.rows_loaded):
+                self.ui.actualCode.topLevelItem(i).setToolTip(
+                    0, f"{heatmap.hits[i + 1]} hits, {heatmap.wall_time[i + 1] * 1000:.3f} ms wall, "
+                       f"{heatmap.cpu_time[i + 1] * 1000:.3f} ms CPU")
+        else:
+            for i in range(self.rows_loaded):
+                self.ui.actualCode.topLevelItem(i).setToolTip(0, "")
+        self.set_current_line(self.current_line, repaint_all=True)
+
+    def set_granularity(self, granularity):
+        """Sets how far each step goes, from the next run on."""
+        self.step_logger.granularity = granularity
+        self.granularity_actions[granularity].setChecked(True)
+        if self.step_logger.isRunning():
+            name = GRANULARITY_NAMES[GRANULARITIES.index(granularity)].lower()
+            self.ui.statusbar.showMessage(f"The next run steps by {name}")
+
+    def show_memory(self, checked):
+        """Opens the memory view. The engine only walks the program's objects while it is open."""
+        if checked:
+            if self.memory_window is None:
+                from memorywindow import MemoryWindow
+                self.memory_window = MemoryWindow(self)
+                self.memory_window.closed.connect(lambda: self.actionShow_Memory.setChecked(False))
+                self.objectGraphUpdated.connect(self.memory_window.apply)
+            self.memory_window.view.clear_graph()
+            self.step_logger.object_graph = ObjectGraph()
+            self.memory_window.show()
+        else:
+            self.step_logger.object_graph = None
+            if self.memory_window is not None:
+                self.memory_window.hide()
+
     def update_line(self, line, code):
         if line == -1:
             self.code_finished()
         else:
-            (self.ui.interpretedCode.itemWidget(self.ui.interpretedCode.topLevelItem(line), 1)
-             .setMarkdown(f"```python\n{code}```"))
+            with profiler.span("paint"):
+                self.ensure_rows(line + 1)
+                self.code_browser(self.ui.interpretedCode, line).setMarkdown(f"```python\n{code}```")
+                self.changed_lines[line] = code
 
     def update_variable(self, variable):
         name, value = variable
-        # Check if variable already exists
-        for i in range(self.ui.variables.topLevelItemCount()):
-            if self.ui.variables.topLevelItem(i).text(0) == name:
-                if value is None:
-                    self.ui.variables.takeTopLevelItem(i)
+        parent, item = self.variable_row(name)
+        if parent is None:
+            # A field of a variable that is not shown
+            return
+        if item is not None:
+            if value is None:
+                parent.takeChild(parent.indexOfChild(item))
+            else:
+                item.setText(1, value)
+        elif value is not None:
+            self.add_variable_row(parent, name, value)
+
+    def variable_row(self, name):
+        """(parent, row) of a variable, or of one of its fields under the row of the variable; row is None if
+        there is no such row yet, and parent is None if the variable of a field has no row either."""
+        parent_name = variable_of(name)
+        if parent_name is None:
+            parent = self.ui.variables.invisibleRootItem()
+        else:
+            parent = self.variable_row(parent_name)[1]
+            if parent is None:
+                return None, None
+        for i in range(parent.childCount()):
+            if parent.child(i).text(0) == name:
+                return parent, parent.child(i)
+        return parent, None
+
+    def add_variable_row(self, parent, name, value):
+        item = QTreeWidgetItem([name, value])
+        parent.addChild(item)
+        if parent is self.ui.variables.invisibleRootItem():
+            item.setHidden(not self.shows_variable(name))
+        else:
+            parent.setExpanded(True)
+        return item
+
+    def show_variable_history(self, item, column):
+        if self.step_logger.trace is not None:
+            if self.history_window is None:
+                from historywindow import HistoryWindow
+                self.history_window = HistoryWindow(self)
+                self.history_window.stepSelected.connect(self.show_history_step)
+            self.history_window.show_variable(self.step_logger.trace, item.text(0))
+            self.timeline.set_marked_variable(item.text(0))
+
+    def refresh_history(self):
+        if self.history_window is None or not self.history_window.isVisible() or self.step_logger.trace is None:
+            return
+        if self.history_window.trace is not self.step_logger.trace:
+            # A new run started
+            self.history_window.show_variable(self.step_logger.trace, self.history_window.name)
+        else:
+            self.history_window.refresh()
+
+    def show_history_step(self, step, line):
+        """Selects the line of the original code that ran in a step of the history."""
+        self.ensure_rows(line + 1)
+        item = self.ui.actualCode.topLevelItem(line)
+        self.ui.actualCode.setCurrentItem(item)
+        self.ui.actualCode.scrollToItem(item)
+        if self.trace_cursor is not None and self.trace_cursor.trace is self.history_window.trace:
+            self.seek_step(step)
+        self.ui.statusbar.showMessage(f"{self.history_window.name} changed at step {step + 1}, line {line + 1}", 5000)
+
+    def request_seek(self, step):
+        self.pending_seek = step
+        self.seek_timer.start(0)
+
+    def seek_step(self, step):
+        """Shows the code, variables and output of a step of the finished run."""
+        cursor = self.trace_cursor
+        if cursor is None or self.step_logger.isRunning():
+            return
+        with profiler.span("seek"):
+            cursor.seek(step)
+            for line in set(self.changed_lines) | set(cursor.lines):
+                code = cursor.lines.get(line)
+                if code == self.changed_lines.get(line):
+                    continue
+                self.ensure_rows(line + 1)
+                item = self.ui.interpretedCode.topLevelItem(line)
+                browser = self.code_browser(self.ui.interpretedCode, line)
+                browser.setMarkdown(f"```python\n{item.data(1, Qt.UserRole) if code is None else code}```")
+                if code is None:
+                    del self.changed_lines[line]
                 else:
-                    self.ui.variables.topLevelItem(i).setText(1, value)
-                return
+                    self.changed_lines[line] = code
+            self.show_variables(cursor.variables)
+            self.show_output(cursor.output)
+            self.set_current_line(cursor.current_line)
+        self.timeline.set_step(cursor.step)
+        message = f"Step {cursor.step + 1} of {len(cursor.step_ends)}"
+        if self.thread_selector.isVisible():
+            message += f" in {cursor.thread}"
+        self.ui.statusbar.showMessage(message)
 
-        item = QTreeWidgetItem()
-        item.setText(0, name)
-        item.setText(1, value)
-        self.ui.variables.addTopLevelItem(item)
+    def show_variables(self, variables):
+        """Updates the variables pane to `variables`, only changing the rows that differ."""
+        root = self.ui.variables.invisibleRootItem()
+        items = {}
+        parents = [root]
+        while parents:
+            parent = parents.pop()
+            for i in reversed(range(parent.childCount())):
+                item = parent.child(i)
+                if item.text(0) in variables:
+                    items[item.text(0)] = item
+                    parents.append(item)
+                else:
+                    parent.takeChild(i)
+        # Variables before their fields
+        for name, value in sorted(variables.items(), key=lambda variable: variable_of(variable[0]) is not None):
+            item = items.get(name)
+            if item is None:
+                parent_name = variable_of(name)
+                parent = root if parent_name is None else items.get(parent_name)
+                if parent is not None:
+                    items[name] = self.add_variable_row(parent, name, value)
+            elif item.text(1) != value:
+                item.setText(1, value)
+
+    def show_output(self, output):
+        """Shows the first chunks of the recorded output, appending to the console when going forward."""
+        if len(output) < self.console_chunks:
+            self.ui.console.setPlainText("\n".join(text for text in output if text.strip()))
+        else:
+            for text in output[self.console_chunks:]:
+                self.print_to_console(text)
+        self.console_chunks = len(output)
+        self.ui.console.moveCursor(QtGui.QTextCursor.End)
 
     def run_button_clicked(self):
         if self.step_logger.isRunning():
@@ -193,15 +810,44 @@ class MainWindow(QMainWindow):
         else:
             self.start_code()
 
-    def start_code(self):
+    def start_code(self, free_run=False, stop_at_breakpoints=False):
+        self.step_logger.free_run = free_run
+        self.step_logger.stop_at_breakpoints = stop_at_breakpoints
+        if free_run:
+            self.ui.console.clear()
+            self.ui.statusbar.showMessage("Running to end...")
         self.enable_close_button(False)
+        self.actionExport_Html.setEnabled(False)
+        self.actionCompare.setEnabled(False)
         self.ui.button_start.setEnabled(False)
         self.ui.button_start.repaint()
         self.ui.button_load.setEnabled(False)
         self.ui.button_load.repaint()
         self.reset_code()
+        self.ui.variables.clear()
+        self.reset_threads()
+        self.trace_cursor = None
+        self.keyframe_timer.stop()
+        self.timeline.setEnabled(False)
         self.step_logger.start()
 
+    def run_to_end(self):
+        if self.step_logger.isRunning():
+            self.ui.button_start.setEnabled(False)
+            self.ui.statusbar.showMessage("Running to end...")
+            self.step_logger.run_to_end()
+        elif self.ui.button_start.isEnabled():
+            self.start_code(free_run=True)
+
+    def continue_to_breakpoint(self):
+        if self.step_logger.isRunning():
+            self.ui.button_start.setEnabled(False)
+            self.ui.statusbar.showMessage("Running to next breakpoint...")
+            self.step_logger.continue_to_breakpoint()
+        elif self.ui.button_start.isEnabled():
+            self.start_code(free_run=True, stop_at_breakpoints=True)
+            self.ui.statusbar.showMessage("Running to first breakpoint...")
+
     def step_code(self):
         self.ui.button_start.setEnabled(False)
         self.ui.button_start.repaint()
@@ -214,12 +860,27 @@ class MainWindow(QMainWindow):
     def line_finished(self, lineno):
         if not self.code_started:
             self.ui.console.clear()
-            self.ui.button_start.setText("Next Step")
-            self.ui.button_start.setIcon(self.continue_icon)
-            self.ui.button_stop.setEnabled(True)
-            self.code_started = True
+            self.show_code_started()
         self.ui.button_start.setEnabled(True)
-        self.set_current_line(lineno)
+        if self.actionShow_Heatmap.isChecked():
+            self.current_line = lineno
+            self.update_heatmap()
+        else:
+            self.set_current_line(lineno)
+        self.refresh_history()
+        trace = self.step_logger.trace
+        if trace is not None:
+            if self.timeline.pyramid is None or self.timeline.pyramid.trace is not trace:
+                self.timeline.set_trace(trace)
+            else:
+                self.timeline.extend()
+            self.timeline.set_step(trace.step_count - 1)
+
+    def show_code_started(self):
+        self.ui.button_start.setText("Next Step")
+        self.ui.button_start.setIcon(self.continue_icon)
+        self.ui.button_stop.setEnabled(True)
+        self.code_started = True
 
     def code_finished(self):
         self.ui.statusbar.showMessage("Code finished", 5000)
@@ -229,8 +890,21 @@ class MainWindow(QMainWindow):
         self.ui.button_stop.setEnabled(False)
         self.ui.button_load.setEnabled(True)
         self.enable_close_button(True)
-        self.set_current_line(-1)
+        self.actionExport_Html.setEnabled(self.step_logger.trace is not None)
+        self.actionCompare.setEnabled(self.step_logger.trace is not None)
+        self.current_line = -1
+        self.update_heatmap()
         self.code_started = False
+        self.refresh_history()
+        trace = self.step_logger.trace
+        if trace is not None:
+            self.trace_cursor = TraceCursor(trace)
+            # The console shows the whole output
+            self.console_chunks = trace.events.kinds.count(OUTPUT)
+            self.timeline.set_trace(trace)
+            self.timeline.set_step(trace.step_count - 1)
+            self.timeline.setEnabled(True)
+            self.keyframe_timer.start(0)
 
     def print_error(self, error):
         exctype, value, tb_str = error
@@ -249,9 +923,13 @@ class MainWindow(QMainWindow):
         self.ui.centralwidget.setEnabled(False)
         if self.step_logger is not None:
             self.step_logger.stop()
+        if self.compare_pool is not None:
+            self.compare_pool.shutdown(wait=False, cancel_futures=True)
         QMainWindow.closeEvent(self, event)
 
     def enable_close_button(self, enable):
+        # Changing the flags hides the window, so it is shown again only if it was visible
+        visible = self.isVisible()
         if enable:
             self.setWindowFlags(QtCore.Qt.Window |
                                 QtCore.Qt.CustomizeWindowHint |
@@ -263,22 +941,54 @@ class MainWindow(QMainWindow):
                                 QtCore.Qt.CustomizeWindowHint |
                                 QtCore.Qt.WindowMinimizeButtonHint |
                                 QtCore.Qt.WindowMaximizeButtonHint)
-        self.show()
+        if visible:
+            self.show()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Beginner Python Visualizer")
     parser.add_argument('-f', '--file', action='store', help="Loads specified file on startup")
     parser.add_argument('-d', '--debug', action='store_true', help="Enable debug logging")
+    parser.add_argument('-i', '--input', action='store', help="Answers for input(), one per line")
+    parser.add_argument('--step-by', action='store', choices=GRANULARITIES, default=LINE,
+                        help="How far each step goes: a sub-expression, a statement, a line (default), "
+                             "a loop iteration, or a function call or return")
+    parser.add_argument('--max-steps', action='store', type=int, help="Stop a run after this many steps")
+    parser.add_argument('--max-time', action='store', type=float,
+                        help="Stop a run after it ran for this many seconds, not counting time spent stepping")
+    parser.add_argument('--max-cpu-time', action='store', type=float, help="Stop a run after this much CPU time")
+    parser.add_argument('--max-memory', action='store', type=float, default=1024,
+                        help="Stop a run once it grew memory use by this many MB (default: 1024)")
+    parser.add_argument('--startup-benchmark', action='store_true',
+                        help="Print the time from process start to first paint and to the file being runnable, then exit")
+    parser.add_argument('-p', '--profile', action='store', nargs='?', const="profile.json", metavar='FILE',
+                        help="Profile the visualizer and write a Chrome trace to FILE on exit (default: profile.json)")
     args = parser.parse_args()
 
     if args.debug:
         logging.basicConfig(level=logging.DEBUG)
+    if args.profile:
+        profiler.enable()
 
     app = QApplication(sys.argv)
     if args.file:
         widget = MainWindow(args.file)
     else:
         widget = MainWindow()
+    if args.input:
+        widget.step_logger.load_inputs(args.input)
+    widget.step_logger.limits = RunLimits(args.max_steps, args.max_time, args.max_cpu_time, args.max_memory * 2 ** 20)
+    widget.set_granularity(args.step_by)
+    if args.startup_benchmark:
+        def report_startup():
+            print(f"first paint: {widget.first_paint * 1000:.1f} ms, "
+                  f"file interactive: {widget.file_interactive * 1000:.1f} ms after process start")
+            app.quit()
+        widget.startupFinished.connect(report_startup)
     widget.show()
-    sys.exit(app.exec())
+    exit_code = app.exec()
+    if args.profile:
+        print(profiler.summary())
+        profiler.dump(args.profile)
+        print(f"Profile written to {args.profile}")
+    sys.exit(exit_code)
@@ -0,0 +1,70 @@
+# This Python file uses the following encoding: utf-8
+import argparse
+import gc
+import tracemalloc
+
+from steplogger import RunLimits, record_run
+
+DEFAULT_LIMITS = RunLimits(max_steps=1_000_000, max_wall_time=10)
+
+
+def traced_growth(function):
+    """Runs `function` and returns its result and the memory it allocated and kept, in bytes."""
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    result = function()
+    gc.collect()
+    return result, tracemalloc.get_traced_memory()[0] - before
+
+
+def freed_memory(objects):
+    """Empties the list `objects` and returns the memory that freed, in bytes: what only they kept alive."""
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    objects.clear()
+    gc.collect()
+    return before - tracemalloc.get_traced_memory()[0]
+
+
+def format_bytes(count):
+    return f"{count / 2 ** 20:.2f} MB" if count >= 2 ** 20 else f"{count / 2 ** 10:.1f} KB"
+
+
+def main(args):
+    inputs = []
+    if args.input:
+        with open(args.input) as f:
+            inputs = [line.rstrip("\r\n") for line in f]
+    tracemalloc.start()
+    trace = record_run(args.file, inputs, RunLimits(args.max_steps, args.max_time))
+    events = trace.events
+    # The same events as a list of tuples, like they are read back
+    tuple_bytes = traced_growth(lambda: list(events))[1]
+    steps = max(trace.step_count, 1)
+    strings = sum(len(string) for string in events.strings)
+    print(f"{trace.step_count} steps, {len(events)} events, {len(events.strings)} distinct strings "
+          f"({strings} characters)")
+    columns = events.nbytes()
+    error_message = trace.error_message
+    # Measured as what dropping the trace frees, so the imports, caches and code objects of the run are not counted
+    recorded = [trace]
+    del trace, events
+    trace_bytes = freed_memory(recorded)
+    tracemalloc.stop()
+
+    print(f"recorded trace: {format_bytes(trace_bytes):>10}  {trace_bytes / steps:7.1f} bytes/step  "
+          f"(columns {format_bytes(columns)}, {columns / steps:.1f} bytes/step)")
+    print(f"as tuples:      {format_bytes(tuple_bytes):>10}  {tuple_bytes / steps:7.1f} bytes/step")
+    if error_message:
+        print(f"The run ended with an error: {error_message.strip().splitlines()[-1]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the memory a recorded run takes per step")
+    parser.add_argument('file', help="Python script to run")
+    parser.add_argument('-i', '--input', action='store', help="Answers for input(), one per line")
+    parser.add_argument('--max-steps', action='store', type=int, default=DEFAULT_LIMITS.max_steps,
+                        help=f"Stop the run after this many steps (default: {DEFAULT_LIMITS.max_steps})")
+    parser.add_argument('--max-time', action='store', type=float, default=DEFAULT_LIMITS.max_wall_time,
+                        help=f"Stop the run after this many seconds (default: {DEFAULT_LIMITS.max_wall_time:g})")
+    main(parser.parse_args())
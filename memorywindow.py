@@ -0,0 +1,243 @@
+# This Python file uses the following encoding: utf-8
+from PySide6 import QtGui, QtCore
+from PySide6.QtCore import Qt, QPointF
+from PySide6.QtWidgets import (QApplication, QWidget, QVBoxLayout, QLabel, QGraphicsView, QGraphicsScene,
+                               QGraphicsRectItem, QGraphicsSimpleTextItem, QGraphicsPathItem)
+
+ROW_HEIGHT = 20
+NAME_WIDTH = 120
+NODE_WIDTH = 220
+COLUMN_GAP = 70
+NODE_GAP = 14
+
+
+class MemoryView(QGraphicsView):
+    """Variables pointing to objects, and objects pointing to their elements and attributes.
+
+    Built from the GraphUpdates of an ObjectGraph: only changed objects are redrawn, new objects are
+    added at the bottom of the column after their first referrer, and only the column of an object
+    that was added, removed or resized is laid out again. Objects changed by the last step are
+    highlighted.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setScene(QGraphicsScene(self))
+        self.setRenderHint(QtGui.QPainter.Antialiasing)
+        self.setAlignment(Qt.AlignLeft | Qt.AlignTop)
+        palette = QApplication.palette()
+        self.textColor = palette.color(QtGui.QPalette.Active, QtGui.QPalette.Text)
+        self.boxColor = palette.color(QtGui.QPalette.Active, QtGui.QPalette.Base)
+        self.changedColor = palette.color(QtGui.QPalette.Active, QtGui.QPalette.Highlight)
+        self.changedColor.setAlpha(75)
+        self.clear_graph()
+
+    def clear_graph(self):
+        self.scene().clear()
+        # name -> (text, ref) and its box, in the order the names appeared
+        self.names = {}
+        self.name_items = {}
+        # id -> the rows of its box, the box, and its column
+        self.nodes = {}
+        self.node_items = {}
+        self.columns = {}
+        self.column_nodes = {}
+        # Source (a name, or a node id) -> the arrows from its fields, and target id -> sources pointing to it
+        self.edges = {}
+        self.incoming = {}
+        self.highlighted = set()
+
+    def apply(self, update):
+        if update.reset:
+            self.clear_graph()
+        columns = set()
+        reroute = set()
+        for node_id in update.removed:
+            columns.add(self.columns.get(node_id))
+            self.remove_node(node_id)
+
+        for name in [name for name in self.names if name not in update.roots]:
+            self.set_refs(name, ())
+            self.scene().removeItem(self.name_items.pop(name))
+            del self.names[name]
+            columns.add(0)
+        for name, (text, ref) in update.roots.items():
+            if self.names.get(name) == (text, ref):
+                continue
+            item = self.box([name if ref is not None else f"{name} = {text}"], NAME_WIDTH, title_bold=False)
+            if name not in self.names:
+                columns.add(0)
+            else:
+                old = self.name_items[name]
+                item.setPos(old.pos())
+                self.scene().removeItem(old)
+            self.names[name] = (text, ref)
+            self.name_items[name] = item
+            self.set_refs(name, () if ref is None else (ref,))
+            reroute.add(name)
+
+        for node in self.highlighted:
+            if node in self.node_items:
+                self.node_items[node].setBrush(self.boxColor)
+        self.highlighted = set()
+        for node in update.changed:
+            node_id = node.node_id
+            rows = [node.title] + [f"{label}: {text}" if label != "" else text for label, text, _ in node.fields]
+            if node.more:
+                rows.append(f"… {node.more} more")
+            old = self.node_items.pop(node_id, None)
+            if old is not None:
+                position = old.pos()
+                self.scene().removeItem(old)
+                if len(rows) != len(self.nodes[node_id]):
+                    columns.add(self.columns[node_id])
+            else:
+                self.place(node_id)
+                columns.add(self.columns[node_id])
+                position = None
+                # Arrows waiting for this object
+                reroute |= self.incoming.get(node_id, set())
+            item = self.box(rows, NODE_WIDTH)
+            if position is not None:
+                item.setPos(position)
+            item.setBrush(self.changedColor)
+            self.node_items[node_id] = item
+            self.nodes[node_id] = rows
+            self.highlighted.add(node_id)
+            self.set_refs(node_id, [(i, ref) for i, (_, _, ref) in enumerate(node.fields) if ref is not None])
+            reroute.add(node_id)
+
+        for column in columns - {None}:
+            reroute |= self.layout_column(column)
+        for source in reroute:
+            self.route(source)
+        self.scene().setSceneRect(self.scene().itemsBoundingRect().adjusted(-10, -10, 10, 10))
+
+    def place(self, node_id):
+        """Puts a new object in the column after the first of its referrers."""
+        column = 1
+        for source in self.incoming.get(node_id, ()):
+            if source in self.columns:
+                column = self.columns[source] + 1
+                break
+        self.columns[node_id] = column
+        self.column_nodes.setdefault(column, []).append(node_id)
+
+    def remove_node(self, node_id):
+        item = self.node_items.pop(node_id, None)
+        if item is not None:
+            self.scene().removeItem(item)
+        self.set_refs(node_id, ())
+        self.nodes.pop(node_id, None)
+        column = self.columns.pop(node_id, None)
+        if column is not None:
+            self.column_nodes[column].remove(node_id)
+
+    def set_refs(self, source, refs):
+        """Replaces the arrows of a source; `refs` are (field, target) for nodes and plain targets for names."""
+        for edge in self.edges.pop(source, ()):
+            self.scene().removeItem(edge[2])
+            sources = self.incoming.get(edge[1])
+            if sources is not None:
+                sources.discard(source)
+                if not sources:
+                    del self.incoming[edge[1]]
+        edges = []
+        for ref in refs:
+            field, target = ref if isinstance(ref, tuple) else (-1, ref)
+            path = QGraphicsPathItem()
+            path.setPen(QtGui.QPen(self.textColor, 1.2))
+            path.setZValue(-1)
+            self.scene().addItem(path)
+            edges.append((field, target, path))
+            self.incoming.setdefault(target, set()).add(source)
+        if edges:
+            self.edges[source] = edges
+
+    def route(self, source):
+        """Draws the arrows of a source to the current positions of their targets."""
+        item = self.name_items.get(source) if source in self.names else self.node_items.get(source)
+        for field, target, path in self.edges.get(source, ()):
+            target_item = self.node_items.get(target)
+            if item is None or target_item is None:
+                # The object is past the limits of the walk
+                path.setPath(QtGui.QPainterPath())
+                continue
+            start = item.pos() + QPointF(item.rect().width(), ROW_HEIGHT * (field + 1.5 if field >= 0 else 0.5))
+            end = target_item.pos() + QPointF(0, ROW_HEIGHT / 2)
+            curve = QtGui.QPainterPath(start)
+            if end.x() > start.x():
+                bend = max((end.x() - start.x()) / 2, 30)
+                curve.cubicTo(start + QPointF(bend, 0), end - QPointF(bend, 0), end)
+                head = -7
+            else:
+                # Back to an object in the same or an earlier column: loop around into its right side
+                end += QPointF(target_item.rect().width(), 0)
+                bend = start.x() - end.x() + COLUMN_GAP / 2
+                curve.cubicTo(start + QPointF(COLUMN_GAP / 2, 0), end + QPointF(bend, 0), end)
+                head = 7
+            curve.moveTo(end)
+            curve.lineTo(end + QPointF(head, -4))
+            curve.moveTo(end)
+            curve.lineTo(end + QPointF(head, 4))
+            path.setPath(curve)
+
+    def layout_column(self, column):
+        """Stacks the boxes of a column without gaps. Returns the sources whose arrows must be redrawn."""
+        if column == 0:
+            items = list(self.name_items.items())
+            x = 0
+        else:
+            items = [(node_id, self.node_items[node_id]) for node_id in self.column_nodes.get(column, ())]
+            x = NAME_WIDTH + COLUMN_GAP + (column - 1) * (NODE_WIDTH + COLUMN_GAP)
+        moved = set()
+        y = 0
+        for source, item in items:
+            if item.pos() != QPointF(x, y):
+                item.setPos(x, y)
+                moved.add(source)
+                moved |= self.incoming.get(source, set())
+            y += item.rect().height() + NODE_GAP
+        return moved
+
+    def box(self, rows, width, title_bold=True):
+        item = QGraphicsRectItem(0, 0, width, ROW_HEIGHT * len(rows))
+        item.setBrush(self.boxColor)
+        item.setPen(QtGui.QPen(self.textColor, 1))
+        font = QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont)
+        metrics = QtGui.QFontMetrics(font)
+        for i, row in enumerate(rows):
+            text = QGraphicsSimpleTextItem(metrics.elidedText(row, Qt.ElideRight, width - 8), item)
+            row_font = QtGui.QFont(font)
+            row_font.setBold(title_bold and i == 0)
+            text.setFont(row_font)
+            text.setBrush(self.textColor)
+            text.setPos(4, i * ROW_HEIGHT + (ROW_HEIGHT - metrics.height()) / 2)
+        self.scene().addItem(item)
+        return item
+
+
+class MemoryWindow(QWidget):
+    """The memory view of the running program, updated by the engine at every step while it is open."""
+    closed = QtCore.Signal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent, Qt.Tool)
+        self.setWindowTitle("Memory")
+        self.resize(760, 480)
+        self.view = MemoryView(self)
+        self.status = QLabel("Shown from the next step", self)
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.view)
+        layout.addWidget(self.status)
+
+    def apply(self, update):
+        self.view.apply(update)
+        message = f"{len(self.view.names)} variables, {len(self.view.nodes)} objects"
+        if update.truncated:
+            message += " (only the first are shown)"
+        self.status.setText(message)
+
+    def closeEvent(self, event):
+        self.closed.emit()
+        super().closeEvent(event)
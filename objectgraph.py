@@ -0,0 +1,272 @@
+import ast
+import re
+import types
+from collections import deque
+from itertools import compress
+from operator import ne
+
+from watches import format_value
+
+# The walk stops at this many objects and this many references away from a variable, so large
+# or deeply nested structures only show their first part
+MAX_NODES = 100
+MAX_DEPTH = 4
+# Elements or attributes shown per object; the rest are summarized in one field
+MAX_FIELDS = 12
+VALUE_LIMIT = 40
+
+_NOT_SHOWN = (types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType, type)
+
+
+def is_object(value):
+    """Whether a value is drawn as an object of its own, instead of inline in the field pointing to it."""
+    if isinstance(value, (list, tuple, dict, set, frozenset)):
+        return True
+    return isinstance(getattr(value, "__dict__", None), dict) and not isinstance(value, _NOT_SHOWN)
+
+
+def shown_names(f_locals):
+    """The variables of a frame drawn in the memory view: not modules, functions, classes or dunder names."""
+    return {name: value for name, value in f_locals.items()
+            if not name.startswith("__") and not isinstance(value, _NOT_SHOWN)}
+
+
+def fields_of(value):
+    """The first MAX_FIELDS (label, element) pairs of an object, and how many more there are."""
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, (list, tuple)):
+        items = enumerate(value)
+    elif isinstance(value, (set, frozenset)):
+        items = (("", element) for element in value)
+    else:
+        items = value.__dict__.items()
+        value = value.__dict__
+    fields = []
+    for label, element in items:
+        if len(fields) == MAX_FIELDS:
+            break
+        fields.append((label, element))
+    return fields, len(value) - len(fields)
+
+
+def fingerprint_fields(value):
+    """A shallow fingerprint of the fields of a list, dict, set or class instance, None for other values.
+
+    It is the id of the element under every label, built and compared in C, so a line that replaces,
+    adds or removes an element in place changes it without any element being formatted.
+    """
+    if isinstance(value, list):
+        return tuple(map(id, value))
+    if isinstance(value, dict):
+        return dict(zip(value, map(id, value.values())))
+    if isinstance(value, set):
+        return frozenset(map(id, value))
+    attributes = getattr(value, "__dict__", None)
+    if isinstance(attributes, dict) and not isinstance(value, _NOT_SHOWN):
+        return dict(zip(attributes, map(id, attributes.values())))
+    return None
+
+
+def changed_fields(old, new):
+    """The labels of the fields that differ between two fingerprints of one object, in order.
+
+    Sets have no labels: a changed set has a different fingerprint but no changed fields.
+    """
+    if isinstance(new, tuple):
+        common = min(len(old), len(new))
+        # Appending or removing at the end leaves the other elements in place
+        changed = [] if old[:common] == new[:common] else list(compress(range(common), map(ne, old, new)))
+        return changed + list(range(common, max(len(old), len(new))))
+    if isinstance(new, frozenset):
+        return []
+    labels = {label for label, _ in old.items() ^ new.items()}
+    removed = labels - new.keys()
+    return list(filter(labels.__contains__, new)) + list(filter(removed.__contains__, old))
+
+
+def field_name(variable, value, label):
+    """The name of the row of one field of a variable: `nums[2]`, `ages['bob']` or `self.count`."""
+    if isinstance(value, dict):
+        return f"{variable}[{format_value(label, VALUE_LIMIT)}]"
+    if isinstance(value, list):
+        return f"{variable}[{label}]"
+    return f"{variable}.{label}"
+
+
+def field_text(value, label):
+    """The shown value of one field of a variable, None if the field was removed."""
+    if isinstance(value, list):
+        return format_value(value[label]) if label < len(value) else None
+    fields = value if isinstance(value, dict) else value.__dict__
+    return format_value(fields[label]) if label in fields else None
+
+
+# A field row, and the " (thread)" its variable has outside the main thread
+_FIELD_NAME = re.compile(r"(\w+)[\[.].*?( \([^()]*\))?$")
+
+
+def variable_of(name):
+    """The variable a field row belongs to, like `nums` for `nums[2]`; None for the row of a variable."""
+    match = _FIELD_NAME.match(name)
+    return match.group(1) + (match.group(2) or "") if match is not None else None
+
+
+def mutated_names(text):
+    """Maps every 1-based line of the source text to the names whose objects it may change in place.
+
+    Those are the variables it stores into, like `nums` in `nums[i] = 0` or `self` in `self.count += 1`,
+    and those whose methods it calls. A line calling a function that may change any object, such as a
+    function of the program, maps to None. Lines that change nothing in place are not in the map.
+    """
+    try:
+        tree = ast.parse(text)
+    except SyntaxError:
+        return {}
+    lines = {}
+    for statement in ast.walk(tree):
+        if not isinstance(statement, ast.stmt):
+            continue
+        names = set()
+        # Only the header of a compound statement; the statements of its body are visited on their own
+        for _, child in ast.iter_fields(statement):
+            for part in child if isinstance(child, list) else (child,):
+                if not isinstance(part, ast.AST) or isinstance(part, (ast.stmt, ast.excepthandler, ast.match_case)):
+                    continue
+                for node in ast.walk(part):
+                    if names is None:
+                        break
+                    if isinstance(node, (ast.Subscript, ast.Attribute)) and not isinstance(node.ctx, ast.Load):
+                        names.add(_root_name(node))
+                    elif isinstance(node, ast.Call):
+                        if isinstance(node.func, ast.Attribute):
+                            names.add(_root_name(node.func.value))
+                            names.update(arg.id for arg in node.args if isinstance(arg, ast.Name))
+                        elif not isinstance(node.func, ast.Name) or node.func.id not in _UNCHANGING_CALLS:
+                            names = None
+        names = names - {None} if names is not None else None
+        if names == set():
+            continue
+        body = getattr(statement, "body", None)
+        end = body[0].lineno - 1 if isinstance(body, list) and body else statement.end_lineno
+        for lineno in range(statement.lineno, max(end, statement.lineno) + 1):
+            previous = lines.get(lineno, set())
+            lines[lineno] = None if names is None or previous is None else previous | names
+    return lines
+
+
+# Builtins that do not change their arguments
+_UNCHANGING_CALLS = {"abs", "all", "any", "bool", "chr", "dict", "enumerate", "float", "format", "frozenset",
+                     "hash", "id", "input", "int", "isinstance", "len", "list", "max", "min", "ord", "print",
+                     "range", "repr", "reversed", "round", "set", "sorted", "str", "sum", "tuple", "type", "zip"}
+
+
+def _root_name(node):
+    """The variable at the start of `a.b[c].d`, None for any other expression."""
+    while isinstance(node, (ast.Subscript, ast.Attribute)):
+        node = node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+class GraphNode:
+    """The description of one object sent to the GUI: its title and one (label, text, ref) per field.
+
+    `ref` is the id() of the object the field points to, or None for values shown inline.
+    """
+
+    def __init__(self, value, fingerprint, fields, more):
+        self.node_id = id(value)
+        # Kept so the id is not reused by another object while the node is in the graph
+        self.value = value
+        self.fingerprint = fingerprint
+        self.title = type(value).__name__ if type(value).__module__ == "builtins" else f"{type(value).__name__} object"
+        self.fields = fields
+        self.more = more
+
+    def refs(self):
+        return [ref for _, _, ref in self.fields if ref is not None]
+
+
+class GraphUpdate:
+    """What changed in the graph since the previous update.
+
+    `roots` maps every variable to (text, ref) like a field. `changed` are the new or re-described
+    nodes, `removed` the ids of nodes no longer reachable. After a reset, `changed` has every node.
+    """
+
+    def __init__(self, roots, changed, removed, reset, truncated):
+        self.roots = roots
+        self.changed = changed
+        self.removed = removed
+        self.reset = reset
+        self.truncated = truncated
+
+
+class ObjectGraph:
+    """The objects reachable from the variables of a frame, kept up to date from step to step.
+
+    Every reachable object is fingerprinted by its type and the ids of its shown fields. Only objects
+    whose fingerprint changed are described again and sent to the GUI, so an unchanged structure
+    costs one fingerprint per object and step. The walk is bounded by MAX_NODES and MAX_DEPTH.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.needs_reset = True
+
+    def reset(self):
+        self.nodes = {}
+        self.needs_reset = True
+
+    def update(self, names) -> GraphUpdate:
+        roots = {}
+        queue = deque()
+        for name, value in names.items():
+            if is_object(value):
+                roots[name] = ("", id(value))
+                queue.append((value, 0))
+            else:
+                roots[name] = (format_value(value, VALUE_LIMIT), None)
+
+        nodes = {}
+        changed = []
+        truncated = False
+        while queue:
+            value, depth = queue.popleft()
+            node_id = id(value)
+            if node_id in nodes:
+                continue
+            if len(nodes) == MAX_NODES:
+                truncated = True
+                break
+            fields, more = fields_of(value)
+            expand = depth + 1 < MAX_DEPTH
+            fingerprint = (type(value), more, expand, tuple(id(element) for _, element in fields))
+            node = self.nodes.get(node_id)
+            if node is None or node.value is not value or node.fingerprint != fingerprint:
+                node = self.describe(value, fingerprint, fields, more, expand)
+                changed.append(node)
+            nodes[node_id] = node
+            if expand:
+                for _, element in fields:
+                    if is_object(element):
+                        queue.append((element, depth + 1))
+
+        removed = [node_id for node_id in self.nodes if node_id not in nodes]
+        update = GraphUpdate(roots, changed, removed, self.needs_reset, truncated)
+        self.nodes = nodes
+        self.needs_reset = False
+        return update
+
+    @staticmethod
+    def describe(value, fingerprint, fields, more, expand):
+        described = []
+        for label, element in fields:
+            label = format_value(label, VALUE_LIMIT) if isinstance(value, dict) else str(label)
+            if is_object(element) and expand:
+                described.append((label, "", id(element)))
+            elif is_object(element):
+                described.append((label, f"{type(element).__name__}…", None))
+            else:
+                described.append((label, format_value(element, VALUE_LIMIT), None))
+        return GraphNode(value, fingerprint, described, more)
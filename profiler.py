@@ -0,0 +1,143 @@
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+
+_NULL_SPAN = nullcontext()
+
+
+def _null_span(name):
+    return _NULL_SPAN
+
+
+def _no_count(name, amount=1):
+    pass
+
+
+class Profiler:
+    """Collects timings and counters for the visualizer itself when run with --profile.
+
+    Until it is enabled, span and count are no-ops that do not even check whether it is, as they are
+    called in the tracer for every step.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.timings = {}
+        self.counters = {}
+        self.events = []
+        self._origin = time.perf_counter_ns()
+        self.span = _null_span
+        self.count = _no_count
+
+    def enable(self):
+        self.enabled = True
+        self._origin = time.perf_counter_ns()
+        self.span = self._span
+        self.count = self._count
+
+    def _span(self, name):
+        """Returns a context manager timing the enclosed block."""
+        return _Span(self, name)
+
+    def record(self, name, start, end):
+        duration = end - start
+        if name not in self.timings:
+            self.timings[name] = []
+        self.timings[name].append(duration)
+        self.events.append({
+            "name": name,
+            "ph": "X",
+            "ts": (start - self._origin) / 1000,
+            "dur": duration / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        })
+
+    def _count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def summary(self):
+        """Returns a text summary with a log2 histogram (in microseconds) for each timed section."""
+        lines = []
+        for name, durations in sorted(self.timings.items()):
+            durations = sorted(durations)
+            total = sum(durations)
+            lines.append(f"{name}: n={len(durations)} total={total / 1e6:.2f}ms "
+                         f"mean={total / len(durations) / 1e3:.1f}us "
+                         f"p50={_percentile(durations, 50) / 1e3:.1f}us "
+                         f"p99={_percentile(durations, 99) / 1e3:.1f}us "
+                         f"max={durations[-1] / 1e3:.1f}us")
+            buckets = {}
+            for duration in durations:
+                bucket = max(0, int(duration // 1000)).bit_length()
+                buckets[bucket] = buckets.get(bucket, 0) + 1
+            widest = max(buckets.values())
+            for bucket in range(min(buckets), max(buckets) + 1):
+                amount = buckets.get(bucket, 0)
+                upper = (1 << bucket) if bucket else 1
+                bar = "#" * (amount * 40 // widest if amount else 0)
+                lines.append(f"  <{upper:>8}us {amount:>8} {bar}")
+        if self.counters:
+            lines.append("counters:")
+            for name, amount in sorted(self.counters.items()):
+                lines.append(f"  {name}: {amount}")
+        return "\n".join(lines)
+
+    def dump(self, path):
+        """Writes all recorded sections as a Chrome trace (chrome://tracing, Perfetto) JSON file."""
+        with open(path, "w") as f:
+            json.dump({
+                "traceEvents": self.events,
+                "displayTimeUnit": "ms",
+                "otherData": {"counters": self.counters},
+            }, f)
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter_ns())
+        return False
+
+
+def _percentile(sorted_values, percent):
+    index = min(len(sorted_values) - 1, len(sorted_values) * percent // 100)
+    return sorted_values[index]
+
+
+def _process_start():
+    """The perf_counter() value at which this process started, from /proc where available (10 ms resolution)."""
+    now = time.perf_counter()
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rpartition(")")[2].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return now - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError, AttributeError):
+        # Without /proc, count from the first import of this module
+        return now
+
+
+_PROCESS_START = _process_start()
+
+
+def process_uptime():
+    """Seconds since this process started, including interpreter startup and imports where the OS reports it."""
+    return time.perf_counter() - _PROCESS_START
+
+
+profiler = Profiler()
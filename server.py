@@ -0,0 +1,234 @@
+# This Python file uses the following encoding: utf-8
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from steplogger import record_run, RunLimits, GRANULARITIES, LINE
+from steptrace import TraceCursor
+
+# Requests and responses are single-line JSON objects. Every request has an "op" and may have an "id",
+# which is copied into every response to it:
+#   {"op": "start", "file": "path.py"} or {"op": "start", "source": "..."} -> {"session", "steps", "source", "run_error"}
+#       with optional "inputs": ["answer", ...] for input(); running out of them ends the run with an error,
+#       as does going over the server's run limits. "run_error" is that error, null if the run ended normally.
+#       Optional "step_by" is how far each step goes, one of "expression", "statement", "line" (default),
+#       "loop" or "function"
+#   {"op": "step", "session": s, "count": 1}                        -> {"step", "line", "events"}
+#   {"op": "continue", "session": s}     -> several {"step", "events"} followed by {"step", "line", "done"}
+#   {"op": "seek", "session": s, "step": n}                         -> {"step", "line", "lines", "variables", "output"}
+#   {"op": "variables", "session": s}                               -> {"step", "variables"}
+#   {"op": "history", "session": s, "name": x}                 -> {"step", "changes": [[step, value], ...], "last"}
+#       every change of variable x in the whole run, value null when it went out of scope, and
+#       the step at or before the current one where it last changed
+#   {"op": "stop", "session": s}                                    -> {"stopped": true}
+# Failed requests are answered with {"error": "message"}.
+
+STREAM_LIMIT = 16 * 1024 * 1024
+CONTINUE_CHUNK_STEPS = 1000
+SEND_QUEUE_SIZE = 64
+# Recordings kept for new sessions of the same script; sessions keep their own recording alive
+MAX_RECORDINGS = 32
+DEFAULT_LIMITS = RunLimits(max_steps=10_000_000, max_wall_time=10, max_memory=512 * 2 ** 20)
+
+
+class Session:
+    def __init__(self, session_id, trace, connection):
+        self.session_id = session_id
+        self.cursor = TraceCursor(trace)
+        self.connection = connection
+
+
+class Connection:
+    """One client. Responses go through a bounded queue, so a slow client only holds up its own requests."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.queue = asyncio.Queue(SEND_QUEUE_SIZE)
+        self.sessions = set()
+        # Set once the client is gone; what is sent after that is dropped
+        self.dead = False
+        self.sender = asyncio.create_task(self.send_loop())
+
+    async def send(self, message):
+        if not self.dead:
+            await self.queue.put(json.dumps(message, separators=(',', ':')).encode() + b"\n")
+
+    async def send_loop(self):
+        try:
+            while True:
+                data = await self.queue.get()
+                self.writer.write(data)
+                await self.writer.drain()
+        except ConnectionError:
+            self.dead = True
+            # Wakes up the requests waiting for room in the queue
+            while not self.queue.empty():
+                self.queue.get_nowait()
+
+    async def close(self):
+        self.dead = True
+        self.sender.cancel()
+        await asyncio.gather(self.sender, return_exceptions=True)
+        self.writer.close()
+
+
+class VisualizerServer:
+    """Serves step-by-step runs of scripts to many clients at once.
+
+    Scripts are run at full speed in a pool of worker processes and recorded; sessions then step
+    through the recorded trace. The last MAX_RECORDINGS recordings are shared between sessions of the
+    same unchanged script. As a run is over before its session starts, input() cannot wait for the
+    client: its answers are given with the start request.
+    """
+
+    def __init__(self, workers=None, limits=DEFAULT_LIMITS):
+        self.limits = limits
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        self.sessions = {}
+        # Least recently used first
+        self.recordings = OrderedDict()
+        self.session_ids = itertools.count(1)
+        self.temp_dir = tempfile.TemporaryDirectory(prefix="visualizer-")
+
+    async def record(self, path, inputs=(), granularity=LINE):
+        key = (os.path.abspath(path), os.stat(path).st_mtime_ns, tuple(inputs), granularity)
+        recording = self.recordings.get(key)
+        if recording is None:
+            loop = asyncio.get_running_loop()
+            recording = loop.run_in_executor(self.pool, record_run, path, key[2], self.limits, granularity)
+            self.recordings[key] = recording
+            while len(self.recordings) > MAX_RECORDINGS:
+                self.recordings.popitem(last=False)
+        else:
+            self.recordings.move_to_end(key)
+        try:
+            return await recording
+        except Exception:
+            if self.recordings.get(key) is recording:
+                del self.recordings[key]
+            raise
+
+    def source_file(self, source):
+        """Writes uploaded source to a file named after its hash, so identical uploads share a recording."""
+        path = os.path.join(self.temp_dir.name, hashlib.sha1(source.encode()).hexdigest() + ".py")
+        if not os.path.exists(path):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(source)
+        return path
+
+    def session(self, request, connection):
+        session = self.sessions.get(request.get("session"))
+        if session is None or session.connection is not connection:
+            raise ValueError(f"Unknown session: {request.get('session')}")
+        return session
+
+    async def handle_client(self, reader, writer):
+        connection = Connection(writer)
+        try:
+            while line := await reader.readline():
+                request = None
+                try:
+                    request = json.loads(line)
+                    await self.handle_request(request, connection)
+                except Exception as e:
+                    logging.debug(f"Request failed: {e!r}")
+                    request_id = request.get("id") if isinstance(request, dict) else None
+                    await connection.send({"id": request_id, "error": str(e)})
+        except ConnectionError:
+            pass
+        finally:
+            for session_id in connection.sessions:
+                self.sessions.pop(session_id, None)
+            await connection.close()
+
+    async def handle_request(self, request, connection):
+        op = request.get("op")
+        reply = {"id": request.get("id")}
+        if op == "start":
+            path = request["file"] if "file" in request else self.source_file(request["source"])
+            granularity = request.get("step_by", LINE)
+            if granularity not in GRANULARITIES:
+                raise ValueError(f"Unknown step_by: {granularity}")
+            trace = await self.record(path, [str(answer) for answer in request.get("inputs", [])], granularity)
+            session = Session(next(self.session_ids), trace, connection)
+            self.sessions[session.session_id] = session
+            connection.sessions.add(session.session_id)
+            reply.update(session=session.session_id, steps=trace.step_count, source=list(trace.source),
+                         run_error=trace.error_message)
+        elif op == "step":
+            cursor = self.session(request, connection).cursor
+            events = cursor.forward(int(request.get("count", 1)))
+            reply.update(step=cursor.step, line=cursor.current_line, events=events)
+        elif op == "continue":
+            cursor = self.session(request, connection).cursor
+            while not cursor.at_end:
+                events = cursor.forward(CONTINUE_CHUNK_STEPS)
+                if cursor.step == len(cursor.step_ends) - 1:
+                    events += cursor.to_end()
+                # Waiting for room in the queue is the backpressure on this session
+                await connection.send({"id": reply["id"], "step": cursor.step, "events": events})
+            reply.update(step=cursor.step, line=cursor.current_line, done=True)
+        elif op == "seek":
+            cursor = self.session(request, connection).cursor
+            cursor.seek(int(request["step"]))
+            reply.update(step=cursor.step, line=cursor.current_line, lines=cursor.lines, variables=cursor.variables,
+                         output="".join(cursor.output))
+        elif op == "variables":
+            cursor = self.session(request, connection).cursor
+            reply.update(step=cursor.step, variables=cursor.variables)
+        elif op == "history":
+            cursor = self.session(request, connection).cursor
+            history = cursor.trace.history
+            name = str(request["name"])
+            reply.update(step=cursor.step, changes=history.changes(name),
+                         last=history.last_change(name, max(cursor.step, 0)))
+        elif op == "stop":
+            session = self.session(request, connection)
+            self.sessions.pop(session.session_id)
+            connection.sessions.discard(session.session_id)
+            reply.update(stopped=True)
+        else:
+            raise ValueError(f"Unknown op: {op}")
+        await connection.send(reply)
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        return await asyncio.start_server(self.handle_client, host, port, limit=STREAM_LIMIT)
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+        self.temp_dir.cleanup()
+
+
+async def main(args):
+    server = VisualizerServer(args.workers)
+    listener = await server.serve(args.host, args.port)
+    print(f"Serving on {args.host}:{args.port}")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve Beginner Python Visualizer sessions over a local JSON API")
+    parser.add_argument('--host', action='store', default="127.0.0.1", help="Address to listen on")
+    parser.add_argument('--port', action='store', type=int, default=8765, help="Port to listen on")
+    parser.add_argument('-w', '--workers', action='store', type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument('-d', '--debug', action='store_true', help="Enable debug logging")
+    args = parser.parse_args()
+
+    if args.debug:
+        logging.basicConfig(level=logging.DEBUG)
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
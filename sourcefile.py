@@ -0,0 +1,102 @@
+import io
+import os
+import threading
+import tokenize
+from array import array
+
+# Most recently loaded files, so the GUI and the engine share one copy of each
+CACHE_SIZE = 8
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class SourceFile:
+    """The lines of a source file, read once and decoded line by line on first access.
+
+    Lines keep their "\\n" like readlines(), with Windows line endings normalized.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.data = f.read()
+        self.version = (stat.st_mtime_ns, stat.st_size)
+        try:
+            self.encoding = tokenize.detect_encoding(io.BytesIO(self.data).readline)[0]
+        except SyntaxError:
+            self.encoding = "utf-8"
+        # Start of every line, plus the end of the data
+        self.offsets = array('Q', [0])
+        find = self.data.find
+        position = find(b"\n")
+        while position >= 0:
+            self.offsets.append(position + 1)
+            position = find(b"\n", position + 1)
+        if self.offsets[-1] != len(self.data):
+            self.offsets.append(len(self.data))
+        self._lines = [None] * (len(self.offsets) - 1)
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __getitem__(self, index):
+        line = self._lines[index]
+        if line is None:
+            if index < 0:
+                index += len(self._lines)
+            line = self._decode(index)
+        return line
+
+    def __iter__(self):
+        return iter(self.lines())
+
+    def __eq__(self, other):
+        # A trace read back from JSON has its source as a list
+        if isinstance(other, SourceFile):
+            return self.data == other.data or self.lines() == other.lines()
+        if isinstance(other, list):
+            return len(self) == len(other) and self.lines() == other
+        return NotImplemented
+
+    def _decode(self, index):
+        line = self.data[self.offsets[index]:self.offsets[index + 1]].decode(self.encoding, errors="replace")
+        if index == 0 and line.startswith("\ufeff"):
+            line = line[1:]
+        if line.endswith("\r\n"):
+            line = line[:-2] + "\n"
+        self._lines[index] = line
+        return line
+
+    def text(self) -> str:
+        """The whole file, decoded at once without decoding its lines one by one."""
+        text = self.data.decode(self.encoding, errors="replace")
+        if text.startswith("\ufeff"):
+            text = text[1:]
+        return text.replace("\r\n", "\n")
+
+    def lines(self) -> list[str]:
+        """Every line, decoding those not accessed yet. The list is shared and must not be changed."""
+        if None in self._lines:
+            for index, line in enumerate(self._lines):
+                if line is None:
+                    self._decode(index)
+        return self._lines
+
+
+def load_source(path) -> SourceFile:
+    """Returns the lines of `path`, reading the file again only if it changed since it was last loaded."""
+    key = os.path.abspath(path)
+    stat = os.stat(path)
+    with _cache_lock:
+        source = _cache.get(key)
+        if source is not None and source.version == (stat.st_mtime_ns, stat.st_size):
+            return source
+    source = SourceFile(path)
+    with _cache_lock:
+        _cache.pop(key, None)
+        _cache[key] = source
+        while len(_cache) > CACHE_SIZE:
+            del _cache[next(iter(_cache))]
+    return source
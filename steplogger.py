@@ -1,13 +1,98 @@
+from array import array
+import ast
 import bdb
+import builtins
+import dis
+import functools
+import inspect
 import linecache
+import os
 import re
 import runpy
 import sys
+import threading
+import time
 import traceback
+import types
 import logging
+import multiprocessing
+from collections.abc import Iterator
 
 from PySide6 import QtCore
 
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from breakpoints import Breakpoint
+from objectgraph import shown_names, fingerprint_fields, changed_fields, field_name, field_text, mutated_names
+from profiler import profiler
+from sourcefile import load_source
+from steptrace import Trace, TraceStream, MAIN_THREAD, LINE as LINE_FINISHED, UPDATE, VARIABLE, OUTPUT, GO_TO, INPUT, ERROR
+from watches import Watch, WatchEvaluator, WatchTimeout, format_value, value_text, TEXT_LIMIT
+
+# Instructions that read a local variable, or a parameter that nested functions also use
+_LOAD_LOCAL_OPS = {"LOAD_FAST", "LOAD_FAST_CHECK", "LOAD_FAST_LOAD_FAST", "LOAD_DEREF"}
+
+# How much of the program runs between two steps, finest first. At the line granularity an assignment
+# takes two steps, one before and one after it; a statement takes one. The loop and function
+# granularities only stop at loop iterations or at calls and returns, and run the code in between
+# without a trace function.
+EXPRESSION = "expression"
+STATEMENT = "statement"
+LINE = "line"
+LOOP = "loop"
+FUNCTION = "function"
+GRANULARITIES = (EXPRESSION, STATEMENT, LINE, LOOP, FUNCTION)
+_COARSE_GRANULARITIES = (LOOP, FUNCTION)
+MONITORING_TOOL = sys.monitoring.DEBUGGER_ID
+# The sys.monitoring tool that raises the error of a stopped run in the program, see StepLogger.stop_run
+STOPPER_TOOL = 3
+# How often the watchdog of a run checks its limits, in seconds
+WATCHDOG_INTERVAL = 0.05
+
+# Instructions whose result is shown as a step at the expression granularity
+_VALUE_OPS = {"BINARY_OP", "COMPARE_OP", "CONTAINS_OP", "IS_OP", "BINARY_SUBSCR", "BINARY_SLICE", "UNARY_NEGATIVE",
+              "UNARY_NOT", "UNARY_INVERT", "CALL", "BUILD_STRING"}
+# A value that is only stored, discarded or iterated over is shown by the step of its statement instead
+_CONSUMING_OPS = ("STORE_", "POP_TOP", "GET_ITER", "UNPACK_SEQUENCE")
+# Builtins that are evaluated again to show the value of a call; any other call must have returned to the tracer
+_PURE_CALLS = {"abs", "bool", "chr", "float", "int", "len", "max", "min", "ord", "repr", "round", "sorted", "str",
+               "sum", "type"}
+_NO_VALUE = object()
+_PLAIN_TYPES = {type(None), bool, int, float, complex, str, bytes, range}
+# dict items are the pairs of their keys and values
+_PLAIN_CONTAINERS = {list, tuple, dict, set, frozenset}
+# The most elements of the values is_plain checks
+PLAIN_ELEMENTS = 1000
+_IMPURE_NODES = (ast.NamedExpr, ast.Lambda, ast.Await, ast.Yield, ast.YieldFrom, ast.ListComp, ast.SetComp,
+                 ast.DictComp, ast.GeneratorExp)
+
+
+class ThreadState:
+    """What the tracer keeps for one thread of the program, from one of its steps to the next."""
+
+    def __init__(self, name, heatmap, limits):
+        self.name = name
+        # Added to the names of its variables, so that those of different threads can be told apart
+        self.suffix = "" if name == MAIN_THREAD else f" ({name})"
+        self.last_line = None
+        self.local_vars = {}
+        # Variable -> (value, fingerprint, {field row: text}) of the lists, dicts, sets and instances in local_vars
+        self.fields = {}
+        # Calls into the visualized file since the last step
+        self.calls = []
+        self.variable_changed = False
+        # (caller frame, call instruction, function name, value) of the last return, for the value of a call
+        self.returned = None
+        self.heatmap = heatmap
+        self.cpu_deadline = time.thread_time() + limits.max_cpu_time
+        # Events recorded since the thread last added to the trace
+        self.events = []
+        # Whether the thread is the one whose step is shown to the user
+        self.turn = False
+
 
 class StepLogger(bdb.Bdb):
     def __init__(self, parent, main_window, *args, **kwargs):
@@ -18,144 +103,757 @@ class StepLogger(bdb.Bdb):
             self.file_to_visualize = main_window.file_to_visualize
         else:
             self.file_to_visualize = parent.test_file
-        self.last_line = None
-        self.local_vars = {}
-        self.method_params = {}
-        with open(self.file_to_visualize) as f:
-            self.source = f.readlines()
-        self.source_output = self.source.copy()
+        # The arguments of every call into the visualized file not returned yet
+        self.call_arguments = {}
+        # Shared with the GUI, which loaded the same file; lines are decoded as the run reaches them
+        self.source = load_source(self.file_to_visualize)
+        # 0-based line -> the line with the values substituted into it, for the lines that were rewritten
+        self.source_output = {}
+        text = self.source.text()
+        # 1-based line -> the names whose objects it may change in place, None for any
+        self.mutations = mutated_names(text)
+        self.heatmap = LineHeatmap(len(self.source))
+        # Run at full speed without waiting for the user between steps
+        self.free_run = parent.free_run
+        self.limits = parent.limits
+        # One of GRANULARITIES
+        self.granularity = parent.granularity
+        # 1-based line -> the first line of the statement it is part of, at the statement granularity
+        self.statement_starts = statement_starts(text) if self.granularity == STATEMENT else None
+        # Frames in the middle of a statement spanning lines -> the first line of that statement
+        self.continued = {}
+        # Frames -> (line, [(start, end, text, value)]) of the sub-expressions of the line replaced by their values
+        self.reductions = {}
+        # Code objects with local sys.monitoring events, None while the tool is not in use
+        self.monitored_codes = None
+        self.steps = 0
+        # Whether the program reached its first line; the lines runpy runs to start it are not steps
+        self.started = False
+        self.next_memory_check = 0
+        self.memory_base = current_rss()
+        for watch in parent.watches:
+            watch.fingerprint = None
+            watch.timed_out = False
+        for breakpoint in parent.breakpoints.values():
+            breakpoint.hits = 0
+        if parent.object_graph is not None:
+            parent.object_graph.reset()
+        # Moved back by the time spent waiting for the user, so only the run itself counts
+        self.wall_deadline = time.perf_counter() + self.limits.max_wall_time
+        # A limit or StopRun that ended a thread of the program, raised in the others at their next step
+        self.stop_error = None
         self.next_step = False
-        self.variable_changed = False
-        self.methods_to_update = []
         self.ready = False
         self.quitting = False
+        # Every thread of the program has its own state, found through a thread-local attribute. Their
+        # events are added to the trace together at the end of each tracer callback, so the lock is only
+        # held to append them and the threads only wait for each other while the user steps through them.
+        self.local = threading.local()
+        self.threads = {}
+        self.trace_lock = threading.Lock()
+        # Steps wait for the user one at a time, in the order the threads reached them
+        self.turns = threading.Condition()
+        self.next_ticket = 0
+        self.serving = 0
+        # The thread waiting for the user
+        self.paused = None
+        # Whether that thread is waiting for the user to press Next Step, which the watchdog does not count
+        self.waiting = False
+        # Set once the run is over, which stops the watchdog
+        self.run_over = threading.Event()
+        self.watchdog = None
+        # None until the run is stopped, then whether the stopper tool is raising its error in the program
+        self.stopper = None
+        self.stopper_lock = threading.Lock()
+        # Created by the thread that runs the program
+        self.main_thread = self.add_thread(MAIN_THREAD)
+        self.main_ident = threading.get_ident()
+        # Checked before formatting debug messages in hot paths so they cost nothing when disabled
+        self.debug = logging.getLogger().isEnabledFor(logging.DEBUG)
 
     def user_line(self, frame):
         """This method is called when we stop or break at this line."""
-        sys.stdout = self.parent.stdout_
-        self.next_step = False
-        self.variable_changed = False
-        self.ready = False
+        if not self.started:
+            if not self.is_visualized(frame):
+                return
+            self.started = True
+        if self.granularity != LINE and self.skips_line(frame):
+            return
+        state = self.thread_state()
+        heatmap = state.heatmap
+        heatmap.pause()
+        self.steps += 1
+        limits = self.limits
+        if (self.steps > limits.max_steps or self.steps >= self.next_memory_check
+                or heatmap.paused_wall > self.wall_deadline
+                or heatmap.paused_cpu > state.cpu_deadline):
+            self.check_limits(state)
+        turn = self.wait_turn(state)
+        try:
+            self.trace_line(frame, state, turn)
+        finally:
+            self.end_step(state)
+
+    def trace_line(self, frame, state, turn):
+        """The step of a line: shows the effects of the previous line of the thread, then waits before this one."""
+        state.variable_changed = False
+        # Time spent inside the tracer, excluding the time spent waiting for the user
+        start = time.perf_counter_ns() if profiler.enabled else 0
 
-        if self.last_line is not None:
-            self.update_var_changes(frame)
-            for method_name in self.methods_to_update:
-                self.update_method_variables(method_name)
-            self.methods_to_update = []
-            if self.variable_changed:
-                self.parent.emit_line_finished(self.last_line - 1)
+        if state.last_line is not None:
+            with profiler.span("diff"):
+                self.update_var_changes(frame, state)
+            if self.granularity == STATEMENT:
+                # The change is shown by the step of the next statement
+                state.variable_changed = False
+            with profiler.span("rewrite"):
+                for code, arguments in state.calls:
+                    self.substitute_arguments(code, arguments)
+            state.calls = []
+            if state.variable_changed:
+                if turn and self.parent.watches and not self.free_run and self.is_visualized(frame):
+                    self.update_watches(frame)
+                if turn and self.parent.object_graph is not None and not self.free_run and self.is_visualized(frame):
+                    self.update_object_graph(frame)
+                self.parent.emit_line_finished(state.last_line - 1)
             # Wait for user to press Next Line button
-            if not self.next_step and self.variable_changed:
+            if self.debug and not self.next_step and state.variable_changed:
                 logging.debug("Variable Changed: Waiting for user to press Next Line button")
-            self.ready = True
-            while not self.next_step and self.variable_changed and not self.quitting:
-                pass
-            self.last_line = None
-            self.ready = False
-            self.next_step = False
-            self.variable_changed = False
+            if profiler.enabled:
+                profiler.record("tracer", start, time.perf_counter_ns())
+            if turn:
+                self.ready = True
+            if state.variable_changed:
+                self.wait_for_user(state, turn)
+            if profiler.enabled:
+                start = time.perf_counter_ns()
+            state.last_line = None
+            if turn:
+                self.ready = False
+                self.next_step = False
+            state.variable_changed = False
 
         if "__file__" not in frame.f_globals:
-            sys.stdout = self.parent.stream_out
+            if profiler.enabled:
+                profiler.record("tracer", start, time.perf_counter_ns())
             return
         filename = frame.f_globals["__file__"]
         if filename.count(self.file_to_visualize) == 1:
             lineno = frame.f_lineno
-            self.last_line = lineno
-            line = linecache.getline(filename, lineno).strip()
-            logging.debug(f"About to execute {filename}:{lineno} - {line}")
+            state.last_line = lineno
+            state.heatmap.hit(lineno)
+            # A single lookup for lines without a breakpoint; conditions are only evaluated on their own line
+            breakpoint = self.parent.breakpoints.get(lineno)
+            if (breakpoint is not None and breakpoint.should_stop(frame) and self.free_run
+                    and self.parent.stop_at_breakpoints and self.is_followed(state)):
+                self.parent.pause_at_breakpoint(breakpoint)
+                turn = self.wait_turn(state)
+            if self.debug:
+                line = linecache.getline(filename, lineno).strip()
+                logging.debug(f"About to execute {filename}:{lineno} - {line}")
 
             # Wait for user to press Next Line button
-            if not self.next_step:
+            if self.debug and not self.next_step:
                 logging.debug("Waiting for user to press Next Line button")
-            self.ready = True
+            if turn:
+                self.ready = True
+            if turn and self.parent.watches and not self.free_run:
+                self.update_watches(frame)
+            if turn and self.parent.object_graph is not None and not self.free_run:
+                self.update_object_graph(frame)
             self.parent.emit_line_finished(lineno - 1)
-            while not self.next_step and not self.quitting:
-                pass
-            self.ready = False
-            current_line = self.source[lineno - 1]
-
-            # Make sure the line is not a method definition
-            if not current_line.strip().startswith("def"):
-                # Use regex to check if current line contains method call(s)
-                method_names = re.findall(r"\b(\w+)\(", current_line)
-                for method_name in method_names:
-                    self.methods_to_update.append(method_name)
-
-        sys.stdout = self.parent.stream_out
-
-    def update_method_variables(self, method_name):
-        if method_name not in self.method_params:
+            if profiler.enabled:
+                profiler.record("tracer", start, time.perf_counter_ns())
+            self.wait_for_user(state, turn)
+            if profiler.enabled:
+                start = time.perf_counter_ns()
+            if turn:
+                self.ready = False
+
+        if profiler.enabled:
+            profiler.record("tracer", start, time.perf_counter_ns())
+
+    def user_call(self, frame, argument_list):
+        """Called when a function is entered. Its arguments are shown once the call's first line is reached."""
+        code = frame.f_code
+        # Tracing goes on for a while after the run, when the monitoring is already stopped
+        if (self.granularity == EXPRESSION and self.monitored_codes is not None and code not in self.monitored_codes
+                and self.is_visualized(frame)):
+            self.monitor(code, sys.monitoring.events.INSTRUCTION)
+        # Lambdas, generator expressions and class bodies are not shown as calls
+        if code.co_name.startswith("<") or not self.is_visualized(frame):
             return
+        f_locals = frame.f_locals
+        arguments = {name: f_locals[name] for name in parameter_names(code) if name in f_locals}
+        # The lines that read a variable of an enclosing function are rewritten too, so its value stays
+        values = {**arguments, **{name: f_locals[name] for name in code.co_freevars if name in f_locals}}
+        if values:
+            self.thread_state().calls.append((code, values))
+        if arguments:
+            self.call_arguments[frame] = arguments
 
-        # Find line number of `def method_name`
-        method_lineno = 0
-        for i in range(len(self.source)):
-            if self.source[i].strip().startswith("def") and method_name in self.source[i].split():
-                method_lineno = i
-                break
-        method_indent = len(self.source[method_lineno]) - len(self.source[method_lineno].lstrip())
+    def user_return(self, frame, return_value):
+        self.call_arguments.pop(frame, None)
+        state = self.thread_state()
+        # The next step is in the caller, so the fields changed by the last line of a function are shown now
+        if (state.fields and state.last_line is not None and self.is_visualized(frame)
+                and frame.f_code.co_firstlineno <= state.last_line <= last_line(frame.f_code)):
+            self.update_field_changes(frame, state, self.mutations.get(state.last_line, ()), [])
+        if self.granularity == EXPRESSION:
+            if frame in self.reductions:
+                self.restore_line(frame)
+            caller = frame.f_back
+            if caller is not None:
+                state.returned = (caller, caller.f_lasti, frame.f_code.co_name, return_value)
+
+    def is_visualized(self, frame):
+        return frame.f_globals.get("__file__", "").count(self.file_to_visualize) == 1
+
+    def skips_line(self, frame):
+        """Whether a line is not a step at the statement granularity.
+
+        Also puts back a line that was shown with the values of its sub-expressions, now that it ran.
+        """
+        if frame in self.reductions:
+            self.restore_line(frame)
+        if self.statement_starts is None or not self.is_visualized(frame):
+            return False
+        lineno = frame.f_lineno
+        start = self.statement_starts.get(lineno, lineno)
+        if start != lineno:
+            self.continued[frame] = start
+            return True
+        # Python goes back to the first line of a statement after running its other lines
+        return self.continued.pop(frame, None) == lineno
+
+    def count_step(self, state):
+        """Counts a step that is not a line, checking the run limits like user_line does."""
+        self.steps += 1
+        limits = self.limits
+        if (self.steps > limits.max_steps or self.steps >= self.next_memory_check
+                or state.heatmap.paused_wall > self.wall_deadline
+                or state.heatmap.paused_cpu > state.cpu_deadline):
+            self.check_limits(state)
+
+    def pause_at(self, frame, lineno, state):
+        """Ends a step that is not a line, shown as a step of `lineno`, and waits for the user."""
+        turn = self.wait_turn(state)
+        try:
+            if turn:
+                self.ready = True
+            if turn and self.parent.watches and not self.free_run:
+                self.update_watches(frame)
+            if turn and self.parent.object_graph is not None and not self.free_run:
+                self.update_object_graph(frame)
+            self.parent.emit_line_finished(lineno - 1)
+            self.wait_for_user(state, turn)
+            if turn:
+                self.ready = False
+                self.next_step = False
+        finally:
+            self.end_step(state)
+        if self.quitting:
+            raise bdb.BdbQuit
+
+    def thread_state(self) -> ThreadState | None:
+        """The state of the calling thread, added the first time the tracer sees the thread.
+
+        None for the thread evaluating the watches, whose events sys.monitoring also reports.
+        """
+        try:
+            return self.local.state
+        except AttributeError:
+            thread = threading.current_thread()
+            if thread is self.parent.watch_evaluator.thread:
+                # Runs code of the program, like its __len__ methods, only to evaluate a watch: not a step
+                return None
+            return self.add_thread(thread.name)
+
+    def add_thread(self, name):
+        # Thread names need not be unique
+        if any(state.name == name for state in self.threads.values()):
+            name = f"{name} #{len(self.threads) + 1}"
+        heatmap = self.heatmap if not self.threads else self.heatmap.for_thread()
+        state = self.local.state = ThreadState(name, heatmap, self.limits)
+        self.threads[threading.get_ident()] = state
+        if name != MAIN_THREAD:
+            self.parent.emit_thread_started(name)
+        return state
+
+    # The state of the thread waiting for the user, or else of the main thread, for the GUI
+
+    @property
+    def last_line(self):
+        return (self.paused or self.main_thread).last_line
+
+    @property
+    def local_vars(self):
+        return (self.paused or self.main_thread).local_vars
+
+    def is_followed(self, state):
+        """Whether the user steps through the thread: all threads, unless the GUI selected one of them."""
+        followed = self.parent.followed_thread
+        return followed is None or followed == state.name
+
+    def wait_turn(self, state):
+        """Waits until the steps other threads reached before this one were shown, if the user steps through it.
+
+        Returns whether the thread got the turn; end_step gives it back.
+        """
+        if self.free_run or not self.is_followed(state):
+            return False
+        with self.turns:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            while ticket != self.serving and not self.quitting:
+                self.turns.wait()
+        state.turn = True
+        self.paused = state
+        self.next_step = False
+        self.ready = False
+        return True
+
+    def end_step(self, state):
+        """Adds the events of the step to the trace and lets the next thread waiting for its turn go on."""
+        if state.events:
+            self.flush_events(state)
+        if state.turn:
+            state.turn = False
+            with self.turns:
+                self.serving += 1
+                self.turns.notify_all()
+        state.heatmap.resume()
+
+    def flush_events(self, state):
+        events, state.events = state.events, []
+        with self.trace_lock:
+            self.parent.trace.add_events(events, state.name)
+
+    def record_now(self, event):
+        """Adds an event to the trace right away, after the events the calling thread recorded before it."""
+        state = self.thread_state()
+        state.events.append(event)
+        self.flush_events(state)
+
+    def flush_threads(self):
+        """Adds what the threads recorded after their last step, once the run is over."""
+        for state in list(self.threads.values()):
+            if state.events:
+                self.flush_events(state)
+
+    def set_quit(self):
+        super().set_quit()
+        # Threads waiting for their turn go on to quit
+        with self.turns:
+            self.turns.notify_all()
+
+    # The expression, loop and function granularities use sys.monitoring: INSTRUCTION events after
+    # sub-expressions, or only the starts, returns and backward jumps of the visualized code. Events
+    # are enabled for the code objects of the visualized file only, and disabled where they are not
+    # needed, so the rest of the program runs without a callback.
+
+    def start_monitoring(self):
+        monitoring = sys.monitoring
+        events = monitoring.events
+        monitoring.use_tool_id(MONITORING_TOOL, "Beginner Python Visualizer")
+        # The state of Bdb that set_trace would set up, for set_quit
+        self.reset()
+        self.monitored_codes = set()
+        monitoring.register_callback(MONITORING_TOOL, events.INSTRUCTION, self.monitor_instruction)
+        monitoring.register_callback(MONITORING_TOOL, events.PY_START, self.monitor_start)
+        monitoring.register_callback(MONITORING_TOOL, events.PY_RETURN, self.monitor_return)
+        monitoring.register_callback(MONITORING_TOOL, events.JUMP, self.monitor_jump)
+        if self.granularity in _COARSE_GRANULARITIES:
+            # Every code object starts once with a callback, which disables the event for other files
+            monitoring.set_events(MONITORING_TOOL, events.PY_START)
+
+    def stop_monitoring(self):
+        if self.monitored_codes is None:
+            return
+        monitoring = sys.monitoring
+        events = monitoring.events
+        monitoring.set_events(MONITORING_TOOL, 0)
+        for code in self.monitored_codes:
+            monitoring.set_local_events(MONITORING_TOOL, code, 0)
+        for event in (events.INSTRUCTION, events.PY_START, events.PY_RETURN, events.JUMP):
+            monitoring.register_callback(MONITORING_TOOL, event, None)
+        monitoring.free_tool_id(MONITORING_TOOL)
+        self.monitored_codes = None
+
+    def monitor(self, code, events):
+        sys.monitoring.set_local_events(MONITORING_TOOL, code, events)
+        self.monitored_codes.add(code)
+
+    def monitor_instruction(self, code, offset):
+        """At the expression granularity, shows the value of the sub-expression that was just evaluated."""
+        step = expression_steps(code).get(offset)
+        if step is None:
+            return sys.monitoring.DISABLE
+        if self.quitting:
+            return
+        state = self.thread_state()
+        if state is None:
+            return
+        frame = sys._getframe(1)
+        opname, lineno, start, end, operation = step
+        line = self.source[lineno - 1]
+        start, end = char_offset(line, start), char_offset(line, end)
+        shown_line, spans = self.reductions.get(frame, (lineno, []))
+        if shown_line != lineno:
+            spans = []
+        # The sub-expressions it was computed from are replaced by its value
+        inner = [span for span in spans if start <= span[0] < span[1] <= end]
+        returned, state.returned = state.returned, None
+        # The caller of a return is on the call instruction or one of its inline caches
+        if (opname == "CALL" and returned is not None and returned[0] is frame and operation <= returned[1] < offset
+                and returned[2] == called_name(line[start:end])):
+            value = returned[3]
+        else:
+            value = self.expression_value(frame, line, start, end, inner)
+            if value is _NO_VALUE:
+                return
+        text = '\u200A' + shown_text(value) + '\u200A'
+        spans = [span for span in spans if not start <= span[0] < span[1] <= end] + [(start, end, text, value)]
+        self.reductions[frame] = (lineno, spans)
+        state.heatmap.pause()
+        self.count_step(state)
+        self.parent.emit_line_updated(lineno - 1, reduced_line(line, spans))
+        self.pause_at(frame, lineno, state)
 
-        # Find the end of the method
-        method_lineno_end = method_lineno
-        for i in range(method_lineno + 1, len(self.source)):
-            if len(self.source[i]) - len(self.source[i].lstrip()) <= method_indent and self.source[i].strip() != "":
-                method_lineno_end = i
+    @staticmethod
+    def expression_value(frame, line, start, end, inner):
+        """The value of a sub-expression, evaluated again with the shown values of the sub-expressions in it.
+
+        _NO_VALUE if evaluating it could change the state of the program, like most calls would, or run
+        any code of the program.
+        """
+        source = line[start:end]
+        values = {}
+        for index, (inner_start, inner_end, _, value) in sorted(enumerate(inner), key=lambda item: -item[1][0]):
+            name = f"__value{index}"
+            source = source[:inner_start - start] + name + source[inner_end - start:]
+            values[name] = value
+        compiled = compile_expression(source)
+        if compiled is None:
+            return _NO_VALUE
+        tree, code = compiled
+        f_locals = frame.f_locals
+        if values:
+            f_locals = {**f_locals, **values}
+        # Unlike a watch, a sub-expression was just evaluated by the program, so the methods of its
+        # objects, like __add__ or __getitem__, would run a second time
+        if not is_pure(tree, f_locals, frame.f_globals) or not has_plain_operands(tree, f_locals, frame.f_globals):
+            return _NO_VALUE
+        try:
+            return eval(code, frame.f_globals, f_locals)
+        except Exception:
+            return _NO_VALUE
+
+    def restore_line(self, frame):
+        lineno, _ = self.reductions.pop(frame)
+        self.parent.emit_line_updated(lineno - 1, self.output_line(lineno - 1))
+
+    def monitor_start(self, code, offset):
+        frame = sys._getframe(1)
+        if not self.is_visualized(frame):
+            return sys.monitoring.DISABLE
+        if code not in self.monitored_codes:
+            # Jumps only for the iterations of loops: at the function granularity a loop without calls
+            # runs without a single event, and only the watchdog checks its limits
+            events = sys.monitoring.events
+            self.monitor(code, events.PY_RETURN | events.JUMP if self.granularity == LOOP else events.PY_RETURN)
+        stop = code.co_name == "<module>" or (self.granularity == FUNCTION and is_function(code))
+        self.monitored_step(frame, frame.f_lineno or code.co_firstlineno, stop)
+
+    def monitor_return(self, code, offset, value):
+        frame = sys._getframe(1)
+        stop = code.co_name == "<module>" or (self.granularity == FUNCTION and is_function(code))
+        self.monitored_step(frame, frame.f_lineno, stop)
+
+    def monitor_jump(self, code, source, destination):
+        # Only backward jumps start another iteration of a loop
+        if destination > source:
+            return sys.monitoring.DISABLE
+        frame = sys._getframe(1)
+        self.monitored_step(frame, offset_lines(code).get(destination, frame.f_lineno), self.granularity == LOOP)
+
+    def monitored_step(self, frame, lineno, stop):
+        """An event of the loop and function granularities: a step if `stop`, otherwise only counted for the limits."""
+        state = self.thread_state()
+        if state is None:
+            return
+        if not stop:
+            # The clocks are only read as often as the memory is checked, so loops run close to full speed
+            self.steps += 1
+            if self.steps > self.limits.max_steps or self.steps >= self.next_memory_check:
+                state.heatmap.pause()
+                # Where a limit is reported, as no line is hit between steps
+                state.heatmap.current_line = lineno
+                self.check_limits(state)
+                state.heatmap.resume()
+            return
+        state.heatmap.pause()
+        self.count_step(state)
+        state.last_line = lineno
+        state.heatmap.hit(lineno)
+        self.sync_variables(frame, state)
+        breakpoint = self.parent.breakpoints.get(lineno)
+        if (breakpoint is not None and breakpoint.should_stop(frame) and self.free_run
+                and self.parent.stop_at_breakpoints and self.is_followed(state)):
+            self.parent.pause_at_breakpoint(breakpoint)
+        self.pause_at(frame, lineno, state)
+
+    def sync_variables(self, frame, state):
+        """Shows every variable that changed since the last step, when steps are more than a line apart."""
+        current_vars = frame.f_locals
+        shown = shown_names(current_vars)
+        local_vars = state.local_vars
+        for var in list(local_vars.keys()):
+            if var not in shown:
+                local_vars.pop(var)
+                self.forget_fields(state, var)
+                self.parent.emit_variable_updated(var, None)
+        for var, value in shown.items():
+            if type(value) is str:
+                value = f"'{value}'"
+            if var not in local_vars or is_changed(local_vars[var], value):
+                local_vars[var] = value
+                self.parent.emit_variable_updated(var, value_text(value))
+                self.track_fields(state, var, value)
+        self.update_field_changes(frame, state, None, [])
+        self.substitute_values(frame, current_vars, (), state)
+        self.parent.emit_go_to_line(state.last_line - 1)
+
+    def update_watches(self, frame):
+        """Re-evaluates the visible watches whose referenced names changed since their last evaluation."""
+        for watch in self.parent.watches:
+            if not watch.visible or watch.timed_out:
+                continue
+            if self.parent.watch_evaluator.busy:
+                # Still stopping a watch that timed out; the rest are evaluated at a later step
                 break
+            current = watch.fingerprint_in(frame)
+            if current == watch.fingerprint:
+                continue
+            watch.fingerprint = current
+            if not is_pure(watch.tree, frame.f_locals, frame.f_globals):
+                value = "<not evaluated, it could change the program>"
+            else:
+                try:
+                    value = format_value(self.parent.watch_evaluator.evaluate(watch, frame))
+                except WatchTimeout as e:
+                    watch.timed_out = True
+                    value = f"<{e}>"
+            self.parent.emit_watch_updated(watch.watch_id, value)
 
-        logging.debug(f"Updating variables for method {method_name} from line {method_lineno} to {method_lineno_end}")
+    def update_object_graph(self, frame):
+        """Sends the objects reachable from the frame's variables that changed since the last step."""
+        object_graph = self.parent.object_graph
+        # The GUI may close the memory view at any time
+        if object_graph is not None:
+            with profiler.span("object graph"):
+                update = object_graph.update(shown_names(frame.f_locals))
+            self.parent.emit_object_graph(update)
 
-        for i in range(method_lineno + 1, method_lineno_end):
-            current_line = self.source[i]
-            logging.debug(f"Updating method variables for line {i + 1}: {current_line.rstrip()}")
-            for var, value in self.local_vars.items():
-                # Replace any instances of var after any equals sign
-                if current_line.strip().startswith("#"):
-                    continue
-                if type(value) is str:
-                    value = f"'{value}'"
-                current_line = re.sub(rf"\b{var}\b", '\u200A' + str(value) + '\u200A', current_line.rstrip())
-                if current_line != self.source_output[i].rstrip():
-                    logging.debug(f"[Method] Changed line {i + 1}: {self.source_output[i].rstrip()} -> {current_line.rstrip()}")
-                    self.source_output[i] = current_line + "\n"
-                    self.parent.emit_line_updated(i, self.source_output[i])
-
-    def update_var_changes(self, frame):
+    def wait_for_user(self, state, turn):
+        """Waits for the user to press Next Step, if the thread has the turn; the wait does not count for the limits."""
+        if not turn:
+            return
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        self.waiting = True
+        while not self.next_step and not self.quitting and not self.free_run:
+            pass
+        self.wall_deadline += time.perf_counter() - wall_start
+        state.cpu_deadline += time.thread_time() - cpu_start
+        self.waiting = False
+
+    def check_limits(self, state):
+        """Raises LimitExceeded if the run went over one of its limits, or the error that ended another thread.
+
+        The limit also stops the other threads, and this one if the program catches the exception.
+        """
+        if self.stop_error is not None:
+            raise self.stop_error
+        limits = self.limits
+        limit = None
+        heatmap = state.heatmap
+        if self.steps > limits.max_steps:
+            limit = "steps"
+        elif heatmap.paused_wall > self.wall_deadline:
+            limit = "wall_time"
+        elif heatmap.paused_cpu > state.cpu_deadline:
+            limit = "cpu_time"
+        elif self.steps >= self.next_memory_check:
+            self.next_memory_check = self.steps + RunLimits.MEMORY_CHECK_INTERVAL
+            if current_rss() - self.memory_base > limits.max_memory:
+                limit = "memory"
+        if limit is not None:
+            error = LimitExceeded(limit, limits, heatmap.current_line)
+            self.stop_run(error)
+            raise error
+
+    # A program can swallow the exception that ends its run in a bare `except:`, after which Python also
+    # turns off the tracer of its thread, and at the loop and function granularities a loop without calls
+    # has no event to check the limits at. So a watchdog thread checks the time and memory limits of the
+    # run, and once the run is stopped, a sys.monitoring tool of its own raises the error again at every
+    # line and jump of the visualized file, until the program is out of it.
+
+    def start_watchdog(self):
+        # Started before the threads of the program are traced, as it is not one of them
+        self.watchdog = threading.Thread(target=self.watch_run, daemon=True, name="watchdog")
+        self.watchdog.start()
+
+    def stop_watchdog(self):
+        self.run_over.set()
+        if self.watchdog is not None:
+            self.watchdog.join()
+        with self.stopper_lock:
+            if self.stopper:
+                monitoring = sys.monitoring
+                monitoring.set_events(STOPPER_TOOL, 0)
+                for event in (monitoring.events.LINE, monitoring.events.JUMP):
+                    monitoring.register_callback(STOPPER_TOOL, event, None)
+                monitoring.free_tool_id(STOPPER_TOOL)
+            # Threads of the program still running after the run do not arm it again
+            self.stopper = False
+
+    def watch_run(self):
+        """The watchdog: stops the run once it goes over a limit, or the user stopped it, wherever the program is."""
+        while not self.run_over.wait(WATCHDOG_INTERVAL):
+            if self.stopper is not None:
+                return
+            if self.quitting or self.stop_error is not None:
+                self.arm_stopper()
+            elif not self.waiting:
+                limit = self.exceeded_limit()
+                if limit is not None:
+                    self.stop_run(LimitExceeded(limit, self.limits, self.current_line()))
+
+    def exceeded_limit(self):
+        """The limit the run went over as the watchdog sees it, or None; steps are only counted by the tracer."""
+        limits = self.limits
+        if time.perf_counter() > self.wall_deadline:
+            return "wall_time"
+        if limits.max_cpu_time != float("inf") and hasattr(time, "pthread_getcpuclockid"):
+            for ident, state in list(self.threads.items()):
+                try:
+                    if time.clock_gettime(time.pthread_getcpuclockid(ident)) > state.cpu_deadline:
+                        return "cpu_time"
+                except OSError:
+                    # The thread is over
+                    pass
+        if limits.max_memory != float("inf") and current_rss() - self.memory_base > limits.max_memory:
+            return "memory"
+        return None
+
+    def current_line(self):
+        """The line of the visualized file the main thread of the program is on."""
+        frame = sys._current_frames().get(self.main_ident)
+        while frame is not None and not self.is_visualized(frame):
+            frame = frame.f_back
+        return frame.f_lineno if frame is not None else self.heatmap.current_line
+
+    def stop_run(self, error):
+        """Ends the run with `error` in every thread of the program, at their next line of the visualized file."""
+        if self.stop_error is None:
+            self.stop_error = error
+        self.next_memory_check = 0
+        self.free_run = True
+        self.arm_stopper()
+
+    def arm_stopper(self):
+        monitoring = sys.monitoring
+        events = monitoring.events
+        with self.stopper_lock:
+            if self.stopper is not None:
+                return
+            try:
+                monitoring.use_tool_id(STOPPER_TOOL, "Beginner Python Visualizer stopper")
+            except ValueError:
+                # Used by another tool: the tracer still raises the error at the next step
+                return
+            self.stopper = True
+            monitoring.register_callback(STOPPER_TOOL, events.LINE, self.stop_program)
+            monitoring.register_callback(STOPPER_TOOL, events.JUMP, self.stop_program)
+            # The stopper of an earlier run disabled its events in the code of other files
+            monitoring.restart_events()
+            monitoring.set_events(STOPPER_TOOL, events.LINE | events.JUMP)
+
+    def stop_program(self, code, *_):
+        """The callback of the stopper tool."""
+        if not self.is_visualized(sys._getframe(1)):
+            return sys.monitoring.DISABLE
+        if threading.current_thread() is self.parent.watch_evaluator.thread:
+            return
+        raise self.stop_error if self.stop_error is not None else bdb.BdbQuit
+
+    def output_line(self, index):
+        """The 0-based line as it is shown, with the values substituted into it."""
+        line = self.source_output.get(index)
+        return self.source[index] if line is None else line
+
+    def substitute_arguments(self, code, arguments):
+        """Shows the values of a call's arguments and free variables in the lines of the function that read them."""
+        lines = parameter_lines(code)
+        for i in sorted({i for name in arguments for i in lines.get(name, ())}):
+            if i >= len(self.source) or self.source[i].strip().startswith("#"):
+                continue
+            profiler.count("regex_calls")
+            current_line = substitute_names(self.source[i].rstrip(), {
+                name: value for name, value in arguments.items() if i in lines.get(name, ())}, {})[0]
+            if current_line != self.output_line(i).rstrip():
+                if self.debug:
+                    logging.debug(f"[Call] Changed line {i + 1}: {self.output_line(i).rstrip()} -> {current_line}")
+                self.source_output[i] = current_line + "\n"
+                profiler.count("lines_rewritten")
+                self.parent.emit_line_updated(i, self.source_output[i])
+
+    def update_var_changes(self, frame, state):
         """Updates the difference in variable values from the last step."""
         current_vars = frame.f_locals
-        # Get the name of the called method up the stack
-        method_origin = frame.f_code.co_name
-        if method_origin in self.method_params:
-            for param in self.method_params[method_origin]:
-                if param in current_vars:
-                    self.local_vars[param] = current_vars[param]
-                    if self.main_window:
-                        self.main_window.updateVariable.emit((param, str(current_vars[param])))
-
-        # Remove any variables in self.local_vars that are not in current_vars
-        for var in list(self.local_vars.keys()):
+        # Arguments are shown from the first step of a call, and again after steps outside of it
+        arguments = self.call_arguments.get(frame)
+        if arguments:
+            for name in arguments:
+                if name in current_vars and (name not in state.local_vars
+                                             or is_changed(state.local_vars[name], current_vars[name])):
+                    state.local_vars[name] = current_vars[name]
+                    self.parent.emit_variable_updated(name, value_text(current_vars[name]))
+                    self.track_fields(state, name, current_vars[name])
+
+        # Remove any variables in state.local_vars that are not in current_vars
+        for var in list(state.local_vars.keys()):
             if var not in current_vars:
-                self.local_vars.pop(var)
-                if self.main_window:
-                    self.main_window.updateVariable.emit((var, None))
+                state.local_vars.pop(var)
+                self.forget_fields(state, var)
+                self.parent.emit_variable_updated(var, None)
 
         just_assigned = []
         for var, value in current_vars.items():
             if type(value) is str:
                 value = f"'{value}'"
-            if var not in self.local_vars or self.local_vars[var] != value:
-                current_line = self.source[self.last_line - 1]
-                if current_line.strip().startswith(var):
-                    if self.main_window:
-                        self.main_window.updateVariable.emit((var, str(value)))
+            if var not in state.local_vars or is_changed(state.local_vars[var], value):
+                current_line = self.source[state.last_line - 1]
+                # Not `counts = ...` for `count`, nor `c.count = 5` or `c[0] = 5`, whose fields are shown instead
+                if re.match(rf"{var}\b(?!\s*[.\[(])", current_line.strip()):
+                    text = value_text(value)
+                    self.parent.emit_variable_updated(var, text)
                     leading_whitespace = len(current_line) - len(current_line.lstrip())
-                    self.source_output[self.last_line - 1] = f"{leading_whitespace * ' '}{var} = \u200A{value}\u200A\n"
-                    logging.debug(f"[Source] Changed {var} assignment for line {self.last_line}: "
-                                  f"{current_line.rstrip()} -> {self.source_output[self.last_line - 1].rstrip()}")
-                    self.parent.emit_line_updated(self.last_line - 1, self.source_output[self.last_line - 1])
-                    self.local_vars[var] = value
-                    self.variable_changed = True
+                    self.source_output[state.last_line - 1] = f"{leading_whitespace * ' '}{var} = \u200A{text}\u200A\n"
+                    if self.debug:
+                        logging.debug(f"[Source] Changed {var} assignment for line {state.last_line}: "
+                                      f"{current_line.rstrip()} -> {self.source_output[state.last_line - 1].rstrip()}")
+                    profiler.count("lines_rewritten")
+                    self.parent.emit_line_updated(state.last_line - 1, self.source_output[state.last_line - 1])
+                    state.local_vars[var] = value
+                    self.track_fields(state, var, value)
+                    state.variable_changed = True
                     just_assigned.append(var)
+                elif re.match(rf"{var}\s*[.\[]", current_line.strip()):
+                    # A field of a variable not shown yet, such as one of the caller after a call
+                    self.parent.emit_variable_updated(var, value_text(value))
+                    state.local_vars[var] = value
+                    self.track_fields(state, var, value)
                 else:
                     # extract parameters from for loop and check if var is one of them
                     if current_line.strip().startswith("for") and "in" in current_line:
@@ -163,74 +861,506 @@ class StepLogger(bdb.Bdb):
                         params = params.split(",")
                         for param in params:
                             if param.strip() == var:
-                                if self.main_window:
-                                    self.main_window.updateVariable.emit((var, str(value)))
-                                self.local_vars[var] = value
-
-        # Find line number of `def method_origin`
-        method_lineno = self.last_line - 1
-        for i in range(self.last_line - 1, -1, -1):
-            if self.source[i].strip().startswith("def") and method_origin in self.source[i].split():
-                method_lineno = i + 1
-                break
+                                self.parent.emit_variable_updated(var, value_text(value))
+                                state.local_vars[var] = value
+                                self.track_fields(state, var, value)
 
-        # source_backup = self.source.copy()
-        for i in range(method_lineno, len(self.source)):
-            current_line = self.source[i]  # source_backup[i]
-            # Replace any instances of var after any equals sign
-            if current_line.strip().startswith("#"):
-                continue
-            for var, value in current_vars.items():
-                if var not in self.local_vars:
-                    continue
-                skip = False
-                for v in just_assigned:
-                    if current_line.strip().startswith(v):
-                        skip = True
-                if skip:
-                    continue
-                if type(value) is str:
-                    value = f"'{value}'"
-                if "=" in current_line and current_line.strip().startswith(var):
-                    if "==" in current_line:
-                        continue
-                    assignment = current_line.split("=")
-                    if len(assignment) == 2:
-                        assignment[1] = re.sub(rf"\b{var}\b", '\u200A' + str(value) + '\u200A', assignment[1].rstrip())
-                        logging.debug(f"Variable {var} just assigned to {value}!")
-                        self.source_output[i] = "=".join(assignment) + "\n"
-                        logging.debug(f"[Source] Changed {var} assignment for line {i + 1}: "
-                                      f"{current_line.rstrip()} -> {"=".join(assignment)}")
-                else:
-                    match = re.search(rf"\b{var}\b", current_line)
-                    if match is not None:
-                        current_line = re.sub(rf"\b{var}\b", '\u200A' + str(value) + '\u200A', current_line.replace('\n', ''))
-                        logging.debug(f"[Source] Changed {var} for line {i + 1}: {self.source_output[i].rstrip()} -> {current_line}")
-                        self.source_output[i] = current_line + "\n"
-                        self.parent.emit_line_updated(i, self.source_output[i])
-
-        # Extract parameters from def function and check if var is one of them
-        current_line = self.source[self.last_line - 1]
-        if current_line.strip().startswith("def") and "(" in current_line and ")" in current_line:
-            method_name = current_line[current_line.index("def") + 3:current_line.index("(")].strip()
-            params = current_line[current_line.index("(") + 1:current_line.index(")")]
-            params = params.split(",")
-            self.method_params[method_name] = params
-        elif current_line.strip().startswith("for") and " in " in current_line:
-            self.variable_changed = True
+        # Other threads may change any object
+        names = self.mutations.get(state.last_line, ()) if len(self.threads) == 1 else None
+        self.update_field_changes(frame, state, names, just_assigned)
+        self.substitute_values(frame, current_vars, just_assigned, state)
+
+        current_line = self.source[state.last_line - 1]
+        if current_line.strip().startswith("for") and " in " in current_line:
+            state.variable_changed = True
 
         lineno = -1
-        if self.variable_changed:
-            lineno = self.last_line - 1
+        if state.variable_changed:
+            lineno = state.last_line - 1
         elif "__file__" in frame.f_globals:
             filename = frame.f_globals["__file__"]
             if filename.count(self.file_to_visualize) == 1:
                 lineno = frame.f_lineno - 1
         self.parent.emit_go_to_line(lineno)
 
+    def track_fields(self, state, var, value):
+        """Follows the fields of the new value of a variable, and removes the rows of the fields of its old value."""
+        self.forget_fields(state, var)
+        fingerprint = fingerprint_fields(value)
+        if fingerprint is not None:
+            state.fields[var] = (value, fingerprint, {})
+
+    def forget_fields(self, state, var):
+        tracked = state.fields.pop(var, None)
+        if tracked is not None:
+            for name in tracked[2]:
+                self.parent.emit_variable_updated(name, None)
+
+    def update_field_changes(self, frame, state, names, just_assigned):
+        """Shows the elements and attributes the last step changed in place, like `nums[i] = 0` or `self.count += 1`.
+
+        Only the variables in `names` (None for all) and the other variables of the same objects are
+        fingerprinted again, and only the fields whose fingerprint changed are formatted and shown as
+        rows of their variable. A line that assigned a single field is rewritten like an assignment.
+        """
+        fields = state.fields
+        if not fields or names == ():
+            return
+        current_vars = frame.f_locals
+        objects = {id(tracked[0]) for var, tracked in fields.items() if names is None or var in names}
+        current_line = self.source[state.last_line - 1]
+        for var, (value, fingerprint, shown) in list(fields.items()):
+            if id(value) not in objects:
+                continue
+            current = current_vars.get(var)
+            if current is not value:
+                # Assigned an equal value, which is not shown as a change
+                if var in state.local_vars:
+                    self.track_fields(state, var, current)
+                continue
+            new_fingerprint = fingerprint_fields(value)
+            if new_fingerprint == fingerprint:
+                continue
+            fields[var] = (value, new_fingerprint, shown)
+            changed = []
+            for label in changed_fields(fingerprint, new_fingerprint):
+                name, text = field_name(var, value, label), field_text(value, label)
+                if shown.get(name) != text:
+                    changed.append((name, text))
+                    if text is None:
+                        shown.pop(name, None)
+                    else:
+                        shown[name] = text
+                    self.parent.emit_variable_updated(name, text)
+            self.parent.emit_variable_updated(var, value_text(value))
+            state.variable_changed = True
+            if (len(changed) == 1 and changed[0][1] is not None
+                    and re.match(rf"{var}\s*[\[.][^=]*=(?!=)", current_line.strip())):
+                leading_whitespace = len(current_line) - len(current_line.lstrip())
+                self.source_output[state.last_line - 1] = f"{leading_whitespace * ' '}{changed[0][0]} = \u200A{changed[0][1]}\u200A\n"
+                profiler.count("lines_rewritten")
+                self.parent.emit_line_updated(state.last_line - 1, self.source_output[state.last_line - 1])
+                just_assigned.append(var)
+
+    def substitute_values(self, frame, current_vars, just_assigned, state):
+        """Shows the values of the variables in the lines from the last one to the end of its function."""
+        # Get the name of the called method up the stack
+        method_origin = frame.f_code.co_name
+        # From the line that just ran to the end of the running function, or of the file at module level
+        method_lineno = state.last_line - 1
+        method_lineno_end = len(self.source)
+        if method_origin != "<module>" and self.is_visualized(frame):
+            method_lineno_end = min(method_lineno_end, last_line(frame.f_code))
+
+        values = {var: value for var, value in current_vars.items() if var in state.local_vars}
+        texts = {}
+        for i in range(method_lineno, method_lineno_end):
+            current_line = self.source[i]
+            stripped = current_line.strip()
+            if stripped.startswith("#") or any(stripped.startswith(var) for var in just_assigned):
+                continue
+            profiler.count("regex_calls")
+            line, replaced = substitute_names(current_line.rstrip("\n"), values, texts)
+            if replaced and line + "\n" != self.output_line(i):
+                if self.debug:
+                    logging.debug(f"[Source] Changed line {i + 1}: {self.output_line(i).rstrip()} -> {line}")
+                self.source_output[i] = line + "\n"
+                profiler.count("lines_rewritten")
+                self.parent.emit_line_updated(i, self.source_output[i])
+
+
+# A string literal, kept as it is, or a name that is not an attribute, a keyword argument or (the object of) an
+# assignment target
+_NAME_OR_STRING = re.compile(
+    r"(?P<string>[rRbBuUfF]{0,2}(?:'''.*?'''|\"\"\".*?\"\"\"|'(?:\\.|[^'\\])*'|\"(?:\\.|[^\"\\])*\"))"
+    r"|(?<![.\w])(?P<name>[^\W\d]\w*)(?!(?:\s*(?:\.\s*\w+|\[[^\]]*\]))*\s*(?:[-+*/%@&|^]|//|\*\*|<<|>>)?=(?!=))")
+
+
+def substitute_names(line, values, texts):
+    """`line` with the names in `values` replaced by their values, and how many were replaced.
+
+    The line is read once, so a value that was inserted is never substituted into again, and names in
+    string literals are left as they are. `texts` caches the shown values between lines.
+    """
+    replaced = 0
+
+    def replace(match):
+        nonlocal replaced
+        name = match.group("name")
+        if name is None or name not in values:
+            return match.group(0)
+        text = texts.get(name)
+        if text is None:
+            value = values[name]
+            text = texts[name] = shown_text(value)
+        replaced += 1
+        return '\u200A' + text + '\u200A'
+
+    return _NAME_OR_STRING.sub(replace, line), replaced
+
+
+def is_changed(shown, value):
+    """Whether a variable has a new value; the same object is not compared with itself, element by element."""
+    return shown is not value and shown != value
+
+
+def shown_text(value):
+    """How a value is substituted into a line: strings in quotes, and cut like value_text."""
+    if type(value) is str:
+        return value_text(f"'{value[:TEXT_LIMIT]}'")
+    return value_text(value)
+
+
+def parameter_names(code):
+    """The names of a function's parameters, including *args and **kwargs."""
+    count = code.co_argcount + code.co_kwonlyargcount
+    count += bool(code.co_flags & inspect.CO_VARARGS) + bool(code.co_flags & inspect.CO_VARKEYWORDS)
+    return code.co_varnames[:count]
+
+
+@functools.cache
+def parameter_lines(code):
+    """The 0-based lines on which a function, or a function nested in it, reads each of its parameters
+    and the variables of enclosing functions it uses.
+
+    Found from the bytecode, so names in strings, comments and attribute accesses do not count.
+    """
+    names = set(parameter_names(code)) | set(code.co_freevars)
+    lines = {}
+    for instruction in dis.get_instructions(code):
+        if instruction.opname in _LOAD_LOCAL_OPS and instruction.positions.lineno is not None:
+            arguments = instruction.argval if isinstance(instruction.argval, tuple) else (instruction.argval,)
+            for name in names.intersection(arguments):
+                lines.setdefault(name, set()).add(instruction.positions.lineno - 1)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            for name in names.intersection(const.co_freevars):
+                lines.setdefault(name, set()).update(_free_variable_lines(const, name))
+    return {name: frozenset(numbers) for name, numbers in lines.items()}
+
+
+@functools.cache
+def last_line(code):
+    """The last 1-based line of a function, including the functions nested in it."""
+    lines = [line for _, _, line in code.co_lines() if line is not None]
+    lines += [last_line(const) for const in code.co_consts if isinstance(const, types.CodeType)]
+    return max(lines, default=code.co_firstlineno)
+
+
+def _free_variable_lines(code, name):
+    lines = {instruction.positions.lineno - 1 for instruction in dis.get_instructions(code)
+             if instruction.opname == "LOAD_DEREF" and instruction.argval == name
+             and instruction.positions.lineno is not None}
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType) and name in const.co_freevars:
+            lines |= _free_variable_lines(const, name)
+    return lines
+
+
+def statement_starts(text):
+    """Maps every 1-based line of the source text to the first line of the innermost statement it is part of."""
+    try:
+        tree = ast.parse(text)
+    except SyntaxError:
+        return {}
+    starts = {}
+    # Breadth first, so statements overwrite the lines of the statements they are nested in
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.stmt, ast.excepthandler)):
+            for lineno in range(node.lineno, node.end_lineno + 1):
+                starts[lineno] = node.lineno
+    return starts
+
+
+@functools.cache
+def expression_steps(code):
+    """The steps of a code object at the expression granularity.
+
+    Maps the offset of the instruction right after each operation whose value is shown to
+    (operation, line, start, end, offset of the operation), with the columns of the operation's
+    source in bytes like the code's positions.
+    """
+    steps = {}
+    instructions = list(dis.get_instructions(code))
+    for instruction, following in zip(instructions, instructions[1:]):
+        lineno, end_lineno, start, end = instruction.positions
+        if (instruction.opname in _VALUE_OPS and not following.is_jump_target
+                and not following.opname.startswith(_CONSUMING_OPS)
+                and lineno is not None and lineno == end_lineno and start is not None and end is not None):
+            steps[following.offset] = (instruction.opname, lineno, start, end, instruction.offset)
+    return steps
+
+
+@functools.cache
+def offset_lines(code):
+    """The 1-based line of every instruction offset of a code object."""
+    lines = {}
+    for start, end, lineno in code.co_lines():
+        if lineno is not None:
+            for offset in range(start, end, 2):
+                lines[offset] = lineno
+    return lines
+
+
+def is_function(code):
+    """Whether a code object is a function shown as a call, not a module, class body, lambda or comprehension."""
+    return bool(code.co_flags & inspect.CO_OPTIMIZED) and not code.co_name.startswith("<")
+
+
+def char_offset(line, offset):
+    """The character offset in a line of a byte offset in its UTF-8 encoding."""
+    return len(line.encode()[:offset].decode("utf-8", "ignore")) if not line.isascii() else offset
+
+
+def reduced_line(line, spans):
+    """A source line with the (start, end, text, value) spans of its sub-expressions replaced by their values."""
+    line = line.rstrip("\n")
+    for start, end, text, _ in sorted(spans, key=lambda span: span[0], reverse=True):
+        line = line[:start] + text + line[end:]
+    return line + "\n"
+
+
+@functools.cache
+def compile_expression(source):
+    """(tree, code) of an expression, or None if it is not one."""
+    try:
+        tree = ast.parse(source, mode="eval")
+        return tree, compile(tree, "<expression>", "eval")
+    except SyntaxError:
+        return None
+
+
+def called_name(source):
+    """The name of the function a call expression calls, if it is called by name or as a method."""
+    compiled = compile_expression(source)
+    call = compiled[0].body if compiled is not None else None
+    if isinstance(call, ast.Call):
+        if isinstance(call.func, ast.Name):
+            return call.func.id
+        if isinstance(call.func, ast.Attribute):
+            return call.func.attr
+    return None
+
+
+def is_pure(tree, f_locals, f_globals):
+    """Whether evaluating an expression again with these variables cannot change the state of the program."""
+    for node in ast.walk(tree):
+        if isinstance(node, _IMPURE_NODES):
+            return False
+        if isinstance(node, ast.Call):
+            name = node.func.id if isinstance(node.func, ast.Name) else None
+            if name not in _PURE_CALLS or name in f_locals or name in f_globals:
+                return False
+        elif isinstance(node, ast.Name):
+            value = f_locals.get(node.id, f_globals.get(node.id))
+            # An iterator would be advanced, and a function passed to a builtin, like key= to sorted(), called
+            if isinstance(value, Iterator) or (callable(value) and not isinstance(value, type)):
+                return False
+    return True
+
+
+def has_plain_operands(tree, f_locals, f_globals):
+    """Whether the names and attributes an expression reads are all plain values, see is_plain.
+
+    Attributes are looked up without running code of the program: not through properties, methods or
+    a __getattribute__ of its own.
+    """
+    skipped = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            # The builtins is_pure allows
+            skipped.add(node.func)
+        elif isinstance(node, ast.Attribute):
+            # Checked through the attribute
+            skipped.add(node.value)
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Name, ast.Attribute)) and node not in skipped:
+            value = static_value(node, f_locals, f_globals)
+            if value is _NO_VALUE or not is_plain(value):
+                return False
+    return True
+
+
+def static_value(node, f_locals, f_globals):
+    """The value of a name or attribute, or _NO_VALUE if looking it up could run code of the program."""
+    if isinstance(node, ast.Name):
+        for scope in (f_locals, f_globals, builtins.__dict__):
+            if node.id in scope:
+                return scope[node.id]
+        return _NO_VALUE
+    if not isinstance(node, ast.Attribute):
+        return _NO_VALUE
+    obj = static_value(node.value, f_locals, f_globals)
+    if obj is _NO_VALUE or (type(obj).__getattribute__ is not object.__getattribute__
+                            and type(obj) not in (type, types.ModuleType)):
+        return _NO_VALUE
+    try:
+        value = inspect.getattr_static(obj, node.attr)
+    except AttributeError:
+        return _NO_VALUE
+    # A method, property or other descriptor
+    return _NO_VALUE if hasattr(type(value), "__get__") else value
+
+
+def is_plain(value):
+    """Whether a value is None, a number, string, bytes or range, or a builtin container of at most
+    PLAIN_ELEMENTS of them, so that its operators cannot run code of the program.
+    """
+    budget = PLAIN_ELEMENTS
+    pending = [value]
+    while pending:
+        value = pending.pop()
+        kind = type(value)
+        if kind in _PLAIN_TYPES:
+            continue
+        if kind not in _PLAIN_CONTAINERS:
+            return False
+        budget -= len(value)
+        if budget < 0:
+            return False
+        pending.extend(value.items() if kind is dict else value)
+    return True
+
+
+class LineHeatmap:
+    """Per-line hit counts and cumulative wall/CPU time (in seconds) of the visualized file.
+
+    The arrays are indexed by line number; index 0 collects time spent before the first line.
+    Time is attributed to the last visualized line until the next one starts, so calls into
+    other modules count towards the line that made them. Time spent inside the tracer itself,
+    including waiting for the user to press Next Step, is excluded. Every thread of the program
+    times its own lines with a heatmap from for_thread, adding to the same counts.
+    """
+    __slots__ = ("hits", "wall_time", "cpu_time", "current_line", "wall_start", "cpu_start",
+                 "paused_wall", "paused_cpu")
+
+    def __init__(self, line_count):
+        self.hits = array('L', [0]) * (line_count + 1)
+        self.wall_time = array('d', [0.0]) * (line_count + 1)
+        self.cpu_time = array('d', [0.0]) * (line_count + 1)
+        self.current_line = 0
+        self.wall_start = self.paused_wall = time.perf_counter()
+        self.cpu_start = self.paused_cpu = time.thread_time()
+
+    def pause(self):
+        # The pause timestamps are also what the run limits are checked against
+        self.paused_wall = time.perf_counter()
+        self.paused_cpu = time.thread_time()
+        self.wall_time[self.current_line] += self.paused_wall - self.wall_start
+        self.cpu_time[self.current_line] += self.paused_cpu - self.cpu_start
+
+    def resume(self):
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+
+    def hit(self, lineno):
+        self.current_line = lineno
+        self.hits[lineno] += 1
+
+    def for_thread(self):
+        """A heatmap of the calling thread: its own clocks and current line, and the same counts and times."""
+        heatmap = LineHeatmap(0)
+        heatmap.hits, heatmap.wall_time, heatmap.cpu_time = self.hits, self.wall_time, self.cpu_time
+        return heatmap
+
+
+class RunLimits:
+    """Limits that end a run cleanly. Times are in seconds, memory in bytes, None means unlimited.
+
+    Steps count every line the tracer sees from the first line of the program on, in any module and
+    thread; at the loop and function granularities, the iterations of loops and the calls and returns of
+    the visualized file, or only its calls and returns. Wall and CPU time count the whole run, including
+    the tracer, but not the time spent waiting for the user; CPU time is counted for each thread of the
+    program on its own. Memory is the growth of the resident set size since the run started; in worker
+    processes, such as those of the grader and the server, the address space is also limited so that a
+    single huge allocation fails with MemoryError.
+    """
+    MEMORY_CHECK_INTERVAL = 1024
+
+    def __init__(self, max_steps=None, max_wall_time=None, max_cpu_time=None, max_memory=None):
+        self.max_steps = max_steps if max_steps is not None else float("inf")
+        self.max_wall_time = max_wall_time if max_wall_time is not None else float("inf")
+        self.max_cpu_time = max_cpu_time if max_cpu_time is not None else float("inf")
+        self.max_memory = max_memory if max_memory is not None else float("inf")
+
+
+class StopRun(BaseException):
+    """Raised by code the program calls, such as a replaced stdout, to end the run where it is.
+
+    The message is recorded as the error of the run. Derives from BaseException like LimitExceeded.
+    """
+
+
+class LimitExceeded(BaseException):
+    """Ends a run that went over one of its RunLimits.
+
+    Derives from BaseException so that `except Exception` in the program cannot swallow it.
+    """
+
+    def __init__(self, limit, limits, lineno):
+        self.limit = limit
+        self.lineno = lineno
+        if limit == "steps":
+            description = f"maximum of {limits.max_steps} steps reached"
+        elif limit == "wall_time":
+            description = f"maximum time of {limits.max_wall_time:g}s reached"
+        elif limit == "cpu_time":
+            description = f"maximum CPU time of {limits.max_cpu_time:g}s reached"
+        else:
+            description = f"memory ceiling of {limits.max_memory / 2 ** 20:g} MB reached"
+        super().__init__(f"Stopped: {description} at line {lineno}")
+
+
+def current_rss():
+    """The resident set size of this process in bytes, or 0 if it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        if resource is None:
+            return 0
+        # Peak instead of current usage, in kilobytes except on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_address_space():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class ProgramStream(TraceStream):
+    """The stdout of a run. What the program writes is recorded in order with the steps of the thread
+    that wrote it, and passed on to `stream`; what the GUI thread writes goes to `console`.
+    """
+
+    def __init__(self, step_logger, stream, console=None):
+        super().__init__(step_logger.parent.trace, stream)
+        self.step_logger = step_logger
+        self.console = console
+        self.gui_thread = threading.main_thread().ident if console is not None else None
+
+    def write(self, text):
+        if threading.get_ident() == self.gui_thread:
+            self.console.write(text)
+            return
+        self.step_logger.record_now((OUTPUT, str(text)))
+        if self.stream is not None:
+            self.stream.write(text)
+
+
+class InputExhaustedError(EOFError):
+    """Raised by input() in a run without a GUI once every scripted input has been used."""
+
 
 class StepLoggerThread(QtCore.QThread):
     error = QtCore.Signal(tuple)
+    inputRequested = QtCore.Signal(str)
+    breakpointHit = QtCore.Signal(int, str)
+    threadStarted = QtCore.Signal(str)
 
     def __init__(self, main_window):
         super().__init__()
@@ -239,42 +1369,251 @@ class StepLoggerThread(QtCore.QThread):
             self.line_updated_signal = main_window.lineUpdated
             self.go_to_line_signal = main_window.goToLine
             self.line_finished_signal = main_window.lineFinished
+            self.update_variable_signal = main_window.updateVariable
+            self.watch_updated_signal = main_window.watchUpdated
+            self.object_graph_signal = main_window.objectGraphUpdated
             self.stream_out = EmittingStream(self.main_window.stdout)
         else:
             self.line_updated_signal = None
             self.go_to_line_signal = None
             self.line_finished_signal = None
+            self.update_variable_signal = None
+            self.watch_updated_signal = None
+            self.object_graph_signal = None
             self.stream_out = sys.stdout
         self.step_logger: StepLogger | None = None
         self.wait = False
+        self.free_run = False
+        self.limits = RunLimits()
+        # Whether the run capped the address space of the process, so a MemoryError is the memory limit
+        self.address_space_capped = False
+        # How far each step goes, one of GRANULARITIES; used from the next run
+        self.granularity = LINE
+        # Replaced rather than changed in place, so the tracer can iterate it while the GUI edits it
+        self.watches = []
+        self.watch_evaluator = WatchEvaluator()
+        # Set by the GUI while the memory view is open; the objects reachable from the variables
+        self.object_graph = None
+        # 1-based line number -> Breakpoint, replaced rather than changed in place like the watches
+        self.breakpoints = {}
+        # Whether a free run stops at breakpoints (Continue) or ignores them (Run to End)
+        self.stop_at_breakpoints = False
+        # The name of the only thread whose steps wait for the user and are shown, None for every thread
+        self.followed_thread = None
+        self.pending_lines = {}
+        self.pending_variables = {}
+        self.trace: Trace | None = None
         self.stdout_ = sys.stdout
         self.test_file = None
+        self.inputs = []
+        self.input_index = 0
+        self.input_answer = None
+        self.input_answered = threading.Event()
+
+    def add_watch(self, expression) -> Watch:
+        """Adds a watch expression, raising SyntaxError if it is not a valid expression."""
+        watch = Watch(expression)
+        self.watches = self.watches + [watch]
+        return watch
+
+    def remove_watch(self, watch_id):
+        self.watches = [watch for watch in self.watches if watch.watch_id != watch_id]
+
+    def set_breakpoint(self, lineno, condition=None, hit_count=None) -> Breakpoint:
+        """Sets a breakpoint on a 0-based line, raising SyntaxError if the condition is not a valid expression."""
+        breakpoint = Breakpoint(lineno + 1, condition, hit_count)
+        self.breakpoints = {**self.breakpoints, lineno + 1: breakpoint}
+        return breakpoint
+
+    def clear_breakpoint(self, lineno):
+        self.breakpoints = {line: breakpoint for line, breakpoint in self.breakpoints.items() if line != lineno + 1}
+
+    def set_inputs(self, inputs):
+        """Sets the answers input() returns, in order, on the next run. Without a GUI, running out of them is an error."""
+        self.inputs = list(inputs)
+
+    def load_inputs(self, input_file):
+        """Loads scripted answers for input() from a file, one per line."""
+        with open(input_file) as f:
+            self.set_inputs(line.rstrip("\r\n") for line in f)
+
+    def read_input(self, prompt=""):
+        """Replaces input() while the program runs: answers from the input script first, then from the GUI."""
+        sys.stdout.write(str(prompt))
+        if self.input_index < len(self.inputs):
+            answer = self.inputs[self.input_index]
+            self.input_index += 1
+        elif self.main_window:
+            self.input_answered.clear()
+            self.inputRequested.emit(str(prompt))
+            self.input_answered.wait()
+            answer = self.input_answer
+            if self.step_logger.quitting:
+                raise bdb.BdbQuit
+            if answer is None:
+                raise EOFError("No input was given")
+        else:
+            raise InputExhaustedError(f"input() was called {self.input_index + 1} times, "
+                                      f"but only {len(self.inputs)} scripted inputs were given")
+        self.step_logger.record_now((INPUT, answer))
+        # Echo the answer like a terminal would
+        sys.stdout.write(answer + "\n")
+        return answer
+
+    def answer_input(self, answer):
+        """Answers an inputRequested signal; None makes input() raise EOFError."""
+        self.input_answer = answer
+        self.input_answered.set()
 
     def run(self):
         self.step_logger = StepLogger(self, self.main_window)
+        # The lines are decoded as the run reaches them, or when the trace is saved or sent with its source
+        self.trace = Trace(self.step_logger.file_to_visualize, self.step_logger.source)
+        console_out = self.stream_out
+        self.stream_out = ProgramStream(self.step_logger, console_out, self.stdout_ if self.main_window else None)
+        self.input_index = 0
+        builtin_input = builtins.input
+        builtins.input = self.read_input
+        thread_excepthook = threading.excepthook
+        threading.excepthook = self.thread_exception
+        running = set(threading.enumerate())
+        # Before the threads the program starts are traced, as it is not one of them
+        self.watch_evaluator.start()
+        self.step_logger.start_watchdog()
+        address_space_limit = self.limit_address_space()
+        # Otherwise a MemoryError is an error of the program like any other
+        self.address_space_capped = address_space_limit is not None
         try:
-            self.step_logger.set_trace()
+            if self.step_logger.granularity in (EXPRESSION, *_COARSE_GRANULARITIES):
+                self.step_logger.start_monitoring()
+            if self.step_logger.granularity not in _COARSE_GRANULARITIES:
+                # Threads the program starts are traced from their first call
+                threading.settrace(self.step_logger.trace_dispatch)
+                self.step_logger.set_trace()
+            # Stays the stdout until stop(), as ProgramStream sends what the GUI writes to the console
+            sys.stdout = self.stream_out
             if self.main_window:
-                sys.stdout = self.stream_out
                 runpy.run_path(self.main_window.file_to_visualize, run_name="__main__")
+                self.join_threads(running)
                 print("\nCode finished running!")
-                sys.stdout = self.stdout_
             elif self.test_file:
                 runpy.run_path(self.test_file, run_name="__main__")
+                self.join_threads(running)
         except bdb.BdbQuit:
             pass
+        except (StopRun, LimitExceeded) as e:
+            self.run_stopped(e)
+        except MemoryError as e:
+            if self.address_space_capped:
+                self.run_stopped(e)
+            else:
+                self.run_failed()
         except:
-            traceback.print_exc()
-            exctype, value = sys.exc_info()[:2]
-            self.error.emit((exctype, value, traceback.format_exc()))
+            self.run_failed()
         finally:
+            self.step_logger.stop_watchdog()
+            threading.settrace(None)
+            # set_trace() also traced the frames that called run(), which would keep the run alive with them
+            frame = sys._getframe()
+            while frame is not None:
+                if frame.f_trace == self.step_logger.trace_dispatch:
+                    frame.f_trace = None
+                frame = frame.f_back
+            threading.excepthook = thread_excepthook
+            self.step_logger.stop_monitoring()
+            self.step_logger.flush_threads()
+            if address_space_limit is not None:
+                resource.setrlimit(resource.RLIMIT_AS, address_space_limit)
+            builtins.input = builtin_input
+            self.stream_out = console_out
+            self.flush_pending()
             self.stop()
 
+    def run_stopped(self, e):
+        """Records the end of a run by StopRun or by one of its limits, in any thread of the program."""
+        if isinstance(e, StopRun):
+            self.step_logger.record_now((ERROR, str(e)))
+            return
+        if isinstance(e, MemoryError):
+            e = LimitExceeded("memory", self.limits, self.step_logger.heatmap.current_line)
+        # Tracing is already off, as the exception was raised by the trace function or the program
+        self.stream_out.write(f"\n{e}\n")
+        self.step_logger.record_now((ERROR, str(e)))
+        self.error.emit((LimitExceeded, e, str(e)))
+
+    def run_failed(self):
+        """Records the end of a run by an exception of the program."""
+        traceback.print_exc()
+        exctype, value = sys.exc_info()[:2]
+        self.step_logger.record_now((ERROR, traceback.format_exc()))
+        self.error.emit((exctype, value, traceback.format_exc()))
+
+    def join_threads(self, running):
+        """Waits for the threads the program started, except daemon threads, like Python does before it exits."""
+        for thread in threading.enumerate():
+            if thread in running or thread.daemon:
+                continue
+            while thread.is_alive() and not self.step_logger.quitting and self.step_logger.stop_error is None:
+                thread.join(0.05)
+        if self.step_logger.stop_error is not None:
+            raise self.step_logger.stop_error
+        if self.step_logger.quitting:
+            raise bdb.BdbQuit
+
+    def thread_exception(self, args):
+        """threading.excepthook while the program runs, for exceptions that end one of its threads."""
+        step_logger = self.step_logger
+        if issubclass(args.exc_type, bdb.BdbQuit) or args.exc_value is step_logger.stop_error:
+            return
+        if (issubclass(args.exc_type, (StopRun, LimitExceeded))
+                or issubclass(args.exc_type, MemoryError) and self.address_space_capped):
+            # The whole run ends: the other threads raise it at their next step, without waiting for the user
+            step_logger.stop_run(args.exc_value)
+            return
+        # Like Python, the traceback is shown and the other threads go on
+        self.stream_out.write(f"Exception in thread {args.thread.name}:\n" + "".join(
+            traceback.format_exception(args.exc_type, args.exc_value, args.exc_traceback)))
+
+    def limit_address_space(self):
+        """In a worker process, caps the address space at the memory limit above the current size.
+
+        The cap applies to the whole process, so runs in the GUI or any other process that goes on
+        after the run are not capped. Returns the previous limit to restore, or None if nothing was changed.
+        """
+        if (self.main_window or multiprocessing.parent_process() is None or resource is None
+                or self.limits.max_memory == float("inf")):
+            return None
+        address_space = current_address_space()
+        if address_space is None:
+            return None
+        previous = resource.getrlimit(resource.RLIMIT_AS)
+        limit = address_space + int(self.limits.max_memory)
+        if previous[1] != resource.RLIM_INFINITY:
+            limit = min(limit, previous[1])
+        resource.setrlimit(resource.RLIMIT_AS, (limit, previous[1]))
+        return previous
+
+    def run_to_end(self):
+        """Stops waiting for the user and runs the rest of the program at full speed."""
+        self.stop_at_breakpoints = False
+        self.free_run = True
+        if self.step_logger is not None:
+            self.step_logger.free_run = True
+
+    def continue_to_breakpoint(self):
+        """Runs at full speed like run_to_end, until a breakpoint fires."""
+        self.stop_at_breakpoints = True
+        self.free_run = True
+        if self.step_logger is not None:
+            self.step_logger.free_run = True
+
     def stop(self):
-        sys.stdout = self.stdout_
         if self.step_logger is not None:
             self.step_logger.set_quit()
+            self.answer_input(None)
             self.next_step()
+        # Restore stdout only once tracing stopped, as the program writes to it until it quits
+        sys.stdout = self.stdout_
         self.emit_line_updated(-1, "")
         self.quit()
 
@@ -287,19 +1626,85 @@ class StepLoggerThread(QtCore.QThread):
         self.step_logger.next_step = True
         if self.step_logger.last_line is None:
             return None, None
-        return self.step_logger.last_line - 1, self.step_logger.source_output[self.step_logger.last_line - 1]
+        return self.step_logger.last_line - 1, self.step_logger.output_line(self.step_logger.last_line - 1)
         
-    def emit_line_updated(self, lineno, line):
+    def pause_at_breakpoint(self, breakpoint):
+        """Called by the tracer when a breakpoint fires: goes back to waiting for the user at every step."""
+        self.step_logger.free_run = False
+        self.stop_at_breakpoints = False
+        self.flush_pending()
+        self.breakpointHit.emit(breakpoint.lineno - 1, breakpoint.description)
+
+    def flush_pending(self):
+        """Sends the final state of lines and variables that changed while the GUI was not updated."""
+        self.free_run = False
+        pending_lines, self.pending_lines = self.pending_lines, {}
+        pending_variables, self.pending_variables = self.pending_variables, {}
         if self.line_updated_signal:
-            self.line_updated_signal.emit(lineno, line)
+            for lineno, line in pending_lines.items():
+                self.line_updated_signal.emit(lineno, line)
+        if self.update_variable_signal:
+            for name, value in pending_variables.items():
+                self.update_variable_signal.emit((name, value))
+
+    # While running at full speed, every event is recorded in the trace but the GUI only gets the
+    # final value of each line and variable once the run is over. Events are recorded by the thread
+    # of the program that sent them; the GUI only moves to the steps of the thread it follows.
+
+    def emit_line_updated(self, lineno, line):
+        # -1 only tells the GUI that the run is over
+        if lineno >= 0:
+            self.step_logger.thread_state().events.append((UPDATE, lineno, line))
+        if self.free_run and lineno >= 0:
+            self.pending_lines[lineno] = line
+        elif self.line_updated_signal:
+            profiler.count("signals_emitted")
+            with profiler.span("signal"):
+                self.line_updated_signal.emit(lineno, line)
         
     def emit_go_to_line(self, lineno):
-        if self.go_to_line_signal:
-            self.go_to_line_signal.emit(lineno)
+        state = self.step_logger.thread_state()
+        state.events.append((GO_TO, lineno))
+        if self.go_to_line_signal and not self.free_run and self.step_logger.is_followed(state):
+            profiler.count("signals_emitted")
+            with profiler.span("signal"):
+                self.go_to_line_signal.emit(lineno)
         
     def emit_line_finished(self, lineno):
-        if self.line_finished_signal:
-            self.line_finished_signal.emit(lineno)
+        state = self.step_logger.thread_state()
+        state.events.append((LINE_FINISHED, lineno))
+        # The GUI reads the trace up to this step
+        self.step_logger.flush_events(state)
+        if self.line_finished_signal and not self.free_run and self.step_logger.is_followed(state):
+            profiler.count("signals_emitted")
+            with profiler.span("signal"):
+                self.line_finished_signal.emit(lineno)
+
+    def emit_variable_updated(self, name, value):
+        state = self.step_logger.thread_state()
+        name += state.suffix
+        state.events.append((VARIABLE, name, value))
+        if self.free_run:
+            self.pending_variables[name] = value
+        elif self.update_variable_signal:
+            profiler.count("signals_emitted")
+            with profiler.span("signal"):
+                self.update_variable_signal.emit((name, value))
+
+    def emit_watch_updated(self, watch_id, value):
+        if self.watch_updated_signal:
+            profiler.count("signals_emitted")
+            with profiler.span("signal"):
+                self.watch_updated_signal.emit(watch_id, value)
+
+    def emit_object_graph(self, update):
+        if self.object_graph_signal:
+            profiler.count("signals_emitted")
+            with profiler.span("signal"):
+                self.object_graph_signal.emit(update)
+
+    def emit_thread_started(self, name):
+        self.threadStarted.emit(name)
 
     def emit_ready(self):
         if self.line_finished_signal:
@@ -310,6 +1715,22 @@ class StepLoggerThread(QtCore.QThread):
         self.stream_out = None
 
 
+def record_run(file_to_visualize, inputs=(), limits=None, granularity=LINE) -> Trace:
+    """Runs a program at full speed without a GUI and returns its recorded trace.
+
+    `inputs` are the answers input() returns, for example `trace.inputs` of an earlier run to replay it.
+    """
+    thread = StepLoggerThread(None)
+    thread.set_test_file(file_to_visualize)
+    thread.set_inputs(inputs)
+    if limits is not None:
+        thread.limits = limits
+    thread.granularity = granularity
+    thread.free_run = True
+    thread.run()
+    return thread.trace
+
+
 class EmittingStream(QtCore.QObject):
 
     def __init__(self, signal):
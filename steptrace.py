@@ -0,0 +1,414 @@
+import json
+from array import array
+from bisect import bisect_right
+from collections.abc import Sequence
+
+# Event kinds of a recorded run. Every event is a tuple starting with its kind.
+LINE = 0      # (LINE, lineno)           the engine stopped before/after a line: one step
+UPDATE = 1    # (UPDATE, lineno, text)   a line of the interpreted code was rewritten
+VARIABLE = 2  # (VARIABLE, name, value)  a variable changed, value is None when it went out of scope
+OUTPUT = 3    # (OUTPUT, text)           the program wrote to stdout
+GO_TO = 4     # (GO_TO, lineno)          the current line moved without a new step
+INPUT = 5     # (INPUT, text)            input() returned text
+ERROR = 6     # (ERROR, message)         the run ended with an exception
+THREAD = 7    # (THREAD, name)           the following events come from another thread of the program
+
+# The thread the events of a trace come from until its first THREAD event
+MAIN_THREAD = "MainThread"
+
+TRACE_VERSION = 2
+
+
+class EventLog(Sequence):
+    """The events of a run in columns of machine integers, read back as the event tuples.
+
+    Every event takes a kind byte and two 32-bit integers. Strings (variable names, values and
+    output) are stored once in a table and referred to by index. A rewritten line is stored as
+    the one span where it differs from the original line of `source`, so each UPDATE only adds
+    three integers and its new text.
+    """
+
+    def __init__(self, source, events=()):
+        self.source = source
+        self.kinds = array('b')
+        # LINE, GO_TO, UPDATE: the line number; VARIABLE: the name; OUTPUT, INPUT, ERROR: the text
+        self.first = array('i')
+        # VARIABLE: the value, -1 for None; UPDATE: the span
+        self.second = array('i')
+        self.span_starts = array('I')
+        self.span_ends = array('I')
+        self.span_texts = array('i')
+        self.strings = []
+        self.string_ids = {}
+        self.extend(events)
+
+    def __getstate__(self):
+        # The index of the string table is rebuilt on the first append after unpickling
+        state = self.__dict__.copy()
+        state["string_ids"] = None
+        return state
+
+    def intern(self, text):
+        if self.string_ids is None:
+            self.string_ids = {string: i for i, string in enumerate(self.strings)}
+        string_id = self.string_ids.get(text)
+        if string_id is None:
+            string_id = self.string_ids[text] = len(self.strings)
+            self.strings.append(text)
+        return string_id
+
+    def append(self, event):
+        kind = event[0]
+        if kind == LINE or kind == GO_TO:
+            first, second = event[1], 0
+        elif kind == UPDATE:
+            first, second = event[1], self._add_span(event[1], event[2])
+        elif kind == VARIABLE:
+            first, second = self.intern(event[1]), -1 if event[2] is None else self.intern(event[2])
+        else:
+            first, second = self.intern(event[1]), 0
+        self.kinds.append(kind)
+        self.first.append(first)
+        self.second.append(second)
+
+    def extend(self, events):
+        for event in events:
+            self.append(event)
+
+    def _base_line(self, lineno):
+        return self.source[lineno] if 0 <= lineno < len(self.source) else ""
+
+    def _add_span(self, lineno, text):
+        base = self._base_line(lineno)
+        # Longest common prefix, then suffix, by binary search over slices compared in C
+        low, high = 0, min(len(base), len(text))
+        while low < high:
+            middle = (low + high + 1) // 2
+            if base[:middle] == text[:middle]:
+                low = middle
+            else:
+                high = middle - 1
+        start = low
+        low, high = 0, min(len(base), len(text)) - start
+        while low < high:
+            middle = (low + high + 1) // 2
+            if base[len(base) - middle:] == text[len(text) - middle:]:
+                low = middle
+            else:
+                high = middle - 1
+        self.span_starts.append(start)
+        self.span_ends.append(len(base) - low)
+        self.span_texts.append(self.intern(text[start:len(text) - low]))
+        return len(self.span_starts) - 1
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.kinds)))]
+        kind = self.kinds[index]
+        if kind == LINE or kind == GO_TO:
+            return kind, self.first[index]
+        if kind == UPDATE:
+            lineno, span = self.first[index], self.second[index]
+            base = self._base_line(lineno)
+            return (UPDATE, lineno, base[:self.span_starts[span]] + self.strings[self.span_texts[span]]
+                    + base[self.span_ends[span]:])
+        if kind == VARIABLE:
+            value = self.second[index]
+            return VARIABLE, self.strings[self.first[index]], None if value < 0 else self.strings[value]
+        return kind, self.strings[self.first[index]]
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self.kinds)))
+
+    def nbytes(self):
+        """Bytes used by the columns, not counting the strings."""
+        columns = (self.kinds, self.first, self.second, self.span_starts, self.span_ends, self.span_texts)
+        return sum(column.itemsize * len(column) for column in columns)
+
+
+class VariableHistory:
+    """When each variable changed: for every name, the steps and values of its changes.
+
+    A change belongs to the step whose LINE event follows it, so the value at step k is the last
+    change at a step <= k, found by binary search. Values are indices into the string table of the
+    trace's EventLog, -1 when the variable went out of scope. Several changes within one step
+    only keep the last.
+    """
+
+    def __init__(self, events):
+        self.events = events
+        self.steps = {}
+        self.values = {}
+
+    def record(self, name, step, value_id):
+        steps = self.steps.get(name)
+        if steps is None:
+            steps = self.steps[name] = array('i')
+            self.values[name] = array('i')
+        if steps and steps[-1] == step:
+            self.values[name][-1] = value_id
+        else:
+            steps.append(step)
+            self.values[name].append(value_id)
+
+    def _value(self, value_id):
+        return None if value_id < 0 else self.events.strings[value_id]
+
+    def names(self):
+        return list(self.steps)
+
+    def change_index(self, name, step):
+        """Index in the changes of `name` of the last one at or before `step`, -1 if there is none."""
+        steps = self.steps.get(name)
+        return bisect_right(steps, step) - 1 if steps is not None else -1
+
+    def value_at(self, name, step):
+        """The value of `name` at a step, None if it was not in scope."""
+        index = self.change_index(name, step)
+        return self._value(self.values[name][index]) if index >= 0 else None
+
+    def last_change(self, name, step):
+        """The step at or before `step` where `name` last changed, or None."""
+        index = self.change_index(name, step)
+        return self.steps[name][index] if index >= 0 else None
+
+    def changes(self, name):
+        """Every (step, value) change of `name`, oldest first."""
+        return list(zip(self.steps.get(name, ()), map(self._value, self.values.get(name, ()))))
+
+
+class Trace:
+    """The event stream of one engine run, in the order the GUI would have received it.
+
+    Line numbers are 0-based like the signals of StepLoggerThread. Events are kept in an EventLog
+    and read back as tuples; `history` indexes the changes of every variable by step. The events of
+    a program with several threads are merged, each run of them from one thread after a THREAD event.
+    """
+
+    def __init__(self, file_name, source, events=()):
+        self.file_name = file_name
+        self.source = source
+        self.events = EventLog(source, events)
+        self.history = VariableHistory(self.events)
+        # Index of the LINE event ending each step
+        self.step_ends = array('I')
+        self.step_count = 0
+        # The thread of the last event
+        self.thread = MAIN_THREAD
+        kinds, first, second = self.events.kinds, self.events.first, self.events.second
+        for index in range(len(kinds)):
+            if kinds[index] == LINE:
+                self.step_ends.append(index)
+                self.step_count += 1
+            elif kinds[index] == VARIABLE:
+                self.history.record(self.events.strings[first[index]], self.step_count, second[index])
+            elif kinds[index] == THREAD:
+                self.thread = self.events.strings[first[index]]
+
+    def add_events(self, events, thread=MAIN_THREAD):
+        """Appends event tuples of one thread, after a THREAD event if the last ones came from another thread."""
+        if thread != self.thread:
+            self.thread = thread
+            self.events.append((THREAD, thread))
+        for event in events:
+            kind = event[0]
+            if kind == LINE:
+                self.line_finished(event[1])
+            elif kind == VARIABLE:
+                self.variable_updated(event[1], event[2])
+            else:
+                self.events.append(event)
+
+    def line_finished(self, lineno):
+        self.step_ends.append(len(self.events))
+        self.events.append((LINE, lineno))
+        self.step_count += 1
+
+    def line_updated(self, lineno, text):
+        # -1 only tells the GUI that the run is over
+        if lineno >= 0:
+            self.events.append((UPDATE, lineno, text))
+
+    def variable_updated(self, name, value):
+        self.events.append((VARIABLE, name, value))
+        self.history.record(name, self.step_count, self.events.second[-1])
+
+    def go_to_line(self, lineno):
+        self.events.append((GO_TO, lineno))
+
+    def output(self, text):
+        self.events.append((OUTPUT, text))
+
+    def input(self, text):
+        self.events.append((INPUT, text))
+
+    def error(self, message):
+        self.events.append((ERROR, message))
+
+    def line_of(self, step):
+        """The 0-based line a step stopped at."""
+        return self.events.first[self.step_ends[step]]
+
+    @property
+    def inputs(self):
+        """Everything input() returned during the run, to replay it with the same answers."""
+        return [event[1] for event in self.events if event[0] == INPUT]
+
+    @property
+    def threads(self):
+        """The threads the events came from, in the order they first ran."""
+        kinds, first, strings = self.events.kinds, self.events.first, self.events.strings
+        threads = dict.fromkeys([MAIN_THREAD])
+        threads.update(dict.fromkeys(strings[first[index]] for index in range(len(kinds)) if kinds[index] == THREAD))
+        return list(threads)
+
+    @property
+    def error_message(self):
+        for event in reversed(self.events):
+            if event[0] == ERROR:
+                return event[1]
+        return None
+
+    def write_json(self, f):
+        """Streams the trace as JSON to the open text file `f` without building the whole document."""
+        f.write('{"version": %d, "file": %s, "source": %s, "steps": %d, "events": [\n' % (
+            TRACE_VERSION, json.dumps(self.file_name), json.dumps(list(self.source)), self.step_count))
+        # Encoding a chunk at once keeps the per-event work inside the C encoder
+        dumps = json.JSONEncoder(separators=(',', ':')).encode
+        for start in range(0, len(self.events), 4096):
+            if start:
+                f.write(",\n")
+            f.write(dumps(self.events[start:start + 4096])[1:-1])
+        f.write("\n]}\n")
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            self.write_json(f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        # Version 1 traces are the same without THREAD events
+        if data.get("version") not in (1, TRACE_VERSION):
+            raise ValueError(f"Unsupported trace version: {data.get('version')}")
+        return cls(data["file"], data["source"], data["events"])
+
+
+class TraceStream:
+    """A stdout replacement that records everything written to it and passes it on to `stream`."""
+
+    def __init__(self, trace, stream=None):
+        self.trace = trace
+        self.stream = stream
+
+    def write(self, text):
+        self.trace.output(str(text))
+        if self.stream is not None:
+            self.stream.write(text)
+
+    def flush(self):
+        if self.stream is not None:
+            self.stream.flush()
+
+
+class TraceCursor:
+    """Replays a recorded trace, keeping the state the GUI would show at the current step.
+
+    Step k is the state after the k-th LINE event; -1 is the state before the first step.
+    Snapshots are kept every KEYFRAME_INTERVAL steps so seeking backwards only replays a
+    bounded number of events.
+    """
+    KEYFRAME_INTERVAL = 256
+
+    def __init__(self, trace):
+        self.trace = trace
+        self.step_ends = trace.step_ends
+        self.keyframes = []
+        self.applied = -1
+        self.step = -1
+        self.current_line = -1
+        # The thread that made the current step
+        self.thread = MAIN_THREAD
+        self.lines = {}
+        self.variables = {}
+        self.output = []
+
+    def _apply_until(self, target):
+        events = self.trace.events
+        start = self.applied + 1
+        for index in range(start, target + 1):
+            event = events[index]
+            kind = event[0]
+            if kind == LINE:
+                self.current_line = event[1]
+                self.step += 1
+                if self.step % self.KEYFRAME_INTERVAL == 0 and len(self.keyframes) == self.step // self.KEYFRAME_INTERVAL:
+                    self.applied = index
+                    self.keyframes.append(self._snapshot())
+            elif kind == GO_TO:
+                self.current_line = event[1]
+            elif kind == THREAD:
+                self.thread = event[1]
+            elif kind == UPDATE:
+                self.lines[event[1]] = event[2]
+            elif kind == VARIABLE:
+                if event[2] is None:
+                    self.variables.pop(event[1], None)
+                else:
+                    self.variables[event[1]] = event[2]
+            elif kind == OUTPUT:
+                self.output.append(event[1])
+        self.applied = max(self.applied, target)
+        return events[start:target + 1]
+
+    def _snapshot(self):
+        return (self.applied, self.step, self.current_line, self.thread, self.lines.copy(), self.variables.copy(),
+                len(self.output))
+
+    def _restore(self, keyframe):
+        applied, self.step, self.current_line, self.thread, lines, variables, output_length = keyframe
+        self.lines = lines.copy()
+        self.variables = variables.copy()
+        if output_length > len(self.output):
+            # A keyframe ahead of the events applied so far: only the output in between is read
+            events = self.trace.events
+            index = self.applied
+            while len(self.output) < output_length:
+                index = events.kinds.index(OUTPUT, index + 1, applied + 1)
+                self.output.append(events[index][1])
+        del self.output[output_length:]
+        self.applied = applied
+
+    def forward(self, count=1):
+        """Moves `count` steps forward and returns the events that were applied."""
+        if not self.step_ends:
+            return []
+        step = min(self.step + count, len(self.step_ends) - 1)
+        return self._apply_until(self.step_ends[step])
+
+    def to_end(self):
+        """Applies every remaining event, including output written after the last step."""
+        return self._apply_until(len(self.trace.events) - 1)
+
+    def seek(self, step):
+        if not self.step_ends:
+            return
+        step = max(0, min(step, len(self.step_ends) - 1))
+        target = self.step_ends[step]
+        keyframe = min(step // self.KEYFRAME_INTERVAL, len(self.keyframes) - 1)
+        # Going back, or forward past a keyframe, starts from the last keyframe before the step
+        if target < self.applied or (keyframe >= 0 and self.keyframes[keyframe][0] > self.applied):
+            self._restore(self.keyframes[keyframe])
+        self._apply_until(target)
+
+    @property
+    def at_end(self):
+        return self.applied >= len(self.trace.events) - 1
+
+    def line(self, lineno):
+        """The interpreted code of a 0-based line at the current step."""
+        return self.lines.get(lineno, self.trace.source[lineno])
@@ -114,58 +114,68 @@ class PythonHighlighter(QtGui.QSyntaxHighlighter):
         r'\{', r'\}', r'\(', r'\)', r'\[', r'\]',
     ]
 
+    # Compiled rules per style, shared by every highlighter as each code line gets its own
+    _compiled = {}
+
     def __init__(self, parent: QtGui.QTextDocument, base_text_color: QColor) -> None:
         super().__init__(parent)
         self.style = STYLES_LIGHT
+        style_name = "light"
         if base_text_color.lightness() > 128:
             self.style = STYLES_DARK
+            style_name = "dark"
+        if style_name not in PythonHighlighter._compiled:
+            PythonHighlighter._compiled[style_name] = self.compile_rules(self.style)
+        self.tri_single, self.tri_double, self.rules = PythonHighlighter._compiled[style_name]
 
+    @staticmethod
+    def compile_rules(style):
         # Multi-line strings (expression, flag, style)
-        self.tri_single = (QtCore.QRegularExpression("'''"), 1, self.style['string2'])
-        self.tri_double = (QtCore.QRegularExpression('"""'), 2, self.style['string2'])
+        tri_single = (QtCore.QRegularExpression("'''"), 1, style['string2'])
+        tri_double = (QtCore.QRegularExpression('"""'), 2, style['string2'])
 
         rules = []
 
         # Keyword, operator, and brace rules
-        rules += [(r'\b%s\b' % w, 0, self.style['keyword'])
+        rules += [(r'\b%s\b' % w, 0, style['keyword'])
                   for w in PythonHighlighter.keywords]
-        rules += [(r'\b%s\(' % w, 0, self.style['method'])
+        rules += [(r'\b%s\(' % w, 0, style['method'])
                   for w in PythonHighlighter.methods]
-        rules += [(r'%s' % o, 0, self.style['operator'])
+        rules += [(r'%s' % o, 0, style['operator'])
                   for o in PythonHighlighter.operators]
-        rules += [(r'%s' % b, 0, self.style['brace'])
+        rules += [(r'%s' % b, 0, style['brace'])
                   for b in PythonHighlighter.braces]
 
         # All other rules
         rules += [
             # 'self'
-            (r'\bself\b', 0, self.style['self']),
+            (r'\bself\b', 0, style['self']),
 
             # 'def' followed by an identifier
-            (r'\bdef\b\s*(\w+)', 1, self.style['defclass']),
+            (r'\bdef\b\s*(\w+)', 1, style['defclass']),
             # 'class' followed by an identifier
-            (r'\bclass\b\s*(\w+)', 1, self.style['defclass']),
+            (r'\bclass\b\s*(\w+)', 1, style['defclass']),
 
             # Numeric literals
-            (r'\b[+-]?[0-9]+[lL]?\b', 0, self.style['numbers']),
-            (r'\b[+-]?0[xX][0-9A-Fa-f]+[lL]?\b', 0, self.style['numbers']),
-            (r'\b[+-]?[0-9]+(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?\b', 0, self.style['numbers']),
+            (r'\b[+-]?[0-9]+[lL]?\b', 0, style['numbers']),
+            (r'\b[+-]?0[xX][0-9A-Fa-f]+[lL]?\b', 0, style['numbers']),
+            (r'\b[+-]?[0-9]+(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?\b', 0, style['numbers']),
 
             # Double-quoted string, possibly containing escape sequences
-            (r'"[^"\\]*(\\.[^"\\]*)*"', 0, self.style['string']),
+            (r'"[^"\\]*(\\.[^"\\]*)*"', 0, style['string']),
             # Single-quoted string, possibly containing escape sequences
-            (r"'[^'\\]*(\\.[^'\\]*)*'", 0, self.style['string']),
+            (r"'[^'\\]*(\\.[^'\\]*)*'", 0, style['string']),
 
             # From '#' until a newline
-            (r'#[^\n]*', 0, self.style['comment']),
+            (r'#[^\n]*', 0, style['comment']),
 
             # Replaced text
-            (rf'({'\u200A'}.*?{'\u200A'})', 1, self.style['replaced']),
+            (rf'({'\u200A'}.*?{'\u200A'})', 1, style['replaced']),
         ]
 
         # Build a QRegExp for each pattern
-        self.rules = [(QtCore.QRegularExpression(pat), index, fmt)
-                      for (pat, index, fmt) in rules]
+        return tri_single, tri_double, [(QtCore.QRegularExpression(pat), index, fmt)
+                                        for (pat, index, fmt) in rules]
 
     def highlightBlock(self, text):
         """Apply syntax highlighting to the given block of text."""
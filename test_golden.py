@@ -0,0 +1,103 @@
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import unittest
+import difflib
+from concurrent.futures import ProcessPoolExecutor
+
+from steplogger import record_run, RunLimits
+from steptrace import LINE, UPDATE, VARIABLE, OUTPUT, GO_TO, INPUT, ERROR, THREAD
+
+# Every test_programs/*.py is run without a GUI and its recorded events are compared with the
+# golden file next to it, test_programs/name.golden. Answers for input() are read from name.input.
+# To accept the current behaviour as correct, rewrite the golden files with
+#     python test_golden.py --update    or    UPDATE_GOLDENS=1 python -m unittest discover
+PROGRAMS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_programs")
+GOLDEN_SUFFIX = ".golden"
+INPUT_SUFFIX = ".input"
+# Steps also count the lines the program runs in the standard library
+GOLDEN_LIMITS = RunLimits(max_steps=100_000, max_wall_time=30)
+# Programs without a golden file, because their runs are not deterministic
+SKIPPED_PROGRAMS = {
+    "test3.py",  # never ends, so how far it gets depends on the limits; see RunLimitsTests
+    "test7.py",  # how its threads interleave depends on the scheduler; see ThreadTests
+}
+
+KIND_NAMES = {LINE: "LINE", UPDATE: "UPDATE", VARIABLE: "VARIABLE", OUTPUT: "OUTPUT", GO_TO: "GO_TO",
+              INPUT: "INPUT", ERROR: "ERROR", THREAD: "THREAD"}
+_ADDRESS = re.compile(r" at 0x[0-9a-fA-F]+")
+
+update_goldens = bool(os.environ.get("UPDATE_GOLDENS"))
+
+
+def golden_lines(trace) -> list[str]:
+    """The events of a trace, one per line, without anything that changes between machines or runs."""
+    lines = []
+    for event in trace.events:
+        arguments = list(event[1:])
+        if event[0] == ERROR:
+            # The traceback has paths and line numbers of the engine, only the exception itself is compared
+            arguments = [event[1].strip().splitlines()[-1]]
+        text = json.dumps(arguments)[1:-1]
+        lines.append(f"{KIND_NAMES[event[0]]} {_ADDRESS.sub(' at 0x...', text)}".rstrip())
+    return lines
+
+
+def run_program(path) -> list[str]:
+    inputs = []
+    input_path = path[:-3] + INPUT_SUFFIX
+    if os.path.exists(input_path):
+        with open(input_path, encoding="utf-8") as f:
+            inputs = [line.rstrip("\r\n") for line in f]
+    return golden_lines(record_run(path, inputs, GOLDEN_LIMITS))
+
+
+def run_programs(paths) -> dict[str, list[str]]:
+    """Runs every program, in parallel across the CPU cores if there is more than one."""
+    workers = min(os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        return {path: run_program(path) for path in paths}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(paths, pool.map(run_program, paths)))
+
+
+class GoldenTraceTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.programs = sorted(path for path in glob.glob(os.path.join(PROGRAMS_DIR, "*.py"))
+                              if os.path.basename(path) not in SKIPPED_PROGRAMS)
+        cls.results = run_programs(cls.programs)
+
+    def test_programs(self):
+        self.assertTrue(self.programs)
+        for path in self.programs:
+            name = os.path.basename(path)
+            golden_path = path[:-3] + GOLDEN_SUFFIX
+            actual = self.results[path]
+            if actual and actual[-1].startswith('ERROR "Stopped: '):
+                with self.subTest(program=name):
+                    self.fail(f"{name} did not finish: {actual[-1][6:]}")
+                continue
+            if update_goldens:
+                with open(golden_path, "w", encoding="utf-8") as f:
+                    f.write("\n".join(actual) + "\n")
+                continue
+            with self.subTest(program=name):
+                if not os.path.exists(golden_path):
+                    self.fail(f"{name} has no golden file, create it with: python test_golden.py --update")
+                with open(golden_path, encoding="utf-8") as f:
+                    expected = f.read().splitlines()
+                if actual != expected:
+                    diff = difflib.unified_diff(expected, actual, name[:-3] + GOLDEN_SUFFIX, "actual run", lineterm="")
+                    self.fail("\n" + "\n".join(list(diff)[:60]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare runs of the test programs with their golden traces")
+    parser.add_argument('--update', action='store_true', help="Rewrite the golden files from the current runs")
+    args, remaining = parser.parse_known_args()
+    update_goldens = update_goldens or args.update
+    unittest.main(argv=sys.argv[:1] + remaining)
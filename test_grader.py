@@ -0,0 +1,61 @@
+import os
+import tempfile
+import time
+import unittest
+
+from grader import expected_output, grade, grade_all
+from steplogger import RunLimits
+
+
+class GraderTests(unittest.TestCase):
+    def test_pass(self):
+        expected = expected_output('test_programs/test1.py')
+        self.assertEqual(expected, "16.0\nHello World\n")
+        result = grade('test_programs/test1.py', expected)
+        self.assertEqual(result["status"], "pass")
+        self.assertIsNone(result["divergence"])
+
+    def test_stops_at_first_wrong_output(self):
+        result = grade('test_programs/test1.py', "16.0\nHello Earth\n")
+        self.assertEqual(result["status"], "wrong output")
+        divergence = result["divergence"]
+        self.assertEqual(divergence["output_line"], 2)
+        self.assertEqual((divergence["expected"], divergence["actual"]), ("Hello Earth", "Hello World"))
+        self.assertEqual(divergence["code"], "print(b)")
+        self.assertEqual(divergence["variables"], {"a": "'Hello'", "b": "'Hello World'"})
+
+    def test_output_after_a_call(self):
+        result = grade('test_programs/test6.py', "best(Ada): 19\nMAX(SCORES)\n15\n")
+        divergence = result["divergence"]
+        self.assertEqual(divergence["output_line"], 1)
+        self.assertEqual(divergence["line"], 14)
+        self.assertEqual(divergence["code"], 'print(describe("Ada", [3, 9, 4], scale=2))')
+
+    def test_missing_output(self):
+        result = grade('test_programs/test1.py', "16.0\nHello World\nBye\n")
+        self.assertEqual(result["status"], "wrong output")
+        self.assertEqual(result["divergence"]["output_line"], 3)
+
+    def test_limit(self):
+        results = list(grade_all("", ['test_programs/test3.py'], limits=RunLimits(max_steps=1000), workers=1))
+        self.assertEqual(results[0]["status"], "limit")
+        self.assertRegex(results[0]["error"], r"^Stopped: maximum of 1000 steps")
+
+    def test_stuck_submission(self):
+        # The time limit cannot stop a program blocked in C code, so its worker process is killed
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sleep.py")
+            with open(path, "w") as f:
+                f.write("import time\ntime.sleep(60)\n")
+            paths = [path, 'test_programs/test1.py']
+            started = time.monotonic()
+            results = list(grade_all("16.0\nHello World\n", paths, limits=RunLimits(max_wall_time=0.5),
+                                     workers=1, timeout=1))
+        self.assertLess(time.monotonic() - started, 30)
+        statuses = {result["submission"]: result["status"] for result in results}
+        self.assertEqual(statuses, {path: "limit", 'test_programs/test1.py': "pass"})
+        self.assertRegex(results[0]["error"], r"^Stopped: still running 1s")
+
+
+if __name__ == '__main__':
+    unittest.main()
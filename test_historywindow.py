@@ -0,0 +1,42 @@
+import unittest
+
+from PySide6.QtWidgets import QApplication
+
+from historywindow import HistoryWindow
+from steptrace import Trace, LINE, VARIABLE
+
+
+class HistoryWindowTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication([])
+
+    def test_last_change_button(self):
+        trace = Trace("history.py", [], [(VARIABLE, "x", "1"), (LINE, 0), (LINE, 1)])
+        window = HistoryWindow()
+        self.addCleanup(window.deleteLater)
+        selected = []
+        window.stepSelected.connect(lambda step, line: selected.append((step, line)))
+        window.show_variable(trace, "x")
+        # The step still running changed x again, so the last change with a line is the earlier one
+        trace.variable_updated("x", "2")
+        window.refresh()
+        self.assertEqual(window.changes.topLevelItemCount(), 2)
+        self.assertTrue(window.last_button.isEnabled())
+        window.last_button.click()
+        self.assertEqual(selected, [(0, 0)])
+        trace.line_finished(2)
+        window.refresh()
+        window.last_button.click()
+        self.assertEqual(selected, [(0, 0), (2, 2)])
+
+    def test_no_change_yet(self):
+        trace = Trace("history.py", [], [(LINE, 0), (VARIABLE, "x", "1")])
+        window = HistoryWindow()
+        self.addCleanup(window.deleteLater)
+        window.show_variable(trace, "x")
+        self.assertFalse(window.last_button.isEnabled())
+
+
+if __name__ == '__main__':
+    unittest.main()
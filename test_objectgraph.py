@@ -0,0 +1,80 @@
+import unittest
+
+from objectgraph import (ObjectGraph, MAX_NODES, MAX_DEPTH, MAX_FIELDS, fingerprint_fields, changed_fields,
+                         field_name, variable_of, mutated_names)
+
+
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class ObjectGraphTests(unittest.TestCase):
+    def test_aliases_share_a_node(self):
+        a = [1, 2, [3]]
+        update = ObjectGraph().update({"a": a, "b": a, "n": 5})
+        self.assertEqual(update.roots["a"], update.roots["b"])
+        self.assertEqual(update.roots["n"], ("5", None))
+        self.assertEqual(len(update.changed), 2)
+        self.assertEqual(update.changed[0].fields[2][2], id(a[2]))
+
+    def test_only_changed_objects_are_sent(self):
+        graph = ObjectGraph()
+        point, nums = Point(1, 2), [[1], [2], [3]]
+        self.assertTrue(graph.update({"p": point, "nums": nums}).reset)
+        update = graph.update({"p": point, "nums": nums})
+        self.assertEqual((update.changed, update.removed, update.reset), ([], [], False))
+        point.x = 10
+        nums[1].append(4)
+        inner = nums.pop()
+        update = graph.update({"p": point, "nums": nums})
+        self.assertEqual({node.node_id for node in update.changed}, {id(point), id(nums), id(nums[1])})
+        self.assertEqual(update.removed, [id(inner)])
+
+    def test_limits(self):
+        update = ObjectGraph().update({f"v{i}": [i] for i in range(MAX_NODES * 2)})
+        self.assertTrue(update.truncated)
+        self.assertEqual(len(update.changed), MAX_NODES)
+        update = ObjectGraph().update({"nums": list(range(100))})
+        self.assertEqual((len(update.changed[0].fields), update.changed[0].more), (MAX_FIELDS, 100 - MAX_FIELDS))
+        nested = []
+        for _ in range(MAX_DEPTH * 2):
+            nested = [nested]
+        update = ObjectGraph().update({"nested": nested})
+        self.assertEqual(len(update.changed), MAX_DEPTH)
+        self.assertEqual(update.changed[-1].fields, [("0", "list…", None)])
+
+
+class FieldChangeTests(unittest.TestCase):
+    def test_changed_fields(self):
+        nums, ages, point = [1, 2, 3], {"ann": 30, "bob": 40}, Point(1, 2)
+        before = [fingerprint_fields(value) for value in (nums, ages, point)]
+        nums[1] = 20
+        nums.append(4)
+        ages["bob"] += 1
+        del ages["ann"]
+        point.x = 10
+        after = [fingerprint_fields(value) for value in (nums, ages, point)]
+        self.assertEqual(changed_fields(before[0], after[0]), [1, 3])
+        self.assertEqual(changed_fields(before[1], after[1]), ["bob", "ann"])
+        self.assertEqual(changed_fields(before[2], after[2]), ["x"])
+        self.assertEqual(changed_fields(after[0], fingerprint_fields(nums)), [])
+        self.assertIsNone(fingerprint_fields("text"))
+
+    def test_field_names(self):
+        self.assertEqual(field_name("ages", {}, "bob"), "ages['bob']")
+        self.assertEqual(field_name("self", Point(1, 2), "x"), "self.x")
+        self.assertEqual(variable_of("nums[2]"), "nums")
+        self.assertEqual(variable_of("self.count (worker 1)"), "self (worker 1)")
+        self.assertEqual(variable_of("ages['a (b)']"), "ages")
+        self.assertIsNone(variable_of("i (worker 1)"))
+
+    def test_mutated_names(self):
+        source = "".join(["nums[i] = 0\n", "self.count += 1\n", "total = total + 1\n", "for x in items.copy():\n",
+                          "    update(nums)\n", "print(len(nums))\n"])
+        self.assertEqual(mutated_names(source), {1: {"nums"}, 2: {"self"}, 4: {"items"}, 5: None})
+
+
+if __name__ == '__main__':
+    unittest.main()
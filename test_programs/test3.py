@@ -0,0 +1,3 @@
+count = 0
+while True:
+    count = count + 1
@@ -0,0 +1,7 @@
+name = input("What is your name? ")
+count = int(input("How many times? "))
+greetings = []
+for i in range(count):
+    greetings.append("Hello " + name)
+print(greetings)
+print(greetings[count])
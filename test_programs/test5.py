@@ -0,0 +1,17 @@
+def factorial(n):
+    if n <= 1:
+        return 1
+    return n * factorial(n - 1)
+
+
+def count_letters(word):
+    counts = {}
+    for letter in word:
+        counts[letter] = counts.get(letter, 0) + 1
+    return counts
+
+
+result = factorial(4)
+print(result)
+letters = count_letters("banana")
+print(letters)
@@ -0,0 +1,16 @@
+def describe(name, scores, *extra, scale=1):
+    label = "best(" + name + ")"
+    best = max(scores) * scale
+    return label + ": " + str(best)
+
+
+def outer(step):
+    def inner(value):
+        return value + step
+    return inner(10)
+
+
+text = "max(scores)"
+print(describe("Ada", [3, 9, 4], scale=2))
+print(text.upper())
+print(outer(5))
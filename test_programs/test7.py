@@ -0,0 +1,19 @@
+import threading
+
+totals = [0, 0, 0]
+
+
+def add_up(index, count):
+    for i in range(count):
+        totals[index] = totals[index] + i
+
+
+workers = []
+for n in range(3):
+    worker = threading.Thread(target=add_up, args=(n, 4 + n), name=f"worker {n}")
+    workers.append(worker)
+    worker.start()
+
+for worker in workers:
+    worker.join()
+print(totals)
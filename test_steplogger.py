@@ -1,97 +1,212 @@
+import os
+import sys
+import tempfile
+import time
 import unittest
-import logging
-
-from steplogger import StepLoggerThread
-
-
-class StepLoggerTests(unittest.TestCase):
-    @classmethod
-    def setUpClass(cls):
-        cls.step_logger = StepLoggerThread(None)
-        logging.basicConfig(level=logging.DEBUG)
-
-    def test_test1(self):
-        _expected = [
-            (1, "def my_function():"),
-            (8, "def my_function_2():"),
-            (14, "my_function()"),
-            (2, "x = 20 + 4"),
-            (2, "x = \u200A24\u200A"),
-            (3, "y = \u200A24\u200A * 2"),
-            (3, "y = \u200A48\u200A"),
-            (4, "z = \u200A48\u200A / 3"),
-            (4, "z = \u200A16.0\u200A"),
-            (5, "print(\u200A16.0\u200A)"),
-            (15, "my_function_2()"),
-            (9, "a = \"Hello\""),
-            (9, "a = \u200A'Hello'\u200A"),
-            (10, "b = \u200A'Hello'\u200A + \" World\""),
-            (10, "b = \u200A'Hello World'\u200A"),
-            (11, "print(\u200A'Hello World'\u200A)"),
-        ]
-        self.step_logger.set_test_file('test_programs/test1.py')
-        self.step_logger.start()
-        _expected_index = 0
-        while self.step_logger.isRunning():
-            lineno, line = self.step_logger.next_step()
-            if lineno is None:
-                continue
-            with self.subTest(index=_expected_index):
-                self.assertEqual(_expected[_expected_index], (lineno + 1, line.strip("\n\t ")))
-            _expected_index += 1
-            if _expected_index == len(_expected):
-                break
-        self.step_logger.next_step()
-        self.step_logger.stop()
-
-    def test_test2(self):
-        _expected = [
-            (1, "def my_loop(repeat):"),
-            (8, "my_loop(4)"),
-            (2, "for i in range(\u200A4\u200A):"),
-            (2, "for \u200A0\u200A in range(\u200A4\u200A):"),
-            (3, "x = 2"),
-            (3, "x = \u200A2\u200A"),
-            (4, "total = \u200A0\u200A + \u200A2\u200A + 1"),
-            (4, "total = \u200A3\u200A"),
-            (5, "print(\u200A3\u200A)"),
-            (2, "for \u200A0\u200A in range(\u200A4\u200A):"),
-            (2, "for \u200A1\u200A in range(\u200A4\u200A):"),
-            (3, "x = 2"),
-            (3, "x = \u200A2\u200A"),
-            (4, "total = \u200A1\u200A + \u200A2\u200A + 1"),
-            (4, "total = \u200A4\u200A"),
-            (5, "print(\u200A4\u200A)"),
-            (2, "for \u200A1\u200A in range(\u200A4\u200A):"),
-            (2, "for \u200A2\u200A in range(\u200A4\u200A):"),
-            (3, "x = 2"),
-            (3, "x = \u200A2\u200A"),
-            (4, "total = \u200A2\u200A + \u200A2\u200A + 1"),
-            (4, "total = \u200A5\u200A"),
-            (5, "print(\u200A5\u200A)"),
-            (2, "for \u200A2\u200A in range(\u200A4\u200A):"),
-            (2, "for \u200A3\u200A in range(\u200A4\u200A):"),
-            (3, "x = 2"),
-            (3, "x = \u200A2\u200A"),
-            (4, "total = \u200A3\u200A + \u200A2\u200A + 1"),
-            (4, "total = \u200A6\u200A"),
-            (5, "print(\u200A6\u200A)"),
-        ]
-        self.step_logger.set_test_file('test_programs/test2.py')
-        self.step_logger.start()
-        _expected_index = 0
-        while self.step_logger.isRunning():
-            lineno, line = self.step_logger.next_step()
-            if lineno is None:
-                continue
-            with self.subTest(index=_expected_index):
-                self.assertEqual(_expected[_expected_index], (lineno + 1, line.strip("\n\t ")))
-            _expected_index += 1
-            if _expected_index == len(_expected):
-                break
-        print("\ttest2.py")
-        self.step_logger.next_step()
-        self.step_logger.stop()
+
+from breakpoints import Breakpoint
+from steplogger import StepLoggerThread, RunLimits, record_run, substitute_names, EXPRESSION, STATEMENT, LOOP, FUNCTION
+from steptrace import TraceCursor, LINE, UPDATE, OUTPUT, THREAD
+
+# How long a test waits for a run in a StepLoggerThread before it fails instead of hanging the suite
+TIMEOUT = 10
+
+
+def wait_until(condition):
+    deadline = time.monotonic() + TIMEOUT
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError(f"Still waiting after {TIMEOUT}s")
+        time.sleep(0.001)
+
+
+def stop_run(step_logger):
+    """Stops the run, so a failed test does not leave its thread running."""
+    if step_logger.isRunning():
+        step_logger.stop()
+        wait_until(lambda: not step_logger.isRunning())
+
+
+class RunLimitsTests(unittest.TestCase):
+    def test_max_steps(self):
+        trace = record_run('test_programs/test3.py', limits=RunLimits(max_steps=1000))
+        self.assertRegex(trace.error_message, r"^Stopped: maximum of 1000 steps reached at line [23]$")
+
+    def test_steps_start_at_the_program(self):
+        # runpy runs many more lines than this before the first line of the program
+        trace = record_run('test_programs/test1.py', limits=RunLimits(max_steps=2))
+        self.assertRegex(trace.error_message, r"^Stopped: maximum of 2 steps reached at line [1-9]\d*$")
+
+    def test_max_wall_time(self):
+        trace = record_run('test_programs/test3.py', limits=RunLimits(max_wall_time=0.2))
+        self.assertRegex(trace.error_message, r"^Stopped: maximum time of 0.2s reached at line [23]$")
+
+    def test_generous_limits(self):
+        trace = record_run('test_programs/test1.py', limits=RunLimits(max_steps=10 ** 6, max_wall_time=60))
+        self.assertIsNone(trace.error_message)
+
+    def record_program(self, text, limits, granularity=None):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "program.py")
+            with open(path, "w") as f:
+                f.write(text)
+            if granularity is None:
+                return record_run(path, limits=limits)
+            return record_run(path, limits=limits, granularity=granularity)
+
+    def test_swallowed_limit(self):
+        # The bare except catches the limit and turns off the tracer, so only the watchdog can stop the run
+        text = "while True:\n    try:\n        while True:\n            pass\n    except:\n        pass\n"
+        trace = self.record_program(text, RunLimits(max_steps=1000))
+        self.assertRegex(trace.error_message, r"^Stopped: maximum of 1000 steps reached at line [34]$")
+        trace = self.record_program(text, RunLimits(max_wall_time=0.2), FUNCTION)
+        self.assertRegex(trace.error_message, r"^Stopped: maximum time of 0.2s reached at line \d$")
+
+    def test_limit_caught_by_the_program(self):
+        text = "try:\n    while True:\n        pass\nexcept BaseException:\n    pass\nprint('done')\n"
+        trace = self.record_program(text, RunLimits(max_wall_time=0.2))
+        self.assertRegex(trace.error_message, r"^Stopped: maximum time of 0.2s reached at line [23]$")
+        self.assertNotIn("done", "".join(event[1] for event in trace.events if event[0] == OUTPUT))
+
+    def test_memory_error_of_the_program(self):
+        # Not a limit: the address space of this process is not capped, so the program raised it itself
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "memory.py")
+            with open(path, "w") as f:
+                f.write("raise MemoryError('too big')\n")
+            trace = record_run(path, limits=RunLimits(max_memory=2 ** 30))
+        self.assertEqual(trace.error_message.strip().splitlines()[-1], "MemoryError: too big")
+
+
+class BreakpointTests(unittest.TestCase):
+    def test_condition_and_hit_count(self):
+        breakpoint = Breakpoint(1, "i % 2 == 0", hit_count=3)
+        stops = [i for i in range(10) if breakpoint.should_stop(sys._getframe())]
+        self.assertEqual(stops, [4, 6, 8])
+
+    def test_continue_to_breakpoint(self):
+        step_logger = StepLoggerThread(None)
+        step_logger.set_test_file('test_programs/test2.py')
+        step_logger.set_breakpoint(4, "i == 2")
+        step_logger.continue_to_breakpoint()
+        self.addCleanup(stop_run, step_logger)
+        step_logger.start()
+        wait_until(lambda: not step_logger.isRunning() or (
+            not step_logger.free_run and step_logger.step_logger is not None and step_logger.step_logger.ready))
+        self.assertTrue(step_logger.isRunning())
+        self.assertEqual(step_logger.step_logger.last_line, 5)
+        self.assertEqual(step_logger.step_logger.local_vars["i"], 2)
+        step_logger.stop()
+        wait_until(lambda: not step_logger.isRunning())
+
+
+class GranularityTests(unittest.TestCase):
+    @staticmethod
+    def step_lines(trace):
+        return [trace.line_of(step) for step in range(trace.step_count)]
+
+    def test_function(self):
+        trace = record_run('test_programs/test5.py', granularity=FUNCTION)
+        # The program's start, the calls of factorial(4) to factorial(1) and their returns, count_letters, the end
+        self.assertEqual(self.step_lines(trace), [0, 0, 0, 0, 0, 2, 3, 3, 3, 6, 10, 16])
+        self.assertEqual(trace.history.value_at("letters", trace.step_count - 1), "{'b': 1, 'a': 3, 'n': 2}")
+
+    def test_loop(self):
+        trace = record_run('test_programs/test2.py', granularity=LOOP)
+        self.assertEqual(self.step_lines(trace), [0, 1, 1, 1, 1, 7])
+        self.assertEqual([trace.history.value_at("total", step) for step in range(1, 5)], ["3", "4", "5", "6"])
+
+    def test_statement(self):
+        trace = record_run('test_programs/test2.py', granularity=STATEMENT)
+        self.assertEqual(self.step_lines(trace), [0, 7] + [1, 2, 3, 4] * 4 + [1])
+
+    def test_expression(self):
+        trace = record_run('test_programs/test5.py', granularity=EXPRESSION)
+        updates = [event[2] for event in trace.events if event[0] == UPDATE and event[1] in (1, 3)]
+        self.assertIn("    if \u200aFalse\u200a:\n", updates)
+        self.assertIn("    return n * \u200a6\u200a\n", updates)
+        self.assertIn("    return \u200a24\u200a\n", updates)
+
+    def test_expression_methods_run_once(self):
+        text = ("calls = []\n\nclass Money:\n    def __init__(self, cents):\n        self.cents = cents\n\n"
+                "    def __add__(self, other):\n        calls.append(1)\n        return Money(self.cents + other.cents)\n\n"
+                "def pay(a, b):\n    return (a + b).cents * 2\n\nprint(pay(Money(1), Money(2)), len(calls))\n")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "money.py")
+            with open(path, "w") as f:
+                f.write(text)
+            trace = record_run(path, granularity=EXPRESSION)
+        self.assertEqual("".join(event[1] for event in trace.events if event[0] == OUTPUT), "6 1\n")
+
+    def test_limits_between_steps(self):
+        trace = record_run('test_programs/test3.py', limits=RunLimits(max_steps=1000), granularity=LOOP)
+        self.assertRegex(trace.error_message, r"^Stopped: maximum of 1000 steps reached at line [23]$")
+        # The loop has no event at the function granularity, so only the watchdog stops it
+        trace = record_run('test_programs/test3.py', limits=RunLimits(max_wall_time=0.2), granularity=FUNCTION)
+        self.assertRegex(trace.error_message, r"^Stopped: maximum time of 0.2s reached at line [23]$")
+        trace = record_run('test_programs/test5.py', limits=RunLimits(max_steps=3), granularity=FUNCTION)
+        self.assertRegex(trace.error_message, r"^Stopped: maximum of 3 steps reached at line \d+$")
+
+
+class FieldChangeTests(unittest.TestCase):
+    def test_changes_in_place(self):
+        trace = record_run('test_programs/test5.py')
+        self.assertEqual([value for _, value in trace.history.changes("counts['a']")], ["1", "2", "3", None])
+        self.assertEqual(trace.history.changes("counts")[-2][1], "{'b': 1, 'a': 3, 'n': 2}")
+
+
+class SubstitutionTests(unittest.TestCase):
+    def test_inserted_values_are_kept(self):
+        line, replaced = substitute_names('    return label + ": " + str(best)', {"label": "best(Ada)", "best": 18}, {})
+        self.assertEqual(line, '    return \u200a\'best(Ada)\'\u200a + ": " + str(\u200a18\u200a)')
+        self.assertEqual(replaced, 2)
+
+    def test_assignment_targets(self):
+        line, _ = substitute_names("counts[letter] = counts.get(letter, 0) + 1", {"counts": {}, "letter": "b"}, {})
+        self.assertEqual(line, "counts[\u200a'b'\u200a] = \u200a{}\u200a.get(\u200a'b'\u200a, 0) + 1")
+
+
+class ThreadTests(unittest.TestCase):
+    def test_threads(self):
+        trace = record_run('test_programs/test7.py')
+        self.assertEqual(trace.threads, ["MainThread", "worker 0", "worker 1", "worker 2"])
+        self.assertEqual("".join(event[1] for event in trace.events if event[0] == OUTPUT), "[6, 10, 15]\n")
+        cursor = TraceCursor(trace)
+        for n in range(3):
+            name = f"i (worker {n})"
+            self.assertEqual([value for _, value in trace.history.changes(name) if value is not None],
+                             [str(i) for i in range(4 + n)])
+            cursor.seek(trace.history.last_change(name, trace.step_count))
+            self.assertEqual(cursor.thread, f"worker {n}")
+
+    def test_follow_thread(self):
+        step_logger = StepLoggerThread(None)
+        step_logger.set_test_file('test_programs/test7.py')
+        step_logger.followed_thread = "worker 1"
+        self.addCleanup(stop_run, step_logger)
+        step_logger.start()
+        presses = 0
+        deadline = time.monotonic() + TIMEOUT
+        while step_logger.isRunning():
+            self.assertLess(time.monotonic(), deadline, f"Still running after {TIMEOUT}s")
+            if step_logger.step_logger is not None and step_logger.step_logger.ready:
+                step_logger.next_step()
+                presses += 1
+            else:
+                time.sleep(0.001)
+        thread = None
+        steps = 0
+        for event in step_logger.trace.events:
+            if event[0] == THREAD:
+                thread = event[1]
+            elif event[0] == LINE and thread == "worker 1":
+                steps += 1
+        # Only the steps of the followed thread waited for the user
+        self.assertEqual(presses, steps)
+
+    def test_limit_in_thread(self):
+        trace = record_run('test_programs/test7.py', limits=RunLimits(max_steps=150))
+        self.assertRegex(trace.error_message, r"^Stopped: maximum of 150 steps reached at line \d+$")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,63 @@
+import os
+import random
+import tempfile
+import unittest
+
+from sourcefile import SourceFile
+from steplogger import record_run
+from steptrace import Trace, TraceCursor, LINE, VARIABLE, OUTPUT
+
+
+class VariableHistoryTests(unittest.TestCase):
+    def test_changes(self):
+        events = [(VARIABLE, "x", "1"), (LINE, 0), (LINE, 1), (VARIABLE, "x", "2"), (VARIABLE, "x", "3"),
+                  (LINE, 2), (VARIABLE, "x", None), (LINE, 3)]
+        history = Trace("history.py", [], events).history
+        self.assertEqual(history.changes("x"), [(0, "1"), (2, "3"), (3, None)])
+        self.assertEqual([history.value_at("x", step) for step in range(4)], ["1", "1", "3", None])
+        self.assertEqual(history.last_change("x", 1), 0)
+        self.assertIsNone(history.value_at("y", 2))
+
+    def test_matches_replay(self):
+        trace = record_run('test_programs/test2.py')
+        cursor = TraceCursor(trace)
+        for step in range(trace.step_count):
+            cursor.seek(step)
+            values = {name: trace.history.value_at(name, step) for name in trace.history.names()}
+            self.assertEqual({name: value for name, value in values.items() if value is not None}, cursor.variables)
+
+
+class TraceCursorTests(unittest.TestCase):
+    def test_seek_matches_replay(self):
+        events = []
+        for i in range(2000):
+            events += [(VARIABLE, "i", str(i)), (OUTPUT, f"{i}\n")] if i % 7 == 0 else [(VARIABLE, "i", str(i))]
+            events.append((LINE, i % 5))
+        trace = Trace("loop.py", [], events)
+        cursor = TraceCursor(trace)
+        cursor.seek(trace.step_count - 1)
+        rng = random.Random(1)
+        for step in [rng.randrange(trace.step_count) for _ in range(50)]:
+            cursor.seek(step)
+            fresh = TraceCursor(trace)
+            fresh.forward(step + 1)
+            self.assertEqual((cursor.step, cursor.current_line, cursor.variables, cursor.output),
+                             (fresh.step, fresh.current_line, fresh.variables, fresh.output))
+
+
+class SourceTests(unittest.TestCase):
+    def test_lines_decoded_when_read(self):
+        source = SourceFile('test_programs/test6.py')
+        trace = Trace("test6.py", source, [(LINE, 12), (LINE, 13)])
+        self.assertEqual(source._lines.count(None), len(source))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "trace.json")
+            trace.save(path)
+            loaded = Trace.load(path)
+        self.assertEqual(loaded.source, list(source))
+        self.assertEqual(loaded.source, trace.source)
+        self.assertEqual(trace.source, loaded.source)
+
+
+if __name__ == '__main__':
+    unittest.main()
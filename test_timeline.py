@@ -0,0 +1,26 @@
+import random
+import unittest
+
+from steptrace import Trace, LINE
+from timeline import LinePyramid
+
+
+class LinePyramidTests(unittest.TestCase):
+    def test_range(self):
+        rng = random.Random(1)
+        lines = [rng.randrange(100) for _ in range(1000)]
+        trace = Trace("lines.py", [], [(LINE, line) for line in lines[:333]])
+        pyramid = LinePyramid(trace)
+        for line in lines[333:]:
+            trace.line_finished(line)
+        pyramid.extend()
+        self.assertEqual(len(pyramid), len(lines))
+        for _ in range(300):
+            start = rng.randrange(len(lines))
+            end = rng.randrange(start + 1, len(lines) + 1)
+            self.assertEqual(pyramid.range(start, end), (min(lines[start:end]), max(lines[start:end])))
+        self.assertIsNone(pyramid.range(5, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
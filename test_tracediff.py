@@ -0,0 +1,73 @@
+import unittest
+
+from steptrace import Trace, LINE, UPDATE, VARIABLE, OUTPUT
+from tracediff import TraceDiff
+
+
+def make_trace(values, line_offset=0, first_update=None):
+    """A loop assigning each of `values` to x, one step per value, printing every tenth."""
+    events = [] if first_update is None else [(UPDATE, 0, first_update)]
+    for value in values:
+        events.append((UPDATE, 1, f"x = {value}"))
+        events.append((VARIABLE, "x", str(value)))
+        if value % 10 == 0:
+            events.append((OUTPUT, f"{value}\n"))
+        events.append((LINE, 1 + line_offset))
+    return Trace("loop.py", [], events)
+
+
+class TraceDiffTests(unittest.TestCase):
+    def test_identical(self):
+        diff = TraceDiff(make_trace(range(1000)), make_trace(range(1000)))
+        self.assertIsNone(diff.first_divergence())
+        self.assertEqual(diff.step_alignment(), [("equal", 0, 1000, 0, 1000)])
+
+    def test_first_divergence(self):
+        values = list(range(5000))
+        for changed in (0, 1, 2047, 2048, 4999):
+            other = values.copy()
+            other[changed] = -1
+            diff = TraceDiff(make_trace(values), make_trace(other))
+            self.assertEqual(diff.first_divergence(), (changed, changed))
+
+    def test_alignment_after_inserted_steps(self):
+        values = list(range(3000))
+        other = values[:1000] + [-1, -2, -3] + values[1000:]
+        diff = TraceDiff(make_trace(values), make_trace(other))
+        self.assertEqual(diff.first_divergence(), (1000, 1000))
+        self.assertEqual(diff.step_alignment()[0], ("equal", 0, 1000, 0, 1000))
+        self.assertEqual(diff.step_alignment()[-1][0], "equal")
+        self.assertEqual(diff.step_alignment()[-1][2], 3000)
+        self.assertEqual(diff.step_alignment()[-1][4], 3003)
+        self.assertEqual(diff.aligned_step(2000), 2003)
+
+    def test_shorter_run(self):
+        diff = TraceDiff(make_trace(range(100)), make_trace(range(60)))
+        self.assertEqual(diff.first_divergence(), (60, 59))
+
+    def test_ignore_lines(self):
+        a, b = make_trace(range(100)), make_trace(range(100), line_offset=5)
+        self.assertEqual(TraceDiff(a, b).first_divergence(), (0, 0))
+        self.assertIsNone(TraceDiff(a, b, compare_lines=False).first_divergence())
+
+    def test_strings_in_another_order(self):
+        # The rewritten line is not compared, but shifts the IDs of every string of b
+        diff = TraceDiff(make_trace(range(100)), make_trace(range(100), first_update="# setup"))
+        self.assertIsNone(diff.first_divergence())
+        other = list(range(100))
+        other[70] = -1
+        diff = TraceDiff(make_trace(range(100)), make_trace(other, first_update="# setup"))
+        self.assertEqual(diff.first_divergence(), (70, 70))
+
+    def test_equal_hashes_are_confirmed(self):
+        values = list(range(100))
+        other = values.copy()
+        other[40] = -1
+        diff = TraceDiff(make_trace(values), make_trace(other))
+        # As if every event of b had the hash of the event of a at the same place
+        diff.b.keys = list(diff.a.keys)
+        self.assertEqual(diff.first_divergence(), (40, 40))
+
+
+if __name__ == '__main__':
+    unittest.main()
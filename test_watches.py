@@ -0,0 +1,122 @@
+import threading
+import time
+import types
+import unittest
+
+from steplogger import StepLogger, StepLoggerThread, LINE, LOOP
+from test_steplogger import TIMEOUT, stop_run
+from watches import Watch, WatchEvaluator, WatchTimeout, format_value, value_text
+
+
+def frame_with(**f_locals):
+    return types.SimpleNamespace(f_locals=f_locals, f_globals={})
+
+
+def evaluator_threads():
+    return {thread for thread in threading.enumerate() if thread.name == "watch-evaluator"}
+
+
+class WatchTests(unittest.TestCase):
+    def test_syntax_error(self):
+        with self.assertRaises(SyntaxError):
+            Watch("len(nums")
+        with self.assertRaises(SyntaxError):
+            Watch("total = 0")
+
+    def test_exception_formatting(self):
+        value = WatchEvaluator().evaluate(Watch("total / count"), frame_with(total=1, count=0))
+        self.assertIsInstance(value, ZeroDivisionError)
+        self.assertEqual(format_value(value), "ZeroDivisionError: division by zero")
+        self.assertEqual(format_value("x" * 300, limit=10), "'xxxxxxxx…")
+
+    def test_large_values_are_cut(self):
+        self.assertEqual(format_value(list(range(10 ** 6)), limit=20), "[0, 1, 2, 3, 4, 5, …")
+        self.assertEqual(value_text({"a": [1, (2,)], "b": {3}}), "{'a': [1, (2,)], 'b': {3}}")
+        self.assertEqual(value_text("x" * 10 ** 6, limit=5), "xxxx…")
+        nested = [1]
+        nested.append(nested)
+        self.assertEqual(value_text(nested), "[1, [...]]")
+
+
+class EvaluatorTests(unittest.TestCase):
+    def test_timeout_stops_the_evaluation(self):
+        evaluator = WatchEvaluator(timeout=0.05)
+        with self.assertRaises(WatchTimeout):
+            evaluator.evaluate(Watch("slow()"), frame_with(slow=lambda: time.sleep(0.2) or [0 for _ in range(10 ** 9)]))
+        threads = evaluator_threads()
+        deadline = time.monotonic() + 5
+        while evaluator.busy and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(evaluator.busy)
+        self.assertEqual(evaluator.evaluate(Watch("a + 1"), frame_with(a=1)), 2)
+        # The same helper thread is used again
+        self.assertEqual(evaluator_threads(), threads)
+
+    def test_busy_after_a_timeout(self):
+        evaluator = WatchEvaluator(timeout=0.01)
+        with self.assertRaises(WatchTimeout):
+            evaluator.evaluate(Watch("slow()"), frame_with(slow=lambda: time.sleep(0.2)))
+        with self.assertRaisesRegex(WatchTimeout, "still running"):
+            evaluator.evaluate(Watch("a"), frame_with(a=1))
+
+
+class UpdateTests(unittest.TestCase):
+    def setUp(self):
+        self.thread = StepLoggerThread(None)
+        self.thread.set_test_file('test_programs/test1.py')
+        self.updates = []
+        self.thread.emit_watch_updated = lambda watch_id, value: self.updates.append(value)
+
+    def test_evaluated_only_when_changed(self):
+        self.thread.add_watch("len(nums)")
+        logger = StepLogger(self.thread, None)
+        nums = [1, 2]
+        logger.update_watches(frame_with(nums=nums, other=1))
+        logger.update_watches(frame_with(nums=nums, other=2))
+        nums.append(3)
+        logger.update_watches(frame_with(nums=nums, other=2))
+        self.assertEqual(self.updates, ["2", "3"])
+
+    def test_impure_expression(self):
+        self.thread.add_watch("nums.pop()")
+        logger = StepLogger(self.thread, None)
+        nums = [1, 2]
+        logger.update_watches(frame_with(nums=nums))
+        self.assertEqual(nums, [1, 2])
+        self.assertEqual(self.updates, ["<not evaluated, it could change the program>"])
+
+
+class RunTests(unittest.TestCase):
+    def step_through(self, granularity):
+        """Steps through test2 with a watch, like the user pressing Next Step, and returns the watch's values."""
+        step_logger = StepLoggerThread(None)
+        step_logger.set_test_file('test_programs/test2.py')
+        step_logger.granularity = granularity
+        step_logger.add_watch("total * 2")
+        updates = []
+        step_logger.emit_watch_updated = lambda watch_id, value: updates.append(value)
+        self.addCleanup(stop_run, step_logger)
+        step_logger.start()
+        deadline = time.monotonic() + TIMEOUT
+        while step_logger.isRunning():
+            self.assertLess(time.monotonic(), deadline, f"Still running after {TIMEOUT}s")
+            if step_logger.step_logger is not None and step_logger.step_logger.ready:
+                step_logger.next_step()
+            else:
+                time.sleep(0.001)
+        # The helper thread evaluating the watches is not a thread of the program
+        self.assertEqual(step_logger.trace.threads, ["MainThread"])
+        return updates
+
+    def test_watch_in_a_run(self):
+        updates = self.step_through(LINE)
+        self.assertEqual(updates[0], "NameError: name 'total' is not defined")
+        self.assertEqual(updates[1:], ["6", "8", "10", "12"])
+
+    def test_watch_at_the_loop_granularity(self):
+        # The last step is back in the module, where total is not defined
+        self.assertEqual(self.step_through(LOOP)[1:-1], ["6", "8", "10", "12"])
+
+
+if __name__ == '__main__':
+    unittest.main()
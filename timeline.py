@@ -0,0 +1,164 @@
+# This Python file uses the following encoding: utf-8
+from array import array
+from bisect import bisect_left
+
+from PySide6 import QtGui, QtCore
+from PySide6.QtCore import Qt
+from PySide6.QtWidgets import QApplication, QWidget
+
+TIMELINE_HEIGHT = 36
+
+
+class LinePyramid:
+    """The line of every step of a trace, with its minimum and maximum over every power of two of steps.
+
+    Level k holds one entry per aligned block of 2^k steps, so the range of lines of any span of
+    steps is read from at most two entries per level, whatever the length of the run. Levels are
+    extended as the trace grows.
+    """
+
+    def __init__(self, trace):
+        self.trace = trace
+        lines = array('i')
+        self.mins = [lines]
+        self.maxs = [lines]
+        self.extend()
+
+    def __len__(self):
+        return len(self.mins[0])
+
+    def extend(self):
+        """Adds the steps recorded since the last call."""
+        lines = self.mins[0]
+        step_ends = self.trace.step_ends
+        lines.extend(map(self.trace.events.first.__getitem__, step_ends[len(lines):len(step_ends)]))
+        level = 0
+        while len(self.mins[level]) >= 2:
+            mins, maxs = self.mins[level], self.maxs[level]
+            if level + 1 == len(self.mins):
+                self.mins.append(array('i'))
+                self.maxs.append(array('i'))
+            next_mins, next_maxs = self.mins[level + 1], self.maxs[level + 1]
+            start, end = 2 * len(next_mins), len(mins) - len(mins) % 2
+            next_mins.extend(map(min, mins[start:end:2], mins[start + 1:end:2]))
+            next_maxs.extend(map(max, maxs[start:end:2], maxs[start + 1:end:2]))
+            level += 1
+
+    def range(self, start, end):
+        """(min, max) of the lines of steps start to end - 1, or None for no steps."""
+        low, high = None, None
+        level = 0
+        while start < end:
+            mins, maxs = self.mins[level], self.maxs[level]
+            if start & 1:
+                low = mins[start] if low is None else min(low, mins[start])
+                high = maxs[start] if high is None else max(high, maxs[start])
+                start += 1
+            if end & 1:
+                end -= 1
+                low = mins[end] if low is None else min(low, mins[end])
+                high = maxs[end] if high is None else max(high, maxs[end])
+            start >>= 1
+            end >>= 1
+            level += 1
+        return None if low is None else (low, high)
+
+
+class TimelineScrubber(QWidget):
+    """The whole run as a strip of the lines it ran over time, with the current step marked.
+
+    Each pixel column shows the range of lines of its steps, read from a LinePyramid, so drawing
+    the strip does not depend on the length of the run. Changes of the marked variable are drawn
+    as ticks. Clicking or dragging selects a step.
+    """
+    stepSelected = QtCore.Signal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setFixedHeight(TIMELINE_HEIGHT)
+        self.pyramid = None
+        self.line_count = 1
+        self.step = -1
+        self.marked_variable = None
+        # The strip is drawn again only when the run grew or the widget was resized
+        self.strip = None
+        self.strip_key = None
+        palette = QApplication.palette()
+        self.lineColor = palette.color(QtGui.QPalette.Active, QtGui.QPalette.Text)
+        self.lineColor.setAlpha(160)
+        self.stepColor = palette.color(QtGui.QPalette.Active, QtGui.QPalette.Highlight)
+        self.changeColor = QtGui.QColor(255, 80, 0)
+        self.setToolTip("Drag to go to any step of the run")
+
+    def set_trace(self, trace):
+        self.pyramid = LinePyramid(trace) if trace is not None else None
+        self.line_count = max(len(trace.source), 1) if trace is not None else 1
+        self.step = -1
+        self.strip = None
+        self.update()
+
+    def extend(self):
+        """Catches up with the steps recorded since the last call."""
+        if self.pyramid is not None:
+            self.pyramid.extend()
+            self.update()
+
+    def set_step(self, step):
+        self.step = step
+        self.update()
+
+    def set_marked_variable(self, name):
+        self.marked_variable = name
+        self.strip = None
+        self.update()
+
+    def step_at(self, x):
+        steps = len(self.pyramid)
+        return max(0, min(int(x * steps / max(self.width(), 1)), steps - 1))
+
+    def mousePressEvent(self, event):
+        if self.pyramid is not None and len(self.pyramid) and self.isEnabled():
+            self.stepSelected.emit(self.step_at(event.position().x()))
+
+    def mouseMoveEvent(self, event):
+        if event.buttons() & Qt.LeftButton:
+            self.mousePressEvent(event)
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), QApplication.palette().color(QtGui.QPalette.Active, QtGui.QPalette.Base))
+        if self.pyramid is None or not len(self.pyramid):
+            return
+        steps = len(self.pyramid)
+        key = (self.width(), self.height(), steps)
+        if self.strip is None or self.strip_key != key:
+            self.strip = self.draw_strip()
+            self.strip_key = key
+        painter.drawPixmap(0, 0, self.strip)
+        if self.step >= 0:
+            x = int((self.step + 0.5) * self.width() / steps)
+            painter.fillRect(x - 1, 0, 3, self.height(), self.stepColor)
+
+    def draw_strip(self):
+        width, height, steps = self.width(), self.height(), len(self.pyramid)
+        strip = QtGui.QPixmap(width, height)
+        strip.fill(Qt.transparent)
+        painter = QtGui.QPainter(strip)
+        scale = (height - 2) / self.line_count
+        changes = None
+        if self.marked_variable is not None:
+            changes = self.pyramid.trace.history.steps.get(self.marked_variable)
+        # One column per pixel, or per step when there are fewer steps than pixels
+        columns = min(width, steps)
+        for column in range(columns):
+            start, end = column * steps // columns, (column + 1) * steps // columns
+            x0, x1 = column * width // columns, (column + 1) * width // columns
+            low, high = self.pyramid.range(start, end)
+            top, bottom = 1 + int(low * scale), 1 + int((high + 1) * scale)
+            painter.fillRect(x0, top, x1 - x0, max(bottom - top, 1), self.lineColor)
+            if changes is not None:
+                index = bisect_left(changes, start)
+                if index < len(changes) and changes[index] < end:
+                    painter.fillRect(x0, height - 4, x1 - x0, 4, self.changeColor)
+        painter.end()
+        return strip
@@ -0,0 +1,355 @@
+# This Python file uses the following encoding: utf-8
+import argparse
+import sys
+import operator
+from array import array
+from bisect import bisect_left
+from itertools import compress, count, islice, repeat
+
+from steptrace import Trace, LINE, VARIABLE, OUTPUT, GO_TO, INPUT
+
+# Length of the event windows used as anchors to re-align two streams after they diverged.
+# Windows starting at about one in ANCHOR_SAMPLE events, chosen by their content, are anchors.
+ANCHOR_WINDOW = 8
+ANCHOR_SAMPLE = 8
+
+# Stands in for every step boundary when line numbers are not compared
+_STEP = (LINE,)
+# The table of the second column of the events where it is always 0
+_ZEROS = (0,)
+
+
+class StepStream:
+    """The compared events of one trace, each reduced to an integer key.
+
+    UPDATE events only repeat the variables in the text of a line, so they are never compared.
+    Without `compare_lines`, line numbers are ignored, to compare runs of two different scripts.
+    The keys are built from the columns of the trace's EventLog, with the string IDs of `reference`,
+    the EventLog of the other trace, so that equal events of both traces have equal keys.
+    """
+
+    def __init__(self, trace, compare_lines=True, reference=None):
+        self.trace = trace
+        self.compare_lines = compare_lines
+        events = trace.events
+        kinds = {LINE, GO_TO, VARIABLE, OUTPUT, INPUT} if compare_lines else {LINE, VARIABLE, OUTPUT, INPUT}
+        compared = bytes(map(kinds.__contains__, events.kinds))
+        # Positions of the compared events in the trace, read back from its columns to describe them
+        self.indices = list(compress(range(len(events)), compared))
+        self.kinds = bytes(compress(events.kinds, compared))
+        firsts = array('i', compress(events.first, compared))
+        seconds = array('i', compress(events.second, compared))
+        string_ids = None if reference is None or reference is events else _string_ids(events, reference)
+        if string_ids is not None or not compare_lines:
+            # Tables by kind from the columns to what is compared: the same line numbers, or 0 for every
+            # step without compare_lines, and the string IDs of `reference`; -1 stays -1 in both
+            lines = [*range(max(firsts, default=0) + 1), -1]
+            ids = string_ids or lines
+            first_tables = {LINE: lines if compare_lines else [0] * len(lines), GO_TO: lines,
+                            VARIABLE: ids, OUTPUT: ids, INPUT: ids}
+            firsts = array('i', map(operator.getitem, map(first_tables.__getitem__, self.kinds), firsts))
+            if string_ids is not None:
+                second_tables = {LINE: _ZEROS, GO_TO: _ZEROS, VARIABLE: ids, OUTPUT: _ZEROS, INPUT: _ZEROS}
+                seconds = array('i', map(operator.getitem, map(second_tables.__getitem__, self.kinds), seconds))
+        self.firsts, self.seconds = firsts, seconds
+        # Hashes of the events; equal keys are only taken as equal events once their columns are compared
+        self.keys = list(map(hash, zip(self.kinds, firsts, seconds)))
+        self._step_ends = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def event(self, index):
+        """The compared event at `index`."""
+        if not self.compare_lines and self.kinds[index] == LINE:
+            return _STEP
+        return self.trace.events[self.indices[index]]
+
+    @property
+    def step_ends(self):
+        """Index of the LINE event ending each step."""
+        if self._step_ends is None:
+            self._step_ends = _line_indices(self.kinds)
+        return self._step_ends
+
+    def line_of(self, step):
+        """The 0-based line a step stopped at in the traced script."""
+        return self.trace.line_of(step)
+
+    def step_of(self, index):
+        """The step an event belongs to: the first one ending at or after it."""
+        if self._step_ends is None:
+            # Counting the steps before the event is cheaper than finding the end of every step
+            step = self.kinds.count(LINE, 0, index)
+            if step and index >= len(self.kinds):
+                step -= 1
+            return step
+        return min(bisect_left(self.step_ends, index), max(len(self.step_ends) - 1, 0))
+
+    def event_of(self, step):
+        """The index of the first event of a step."""
+        return self.step_ends[step - 1] + 1 if step > 0 else 0
+
+
+class TraceDiff:
+    """Compares the recorded step streams of two runs, for example a submission against a reference.
+
+    The first divergence is found by binary search over ever smaller halves of the remaining
+    prefix, so identical stretches of keys are compared at the speed of C.
+    The rest is aligned around windows of events with equal hashes, and each equal stretch is
+    measured by galloping and binary search the same way. Both stay linear in the length of the
+    traces instead of the O(n·m) of a full diff.
+    """
+
+    def __init__(self, a: Trace, b: Trace, compare_lines=True):
+        self.a = StepStream(a, compare_lines)
+        self.b = StepStream(b, compare_lines, reference=a.events)
+        self._divergence = None
+        self._alignment = None
+
+    def first_divergent_event(self):
+        """Index of the first event that differs between the two streams, or None if they are equal."""
+        if self._divergence is None:
+            self._divergence = self._common_length(0, 0)
+        if self._divergence == len(self.a) == len(self.b):
+            return None
+        return self._divergence
+
+    def first_divergence(self) -> tuple[int, int] | None:
+        """The steps of both traces at which they first differ, or None if they are equal."""
+        index = self.first_divergent_event()
+        if index is None:
+            return None
+        return self.a.step_of(index), self.b.step_of(index)
+
+    def alignment(self) -> list[tuple[str, int, int, int, int]]:
+        """Aligned stretches of events as (tag, a_start, a_end, b_start, b_end), tag being "equal" or "differ"."""
+        if self._alignment is not None:
+            return self._alignment
+        start = self.first_divergent_event()
+        if start is None:
+            self._alignment = [("equal", 0, len(self.a), 0, len(self.b))] if len(self.a) else []
+            return self._alignment
+        segments = [("equal", 0, start, 0, start)] if start else []
+        anchors_a = self._anchors(self.a, start)
+        anchors_b = {}
+        for position in self._anchors(self.b, start):
+            anchors_b.setdefault(_window_hash(self.b.keys, position), []).append(position)
+
+        i = j = start
+        anchor_index = 0
+        while True:
+            # The next window of a, past i, that also occurs in b past j
+            match = None
+            while anchor_index < len(anchors_a) and match is None:
+                position = anchors_a[anchor_index]
+                anchor_index += 1
+                if position < i:
+                    continue
+                candidates = anchors_b.get(_window_hash(self.a.keys, position), ())
+                k = bisect_left(candidates, j)
+                while k < len(candidates):
+                    candidate = candidates[k]
+                    if self._equal(position, candidate, ANCHOR_WINDOW):
+                        match = position, candidate
+                        break
+                    k += 1
+            if match is None:
+                break
+            i2, j2 = match
+            # The anchor may be past the start of the equal stretch
+            while i2 > i and j2 > j and self._equal(i2 - 1, j2 - 1, 1):
+                i2 -= 1
+                j2 -= 1
+            length = self._common_length(i2, j2)
+            if i2 > i or j2 > j:
+                segments.append(("differ", i, i2, j, j2))
+            segments.append(("equal", i2, i2 + length, j2, j2 + length))
+            i, j = i2 + length, j2 + length
+        if i < len(self.a) or j < len(self.b):
+            segments.append(("differ", i, len(self.a), j, len(self.b)))
+        self._alignment = segments
+        return segments
+
+    def step_alignment(self) -> list[tuple[str, int, int, int, int]]:
+        """alignment() in steps instead of events. A step with any differing event differs on both sides."""
+        a_ends, b_ends = self.a.step_ends, self.b.step_ends
+        segments = []
+        a_done = b_done = 0
+        for tag, a_start, a_end, b_start, b_end in self.alignment():
+            if tag != "equal":
+                continue
+            # An equal stretch ends as many steps on both sides
+            a_first, b_first = bisect_left(a_ends, a_start), bisect_left(b_ends, b_start)
+            count = bisect_left(a_ends, a_end) - a_first
+            if count and not (_starts_step(a_ends, a_first, a_start) and _starts_step(b_ends, b_first, b_start)):
+                # The first of them began with differing events
+                a_first, b_first, count = a_first + 1, b_first + 1, count - 1
+            if a_first > a_done or b_first > b_done:
+                segments.append(("differ", a_done, a_first, b_done, b_first))
+            if count:
+                segments.append(("equal", a_first, a_first + count, b_first, b_first + count))
+            a_done, b_done = a_first + count, b_first + count
+        if a_done < len(a_ends) or b_done < len(b_ends):
+            segments.append(("differ", a_done, len(a_ends), b_done, len(b_ends)))
+        return segments
+
+    def aligned_step(self, step_a):
+        """The step of b aligned with a step of a."""
+        for tag, a_start, a_end, b_start, b_end in self.step_alignment():
+            if a_start <= step_a < a_end:
+                if tag == "equal":
+                    return b_start + step_a - a_start
+                return min(b_start + step_a - a_start, max(b_end - 1, b_start))
+        return max(len(self.b.step_ends) - 1, 0)
+
+    @staticmethod
+    def _anchors(stream, start):
+        """Positions of the windows kept as anchors, chosen by content so both streams keep the same ones."""
+        end = max(start, len(stream) - ANCHOR_WINDOW + 1)
+        keys = islice(stream.keys, start, end)
+        return list(compress(range(start, end), map(operator.not_, map(operator.mod, keys, repeat(ANCHOR_SAMPLE)))))
+
+    def _common_length(self, i, j):
+        """Length of the longest equal stretch starting at event i of a and event j of b.
+
+        Gallops to an upper bound, then binary searches it, only ever comparing the part of both
+        streams not yet known to be equal.
+        """
+        limit = min(len(self.a) - i, len(self.b) - j)
+        # Invariant: the events a[i:i + low] and b[j:j + low] are equal
+        low, step = 0, 1
+        while low < limit:
+            high = min(low + step, limit)
+            if not self._equal(i + low, j + low, high - low):
+                break
+            low = high
+            step *= 2
+        else:
+            return low
+        high = min(low + step, limit)
+        while high - low > 1:
+            middle = (low + high) // 2
+            if self._equal(i + low, j + low, middle - low):
+                low = middle
+            else:
+                high = middle
+        if high - low == 1 and self._equal(i + low, j + low, 1):
+            low = high
+        return low
+
+    def _equal(self, i, j, count):
+        """Whether `count` events of a from i are equal to those of b from j.
+
+        The keys are compared first, as most stretches that differ have different hashes, and then the
+        columns they were hashed from, so that two events with the same hash are not taken as equal.
+        """
+        a, b = self.a, self.b
+        return (a.keys[i:i + count] == b.keys[j:j + count] and a.kinds[i:i + count] == b.kinds[j:j + count]
+                and a.firsts[i:i + count] == b.firsts[j:j + count]
+                and a.seconds[i:i + count] == b.seconds[j:j + count])
+
+
+def _starts_step(step_ends, step, index):
+    return index == 0 or (step > 0 and step_ends[step - 1] == index - 1)
+
+
+def _line_indices(kinds):
+    return list(compress(range(len(kinds)), map(LINE.__eq__, kinds)))
+
+
+def _string_ids(events, reference):
+    """The ID of each string of an EventLog in `reference`, past the IDs of `reference` for the others.
+
+    The ID -1, for a variable out of scope, stays -1. Runs that agree add the same strings in the same
+    order, so only the strings after the first one that differs are looked up, and None is returned
+    if every string has the same ID in both.
+    """
+    strings = events.strings
+    common = next(compress(count(), map(operator.ne, strings, reference.strings)),
+                  min(len(strings), len(reference.strings)))
+    if common == len(strings):
+        return None
+    ids = reference.string_ids
+    if ids is None:
+        ids = {string: i for i, string in enumerate(reference.strings)}
+    string_ids = [*range(common), *map(ids.get, islice(strings, common, None))]
+    new_id = len(reference.strings)
+    for i in compress(range(common, len(string_ids)), map(operator.is_, islice(string_ids, common, None),
+                                                          repeat(None))):
+        string_ids[i] = new_id
+        new_id += 1
+    string_ids.append(-1)
+    return string_ids
+
+
+def _window_hash(keys, position):
+    return hash(tuple(keys[position:position + ANCHOR_WINDOW]))
+
+
+def describe_step(stream, step):
+    """The line and the compared events of a step, for printing."""
+    if not stream.step_ends:
+        return "no steps"
+    parts = []
+    for event in map(stream.event, range(stream.event_of(step), stream.step_ends[step] + 1)):
+        if event[0] == VARIABLE:
+            parts.append(f"{event[1]} = {event[2]}" if event[2] is not None else f"{event[1]} out of scope")
+        elif event[0] == OUTPUT and event[1].strip():
+            parts.append(f"prints {event[1]!r}")
+        elif event[0] == INPUT:
+            parts.append(f"reads {event[1]!r}")
+    return f"step {step + 1} at line {stream.line_of(step) + 1}: {', '.join(parts) or 'no changes'}"
+
+
+def load_trace(path, inputs=(), limits=None):
+    """A trace saved as .json, or the recording of a run of a .py script."""
+    if path.endswith(".json"):
+        return Trace.load(path)
+    from steplogger import record_run
+    return record_run(path, inputs, limits)
+
+
+def print_diff(diff):
+    divergence = diff.first_divergence()
+    if divergence is None:
+        print(f"The runs are identical ({len(diff.a.step_ends)} steps)")
+        return
+    step_a, step_b = divergence
+    print(f"First divergence after {step_a} equal steps:")
+    print(f"  a: {describe_step(diff.a, step_a)}")
+    print(f"  b: {describe_step(diff.b, step_b)}")
+    print("Alignment:")
+    for tag, a_start, a_end, b_start, b_end in diff.step_alignment()[:50]:
+        print(f"  {tag:6} a steps {a_start + 1}-{a_end}, b steps {b_start + 1}-{b_end}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find where two runs of Python scripts first diverge")
+    parser.add_argument('a', help="Reference: a Python script or a trace (.json) saved from a run")
+    parser.add_argument('b', help="Script or trace to compare with the reference")
+    parser.add_argument('-i', '--input', action='store', help="Answers for input() of both scripts, one per line")
+    parser.add_argument('--ignore-lines', action='store_true',
+                        help="Only compare variables and output, for two different scripts")
+    parser.add_argument('--gui', action='store_true', help="Show both runs side by side at the divergence")
+    args = parser.parse_args()
+
+    inputs = []
+    if args.input:
+        with open(args.input) as f:
+            inputs = [line.rstrip("\r\n") for line in f]
+    trace_a = load_trace(args.a, inputs)
+    trace_b = load_trace(args.b, inputs)
+    for name, trace in (("a", trace_a), ("b", trace_b)):
+        if trace.error_message:
+            print(f"{name} ended with an error: {trace.error_message.strip().splitlines()[-1]}", file=sys.stderr)
+    trace_diff = TraceDiff(trace_a, trace_b, compare_lines=not args.ignore_lines)
+    if args.gui:
+        from PySide6.QtWidgets import QApplication
+        from diffwindow import DiffWindow
+
+        app = QApplication(sys.argv)
+        window = DiffWindow(trace_diff)
+        window.show()
+        sys.exit(app.exec())
+    print_diff(trace_diff)
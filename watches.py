@@ -0,0 +1,194 @@
+import ast
+import itertools
+import queue
+import sys
+import threading
+import types
+
+MISSING = object()
+# The longest value shown as text, in characters
+TEXT_LIMIT = 200
+# Containers up to this size are fingerprinted by the identity of every element
+FINGERPRINT_ELEMENTS = 256
+
+_watch_ids = itertools.count(1)
+
+
+def code_names(code):
+    """Every name an expression's code object (including nested comprehensions) may look up."""
+    names = set(code.co_names) | set(code.co_varnames) | set(code.co_freevars)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= code_names(const)
+    return names
+
+
+def fingerprint(value):
+    """A cheap value that changes when `value` is rebound or, for containers and instances, mutated."""
+    if isinstance(value, (list, tuple, set, frozenset)):
+        if len(value) <= FINGERPRINT_ELEMENTS:
+            return id(value), tuple(map(id, value))
+        return id(value), len(value)
+    if isinstance(value, dict):
+        if len(value) <= FINGERPRINT_ELEMENTS:
+            return id(value), tuple(map(id, value.items()))
+        return id(value), len(value)
+    attributes = getattr(value, "__dict__", None)
+    if isinstance(attributes, dict) and len(attributes) <= FINGERPRINT_ELEMENTS:
+        return id(value), tuple(map(id, attributes.values()))
+    return id(value)
+
+
+class Watch:
+    """A watch expression, compiled once. Raises SyntaxError for invalid expressions."""
+
+    def __init__(self, expression):
+        self.watch_id = next(_watch_ids)
+        self.expression = expression
+        self.tree = ast.parse(expression, "<watch>", "eval")
+        self.code = compile(self.tree, "<watch>", "eval")
+        self.names = sorted(code_names(self.code))
+        # Set by the GUI; hidden watches are not evaluated
+        self.visible = True
+        self.fingerprint = None
+        self.timed_out = False
+
+    def fingerprint_in(self, frame):
+        f_locals = frame.f_locals
+        f_globals = frame.f_globals
+        result = []
+        for name in self.names:
+            value = f_locals.get(name, MISSING)
+            if value is MISSING:
+                value = f_globals.get(name, MISSING)
+            result.append(MISSING if value is MISSING else fingerprint(value))
+        return tuple(result)
+
+
+class WatchTimeout(Exception):
+    pass
+
+
+class WatchEvaluator:
+    """Evaluates watch expressions on a helper thread so that a slow one can be abandoned.
+
+    When an evaluation takes longer than `timeout` seconds it is cancelled: the helper thread raises
+    WatchTimeout at the next Python call or line it runs. Code running in C, like sum() of a long list,
+    cannot be interrupted and finishes first; until it has, the evaluator is busy and evaluate() raises
+    WatchTimeout rather than starting another thread.
+    """
+
+    def __init__(self, timeout=0.05):
+        self.timeout = timeout
+        self.requests = queue.SimpleQueue()
+        self.thread = None
+        self.cancelled = threading.Event()
+        self.idle = threading.Event()
+        self.idle.set()
+
+    @property
+    def busy(self):
+        return not self.idle.is_set()
+
+    def start(self):
+        """Starts the helper thread, if it is not running yet.
+
+        A run calls it before it traces the threads it starts, so the helper is not traced like a thread of
+        the program; evaluate() starts it otherwise.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._work, daemon=True, name="watch-evaluator")
+            self.thread.start()
+
+    def _trace(self, frame, event, arg):
+        if self.cancelled.is_set():
+            raise WatchTimeout("cancelled")
+        return self._trace
+
+    def _work(self):
+        while True:
+            code, f_globals, f_locals, result = self.requests.get()
+            sys.settrace(self._trace)
+            try:
+                result.append(eval(code, f_globals, f_locals))
+            except Exception as e:
+                result.append(e)
+            finally:
+                sys.settrace(None)
+            self.idle.set()
+
+    def evaluate(self, watch, frame):
+        """Returns the value of the watch in `frame`, or the exception it raised."""
+        if self.busy:
+            raise WatchTimeout(f"{watch.expression} was not evaluated, an earlier watch is still running")
+        self.start()
+        result = []
+        self.cancelled.clear()
+        self.idle.clear()
+        self.requests.put((watch.code, frame.f_globals, frame.f_locals, result))
+        if not self.idle.wait(self.timeout):
+            self.cancelled.set()
+            raise WatchTimeout(f"{watch.expression} took longer than {self.timeout * 1000:g} ms")
+        return result[0]
+
+
+def format_value(value, limit=TEXT_LIMIT):
+    if isinstance(value, Exception):
+        text = f"{type(value).__name__}: {value}"
+    else:
+        text = bounded_repr(value, limit)
+    if len(text) > limit:
+        text = text[:limit - 1] + "…"
+    return text
+
+
+def value_text(value, limit=TEXT_LIMIT):
+    """str(value) cut to `limit` characters, like format_value cuts the repr."""
+    if type(value) is str:
+        text = value
+    elif type(value) in _BRACKETS:
+        text = bounded_repr(value, limit)
+    else:
+        text = str(value)
+    if len(text) > limit:
+        text = text[:limit - 1] + "…"
+    return text
+
+
+# The brackets of the containers bounded_repr formats itself
+_BRACKETS = {list: ("[", "]"), tuple: ("(", ")"), set: ("{", "}"), frozenset: ("frozenset({", "})"), dict: ("{", "}")}
+
+
+def bounded_repr(value, limit, _containing=()):
+    """repr(value), or a prefix of it longer than `limit` characters.
+
+    Strings and the builtin containers are only formatted up to the limit, so that showing a list of
+    a million numbers costs no more than showing a short one.
+    """
+    kind = type(value)
+    if kind is str or kind is bytes:
+        return repr(value[:limit + 1])
+    brackets = _BRACKETS.get(kind)
+    if brackets is None or not value:
+        return repr(value)
+    opening, closing = brackets
+    if id(value) in _containing:
+        # Like repr, for a list or dict that contains itself
+        return opening + "..." + closing
+    _containing = (*_containing, id(value))
+    parts = []
+    length = len(opening)
+    for element in value:
+        if length > limit:
+            # The rest is cut anyway
+            return opening + "".join(part + ", " for part in parts)
+        if kind is dict:
+            key = bounded_repr(element, limit - length, _containing)
+            part = f"{key}: {bounded_repr(value[element], limit - length - len(key) - 2, _containing)}"
+        else:
+            part = bounded_repr(element, limit - length, _containing)
+        parts.append(part)
+        length += len(part) + 2
+    if kind is tuple and len(parts) == 1:
+        return f"({parts[0]},)"
+    return opening + ", ".join(parts) + closing